@@ -0,0 +1,394 @@
+import bisect
+import json
+import logging
+import re
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+import coins
+import cronjob
+import prices
+
+logger = logging.getLogger()
+
+MAX_ALERTS_PER_OWNER = 20
+# seconds between two price ticks
+POLL_INTERVAL = 60
+
+
+class MaxAlertsReachedError(Exception):
+    """Custom exception for when an owner reaches the maximum alert limit."""
+
+    pass
+
+
+@dataclass
+class Alert:
+    uuid: str
+    chat_id: int
+    owner: int
+    coin: str
+    op: str
+    threshold: float
+
+    def describe(self) -> str:
+        return f"{self.coin} {self.op} {self.threshold:g}"
+
+
+class AlertStorage(ABC):
+    """Abstract base class for alert storage backends."""
+
+    @abstractmethod
+    def init_db(self):
+        """Initialize the storage backend."""
+        pass
+
+    @abstractmethod
+    def add_alert(self, alert: Alert) -> None:
+        """Add a new alert to storage."""
+        pass
+
+    @abstractmethod
+    def del_alert(self, alert_uuid: str, owner: int | None = None) -> bool:
+        """Delete an alert, of `owner` only when given."""
+        pass
+
+    @abstractmethod
+    def list_alerts(self, owner: int | None = None) -> list[Alert]:
+        """List the alerts of an owner, or all alerts."""
+        pass
+
+
+class SQLAlertStorage(AlertStorage):
+    """SQLite storage implementation, next to the cron jobs table."""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS alerts (
+                uuid TEXT PRIMARY KEY,
+                chat_id INTEGER,
+                owner INTEGER,
+                coin TEXT,
+                op TEXT,
+                threshold REAL
+            )
+            """)
+
+    def add_alert(self, alert: Alert) -> None:
+        """Add a new alert to SQL storage."""
+        with sqlite3.connect(self.db_file) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COUNT(*) FROM alerts WHERE owner = ?", (alert.owner,)
+            )
+            if cursor.fetchone()[0] >= MAX_ALERTS_PER_OWNER:
+                raise MaxAlertsReachedError(
+                    f"Owner {alert.owner} has reached the maximum limit of {MAX_ALERTS_PER_OWNER} alerts."
+                )
+            cursor.execute(
+                "INSERT INTO alerts (uuid, chat_id, owner, coin, op, threshold) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    alert.uuid,
+                    alert.chat_id,
+                    alert.owner,
+                    alert.coin,
+                    alert.op,
+                    alert.threshold,
+                ),
+            )
+
+    def del_alert(self, alert_uuid: str, owner: int | None = None) -> bool:
+        """Delete an alert from SQL storage."""
+        with sqlite3.connect(self.db_file) as conn:
+            if owner is None:
+                cursor = conn.execute(
+                    "DELETE FROM alerts WHERE uuid = ?", (alert_uuid,)
+                )
+            else:
+                cursor = conn.execute(
+                    "DELETE FROM alerts WHERE uuid = ? AND owner = ?",
+                    (alert_uuid, owner),
+                )
+            return cursor.rowcount > 0
+
+    def list_alerts(self, owner: int | None = None) -> list[Alert]:
+        """List alerts from SQL storage."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.row_factory = sqlite3.Row
+            query = "SELECT uuid, chat_id, owner, coin, op, threshold FROM alerts"
+            if owner is None:
+                rows = conn.execute(query).fetchall()
+            else:
+                rows = conn.execute(query + " WHERE owner = ?", (owner,)).fetchall()
+            return [Alert(**dict(row)) for row in rows]
+
+
+class JSONAlertStorage(AlertStorage):
+    """JSON file storage implementation.
+
+    Every call reads and rewrites the whole file, a lock keeps the alerts
+    thread and the dispatch workers from losing each other's changes.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the JSON storage file."""
+        try:
+            with open(self.file_path, "r") as f:
+                json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with open(self.file_path, "w") as f:
+                json.dump([], f)
+
+    def add_alert(self, alert: Alert) -> None:
+        """Add a new alert to JSON storage."""
+        with self.lock, open(self.file_path, "r+") as f:
+            alerts = json.load(f)
+            if len([a for a in alerts if a["owner"] == alert.owner]) >= (
+                MAX_ALERTS_PER_OWNER
+            ):
+                raise MaxAlertsReachedError(
+                    f"Owner {alert.owner} has reached the maximum limit of {MAX_ALERTS_PER_OWNER} alerts."
+                )
+            alerts.append(asdict(alert))
+            f.seek(0)
+            json.dump(alerts, f, indent=2)
+            f.truncate()
+
+    def del_alert(self, alert_uuid: str, owner: int | None = None) -> bool:
+        """Delete an alert from JSON storage."""
+        with self.lock, open(self.file_path, "r+") as f:
+            alerts = json.load(f)
+            kept = [
+                a
+                for a in alerts
+                if not (a["uuid"] == alert_uuid and owner in (None, a["owner"]))
+            ]
+            if len(kept) < len(alerts):
+                f.seek(0)
+                json.dump(kept, f, indent=2)
+                f.truncate()
+                return True
+            return False
+
+    def list_alerts(self, owner: int | None = None) -> list[Alert]:
+        """List alerts from JSON storage."""
+        with self.lock, open(self.file_path, "r") as f:
+            alerts = json.load(f)
+            return [Alert(**a) for a in alerts if owner in (None, a["owner"])]
+
+
+class ThresholdIndex:
+    """One coin's alerts, sorted by threshold.
+
+    Alerts firing above a price and below it are kept in two sorted lists,
+    ordered so that the alerts a price crosses are always a suffix: a tick
+    finds them with one bisect and cuts them off, O(log n + k). `>` and `<`
+    are strict, at an equal threshold `>=` and `<=` sort after them.
+    """
+
+    def __init__(self) -> None:
+        # (-threshold, inclusive, uuid): the lowest thresholds last
+        self.above: list[tuple[float, int, str]] = []
+        # (threshold, inclusive, uuid): the highest thresholds last
+        self.below: list[tuple[float, int, str]] = []
+        self.alerts: dict[str, Alert] = {}
+
+    def __len__(self) -> int:
+        return len(self.alerts)
+
+    def _entry(
+        self, alert: Alert
+    ) -> tuple[list[tuple[float, int, str]], tuple[float, int, str]]:
+        inclusive = int(alert.op.endswith("="))
+        if alert.op.startswith(">"):
+            return self.above, (-alert.threshold, inclusive, alert.uuid)
+        return self.below, (alert.threshold, inclusive, alert.uuid)
+
+    def add(self, alert: Alert) -> None:
+        side, entry = self._entry(alert)
+        bisect.insort(side, entry)
+        self.alerts[alert.uuid] = alert
+
+    def remove(self, alert_uuid: str) -> None:
+        alert = self.alerts.pop(alert_uuid, None)
+        if alert is None:
+            return
+        side, entry = self._entry(alert)
+        i = bisect.bisect_left(side, entry)
+        if i < len(side) and side[i] == entry:
+            del side[i]
+
+    def crossed(self, price: float) -> list[Alert]:
+        """Removes and returns the alerts `price` crossed."""
+        # past the strict alerts at exactly `price`, from its inclusive ones on
+        i = bisect.bisect_left(self.above, (-price, 1))
+        j = bisect.bisect_left(self.below, (price, 1))
+        fired = self.above[i:] + self.below[j:]
+        del self.above[i:]
+        del self.below[j:]
+        return [self.alerts.pop(alert_uuid) for *_key, alert_uuid in fired]
+
+
+class AlertEngine:
+    """Fires price alerts, checking every coin once per `interval`.
+
+    All alerted coins are quoted in one batched call per tick, however many
+    alerts there are. Fired alerts are removed, an alert fires once.
+    """
+
+    def __init__(
+        self,
+        storage: AlertStorage,
+        notify: Callable[[int, str], None],
+        interval: float = POLL_INTERVAL,
+    ) -> None:
+        self.storage = storage
+        self.notify = notify
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.indexes: dict[str, ThresholdIndex] = {}
+        self.stopped = threading.Event()
+        for alert in storage.list_alerts():
+            self._index(alert)
+
+    def _index(self, alert: Alert) -> None:
+        self.indexes.setdefault(alert.coin, ThresholdIndex()).add(alert)
+
+    def add(self, alert: Alert) -> None:
+        self.storage.add_alert(alert)
+        with self.lock:
+            self._index(alert)
+
+    def remove(self, alert_uuid: str, owner: int) -> bool:
+        if not self.storage.del_alert(alert_uuid, owner):
+            return False
+        with self.lock:
+            for index in self.indexes.values():
+                index.remove(alert_uuid)
+        return True
+
+    def tick(self) -> list[Alert]:
+        """Checks every alerted coin once, notifies and returns fired alerts."""
+        with self.lock:
+            coin_ids = [coin for coin, index in self.indexes.items() if len(index)]
+        if not coin_ids:
+            return []
+        # a quote older than this may have crossed back, such coins wait
+        # for the next tick rather than fire on a stale price
+        quotes = prices.get_quotes(coin_ids, max_age=2 * self.interval)
+
+        fired = []
+        with self.lock:
+            for coin, quote in quotes.items():
+                fired.extend(self.indexes[coin].crossed(quote["price_usd"]))
+        for alert in fired:
+            self.storage.del_alert(alert.uuid)
+            price = quotes[alert.coin]["price_usd"]
+            try:
+                self.notify(alert.chat_id, f"Alert {alert.describe()}: now ${price:g}")
+            except Exception:
+                logger.exception("Alerts: notifying %s failed", alert.chat_id)
+        return fired
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Alerts: tick failed")
+
+    def start(self) -> "AlertEngine":
+        threading.Thread(target=self.run, name="alerts", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+def init_storage(config_file: str = cronjob.CONFIG_FILE) -> AlertStorage:
+    """Builds the storage backend chosen in the cron jobs config file."""
+    config = cronjob.load_config(config_file)
+    if config.storage.backend == "sql":
+        return SQLAlertStorage(config.storage.database_file)
+    return JSONAlertStorage(config.storage.alerts_file_path)
+
+
+_engine: AlertEngine | None = None
+
+
+def start(notify: Callable[[int, str], None], **kwargs) -> AlertEngine:
+    """Start the process wide engine, with the configured storage."""
+    global _engine
+    _engine = AlertEngine(init_storage(), notify, **kwargs).start()
+    return _engine
+
+
+def get_engine() -> AlertEngine | None:
+    return _engine
+
+
+def parse_alert(text: str) -> tuple[str, str, float]:
+    """Parses '/alert btc > 100000' into (coin id, op, threshold).
+
+    `>` and `<` fire once the price is past the threshold, `>=` and `<=`
+    also when it is equal.
+    """
+    match = re.match(r"/\S+\s+(\S+)\s*([<>]=?)\s*([\d.,_]+)\s*(k?)\s*$", text, re.I)
+    if not match:
+        raise ValueError("Invalid alert format. Expected '/alert btc > 100000'")
+    code, op, number, thousands = match.groups()
+    try:
+        threshold = float(number.replace(",", "").replace("_", ""))
+    except ValueError:
+        raise ValueError(f"Invalid threshold {number}") from None
+    if thousands:
+        threshold *= 1000
+    try:
+        coin = coins.get_registry().resolve(code)
+    except KeyError:
+        raise ValueError(f"Unknown coin {code}") from None
+    return coin, op, threshold
+
+
+def add_alert(text: str, chat_id: int, owner: int) -> Alert:
+    """Adds an alert, the engine must be running."""
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("Alerts are not running")
+    coin, op, threshold = parse_alert(text)
+    alert = Alert(str(uuid.uuid4()), chat_id, owner, coin, op, threshold)
+    engine.add(alert)
+    return alert
+
+
+def del_alert(text: str, chat_id: int, owner: int) -> bool:
+    """Deletes an alert by UUID, ensuring ownership."""
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("Alerts are not running")
+    parts = text.split(maxsplit=1)
+    if len(parts) != 2 or not parts[1]:
+        raise ValueError("Invalid delete format. Expected '/delalert UUID'")
+    return engine.remove(parts[1].strip(), owner)
+
+
+def list_alerts(owner: int) -> list[Alert]:
+    engine = get_engine()
+    if engine is None:
+        raise RuntimeError("Alerts are not running")
+    return engine.storage.list_alerts(owner)
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import cache
+import upstream
+
+logger = logging.getLogger()
+
+SESSION = os.environ.get("AOC_SESSION")
+DB_FILE = "/tmp/uds_aoc.db"
+BOARD_URL = "https://adventofcode.com/{}/leaderboard/private/view/{}.json"
+# (year, board id) shown to chats that did not pick boards
+DEFAULT_BOARD = (2024, 416592)
+MAX_CHAT_BOARDS = 5
+
+
+@dataclass(frozen=True)
+class Member:
+    id: str
+    name: str
+    score: int
+    stars: int
+
+
+@dataclass
+class Scoreboard:
+    """A board's members with stars, best first, as of `fetched_at`."""
+
+    year: int
+    board_id: int
+    members: list[Member]
+    fetched_at: float
+
+    def standings(self) -> dict[str, tuple[int, int]]:
+        """member id: (stars, rank)."""
+        return {m.id: (m.stars, rank) for rank, m in enumerate(self.members, start=1)}
+
+
+@dataclass(frozen=True)
+class Change:
+    name: str
+    stars: int
+    old_stars: int
+    rank: int
+    old_rank: int | None
+
+    def describe(self) -> str:
+        if self.old_rank is None:
+            return f"{self.name} joined at #{self.rank} with {self.stars}*"
+        parts = [self.name]
+        if self.stars != self.old_stars:
+            parts.append(f"+{self.stars - self.old_stars}* ({self.stars}*)")
+        if self.rank != self.old_rank:
+            parts.append(f"#{self.old_rank} -> #{self.rank}")
+        return " ".join(parts)
+
+
+def parse_scoreboard(
+    data: dict, year: int, board_id: int, fetched_at: float
+) -> Scoreboard:
+    """Sorts a board's members with stars by score once, on refresh."""
+    members = [
+        Member(
+            str(m["id"]),
+            m.get("name") or f"anonymous #{m['id']}",
+            m["local_score"],
+            m["stars"],
+        )
+        for m in data["members"].values()
+        if m["stars"] > 0
+    ]
+    members.sort(key=lambda m: (-m.score, -m.stars, m.name))
+    return Scoreboard(year, board_id, members, fetched_at)
+
+
+def diff(seen: dict[str, tuple[int, int]], board: Scoreboard) -> list[Change]:
+    """Members whose stars or rank changed since `seen` standings, by rank."""
+    changes = []
+    for rank, m in enumerate(board.members, start=1):
+        old_stars, old_rank = seen.get(m.id, (0, None))
+        if old_rank is None or (old_stars, old_rank) != (m.stars, rank):
+            changes.append(Change(m.name, m.stars, old_stars, rank, old_rank))
+    return changes
+
+
+def board_title(board: Scoreboard) -> str:
+    timestamp = time.strftime("%Y%m%d %H:%M", time.gmtime(board.fetched_at))
+    return f"AoC {board.year} #{board.board_id} at {timestamp}UTC"
+
+
+def format_board(board: Scoreboard, topn: int = 10) -> str:
+    lines = [
+        f"{rank}. {m.name} {m.score} {m.stars}"
+        for rank, m in enumerate(board.members[:topn], start=1)
+    ]
+    return f"{board_title(board)} - refresh each 15m\n" + "\n".join(lines)
+
+
+def format_changes(board: Scoreboard, changes: list[Change]) -> str:
+    return f"{board_title(board)}\n" + "\n".join(c.describe() for c in changes)
+
+
+def fetch_board(year: int, board_id: int) -> dict:
+    if not isinstance(SESSION, str):
+        raise ValueError("AOC_SESSION must be a non-empty string")
+    logger.info("AOC: Getting newest data of %s/%s", year, board_id)
+    r = upstream.get(BOARD_URL.format(year, board_id), cookies={"session": SESSION})
+    r.raise_for_status()
+    return r.json()
+
+
+class LeaderboardService:
+    """Private leaderboards of several years and boards, per chat.
+
+    Board JSON is cached under "aoc", which AoC asks to not refresh more
+    often than every 15 minutes. Each board is parsed and sorted once per
+    refresh and held in memory. The standings last posted to a chat by
+    `changes` are stored, so only what changed since is posted.
+    """
+
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.boards: dict[tuple[int, int], Scoreboard] = {}
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_boards (
+                chat_id INTEGER,
+                year INTEGER,
+                board_id INTEGER,
+                PRIMARY KEY (chat_id, year, board_id)
+            )
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen (
+                chat_id INTEGER,
+                year INTEGER,
+                board_id INTEGER,
+                standings TEXT,
+                fetched_at REAL,
+                PRIMARY KEY (chat_id, year, board_id)
+            )
+            """)
+
+    def scoreboard(self, year: int, board_id: int) -> Scoreboard:
+        entry = cache.get_cache().entry(
+            "aoc", f"{year}:{board_id}", lambda: fetch_board(year, board_id)
+        )
+        with self.lock:
+            board = self.boards.get((year, board_id))
+            if board is None or board.fetched_at != entry.stored_at:
+                board = parse_scoreboard(entry.value, year, board_id, entry.stored_at)
+                self.boards[(year, board_id)] = board
+            return board
+
+    def chat_boards(self, chat_id: int) -> list[tuple[int, int]]:
+        with sqlite3.connect(self.db_file) as conn:
+            rows = conn.execute(
+                "SELECT year, board_id FROM chat_boards WHERE chat_id = ? ORDER BY year, board_id",
+                (chat_id,),
+            ).fetchall()
+        return [tuple(row) for row in rows] or [DEFAULT_BOARD]
+
+    def add_board(self, chat_id: int, year: int, board_id: int) -> None:
+        with sqlite3.connect(self.db_file) as conn:
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM chat_boards WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            if count >= MAX_CHAT_BOARDS:
+                raise ValueError(f"A chat follows at most {MAX_CHAT_BOARDS} boards")
+            conn.execute(
+                "INSERT OR IGNORE INTO chat_boards (chat_id, year, board_id) VALUES (?, ?, ?)",
+                (chat_id, year, board_id),
+            )
+
+    def remove_board(self, chat_id: int, year: int, board_id: int) -> bool:
+        with sqlite3.connect(self.db_file) as conn:
+            cursor = conn.execute(
+                "DELETE FROM chat_boards WHERE chat_id = ? AND year = ? AND board_id = ?",
+                (chat_id, year, board_id),
+            )
+            return cursor.rowcount > 0
+
+    def changes(
+        self, chat_id: int, year: int, board_id: int
+    ) -> tuple[Scoreboard, list[Change] | None]:
+        """The board and what changed since the last call for this chat.
+
+        Changes are None on the first call, which only records the standings.
+        """
+        board = self.scoreboard(year, board_id)
+        key = (chat_id, year, board_id)
+        with sqlite3.connect(self.db_file) as conn:
+            row = conn.execute(
+                "SELECT standings, fetched_at FROM seen WHERE chat_id = ? AND year = ? AND board_id = ?",
+                key,
+            ).fetchone()
+            if row is not None and row[1] >= board.fetched_at:
+                return board, []
+            conn.execute(
+                "INSERT OR REPLACE INTO seen (chat_id, year, board_id, standings, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (*key, json.dumps(board.standings()), board.fetched_at),
+            )
+        if row is None:
+            return board, None
+        seen = {id: tuple(s) for id, s in json.loads(row[0]).items()}
+        return board, diff(seen, board)
+
+
+_service: LeaderboardService | None = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> LeaderboardService:
+    """The process wide leaderboard service, created on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = LeaderboardService(DB_FILE)
+        return _service
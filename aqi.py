@@ -0,0 +1,279 @@
+import datetime
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import cache
+import geo
+import singleflight
+import upstream
+
+logger = logging.getLogger()
+
+# seconds between two pulls of a region's station list
+REFRESH_INTERVAL = 5 * 60
+
+TZ_VN = datetime.timezone(datetime.timedelta(hours=7))
+
+# (south, west, north, east) of the regions kept fresh by the refresher
+REGION_BOUNDS = {
+    "hanoi": (
+        20.96111901161895,
+        105.75405120849611,
+        21.09571147652958,
+        105.91609954833986,
+    ),
+    "hcm": (
+        10.710644309189911,
+        106.57606490366962,
+        10.906718682210693,
+        106.83509113187337,
+    ),
+}
+# stations this close to a place are reported by /aqi <place>
+PLACE_RADIUS_KM = 25
+# stations not seen in any fetch for this long are dropped from the index
+STATION_MAX_AGE = 6 * REFRESH_INTERVAL
+
+
+@dataclass
+class Station:
+    name: str
+    aqi: int | None
+    updated: str | None
+    lat: float | None = None
+    lon: float | None = None
+
+
+@dataclass
+class Snapshot:
+    """Stations of a region as of `fetched_at`, the worst one precomputed."""
+
+    region: str
+    stations: list[Station] = field(default_factory=list)
+    worst: Station | None = None
+    fetched_at: float = 0.0
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+def _to_int(value) -> int | None:
+    try:
+        aqi = int(value)
+    except (TypeError, ValueError):
+        return None
+    return aqi if aqi > 0 else None
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_bounds(bounds: tuple[float, float, float, float]) -> list[Station]:
+    """Stations in (south, west, north, east), from the WAQI map API."""
+    resp = upstream.get(
+        "https://api.waqi.info/mapq/bounds/",
+        params={"bounds": ",".join(str(b) for b in bounds)},
+    )
+    return [
+        Station(
+            name=loc["city"],
+            aqi=_to_int(loc.get("aqi")),
+            updated=loc.get("utime"),
+            lat=_to_float(loc.get("lat")),
+            lon=_to_float(loc.get("lon")),
+        )
+        for loc in resp.json()
+    ]
+
+
+def fetch_hanoi() -> list[Station]:
+    return fetch_bounds(REGION_BOUNDS["hanoi"])
+
+
+def fetch_hcm() -> list[Station]:
+    data = {
+        # airnet wants west,south,east,north
+        "bounds": "{1},{0},{3},{2}".format(*REGION_BOUNDS["hcm"]),
+        "zoom": "11",
+        "xscale": "1303.4747344074406",
+        "width": "678",
+        "time": datetime.datetime.utcnow().isoformat(),
+    }
+    resp = upstream.post("https://airnet.waqi.info/airnet/map/bounds", data=data)
+    stations = []
+    for loc in resp.json()["data"]:
+        updated = None
+        if isinstance(loc.get("u"), int):
+            updated = datetime.datetime.fromtimestamp(loc["u"], tz=TZ_VN).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            )
+        lat, lon = (loc.get("g") or [None, None])[:2]
+        stations.append(
+            Station(
+                name=loc["n"],
+                aqi=_to_int(loc.get("a")),
+                updated=updated,
+                lat=_to_float(lat),
+                lon=_to_float(lon),
+            )
+        )
+    return stations
+
+
+# region key: (display name, station list fetcher)
+REGIONS: dict[str, tuple[str, Callable[[], list[Station]]]] = {
+    "hanoi": ("Hanoi", fetch_hanoi),
+    "hcm": ("Ho Chi Minh City", fetch_hcm),
+}
+
+
+def worst_station(stations: list[Station]) -> Station | None:
+    rated = [s for s in stations if s.aqi is not None]
+    return max(rated, key=lambda s: s.aqi or 0) if rated else None
+
+
+def build_snapshot(region: str, stations: list[Station]) -> Snapshot:
+    """Snapshot of a region's stations, they are added to the index too."""
+    snapshot = Snapshot(region, stations, worst_station(stations), time.time())
+    index_stations(stations, REGION_BOUNDS.get(region), snapshot.fetched_at)
+    return snapshot
+
+
+# every station seen recently, by location, for /aqi <place>
+station_index = geo.GridIndex(max_age=STATION_MAX_AGE)
+_place_flights = singleflight.Group()
+
+
+def index_stations(
+    found: list[Station],
+    bounds: tuple[float, float, float, float] | None,
+    fetched_at: float,
+) -> None:
+    station_index.add_all(
+        {
+            (s.name, s.lat, s.lon): s
+            for s in found
+            if s.lat is not None and s.lon is not None
+        },
+        fetched_at,
+    )
+    if bounds is not None:
+        station_index.mark_refreshed(bounds, fetched_at)
+
+
+def nearby(
+    place: geo.Place, radius_km: float = PLACE_RADIUS_KM
+) -> list[tuple[float, Station]]:
+    """(distance km, station) around a place, nearest first.
+
+    Served from the station index, the area is fetched from WAQI in one
+    bounded call only when the index has not covered it recently.
+    """
+    # fetched to cell edges, so every cell the query reads is marked fetched
+    bounds = station_index.cover(geo.bounds_around(place.lat, place.lon, radius_km))
+    if time.time() - station_index.refreshed_at(bounds) > REFRESH_INTERVAL:
+
+        def refresh() -> None:
+            index_stations(fetch_bounds(bounds), bounds, time.time())
+
+        try:
+            # chats asking for one place at once share the call
+            _place_flights.do(place.name, refresh)
+        except Exception:
+            logger.exception("AQI: refreshing stations around %s failed", place.name)
+    return station_index.within(place.lat, place.lon, radius_km)
+
+
+class AqiRefresher:
+    """Pulls each region's station list every `interval` seconds.
+
+    Commands read the latest snapshot without calling WAQI. A failed pull
+    keeps the previous snapshot, its age shows how old the data is.
+    """
+
+    def __init__(
+        self,
+        regions: dict[str, tuple[str, Callable[[], list[Station]]]],
+        interval: float = REFRESH_INTERVAL,
+    ) -> None:
+        self.regions = regions
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.snapshots: dict[str, Snapshot] = {}
+        self.stopped = threading.Event()
+
+    def refresh(self, region: str) -> Snapshot:
+        _name, fetch = self.regions[region]
+        snapshot = build_snapshot(region, fetch())
+        with self.lock:
+            self.snapshots[region] = snapshot
+        return snapshot
+
+    def refresh_all(self) -> None:
+        for region in self.regions:
+            try:
+                self.refresh(region)
+            except Exception:
+                logger.exception("AQI: refreshing %s failed", region)
+
+    def get(self, region: str) -> Snapshot | None:
+        with self.lock:
+            return self.snapshots.get(region)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.refresh_all()
+            self.stopped.wait(self.interval)
+
+    def start(self) -> "AqiRefresher":
+        threading.Thread(target=self.run, name="aqi-refresher", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+_refresher: AqiRefresher | None = None
+
+
+def start(**kwargs) -> AqiRefresher:
+    """Start the process wide refresher, `snapshot` reads from it from now on."""
+    global _refresher
+    _refresher = AqiRefresher(REGIONS, **kwargs).start()
+    return _refresher
+
+
+def get_refresher() -> AqiRefresher | None:
+    return _refresher
+
+
+def snapshot(region: str) -> Snapshot:
+    """The latest snapshot of a region.
+
+    Served by the refresher when it runs and has one, otherwise fetched
+    synchronously through the cache.
+    """
+    if _refresher is not None:
+        snap = _refresher.get(region)
+        if snap is not None:
+            return snap
+    _name, fetch = REGIONS[region]
+    return cache.get_cache().get_or_fetch(
+        "aqi", region, lambda: build_snapshot(region, fetch())
+    )
+
+
+def region_name(region: str) -> str:
+    return REGIONS[region][0]
+
+
+def format_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    return "just now" if minutes < 1 else f"{minutes} min ago"
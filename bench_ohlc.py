@@ -0,0 +1,90 @@
+"""Compares history's SQL candle roll-up with the per-row lookups
+create_chart used before.
+
+    python bench_ohlc.py [days]
+
+Runs both on an hourly price series of `days` days, 365 by default. The
+roll-up is timed as the bot runs it: samples stored, then rolled up.
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import history
+
+
+def legacy_ohlc(prices):
+    """The OHLC stage of create_chart before the history store, kept as reference."""
+    import pandas as pd
+
+    def opents2price(row):
+        ts = row["Open_Timestamp"]
+        return float(df[df["Timestamp"] == ts]["Price"].values[0])
+
+    def closets2price(row):
+        ts = row["Close_Timestamp"]
+        return float(df[df["Timestamp"] == ts]["Price"].values[0])
+
+    df = pd.DataFrame(prices, columns=["Timestamp", "Price"])
+    df.index = pd.to_datetime(df["Timestamp"], unit="ms")  # type: ignore
+    df["date"] = df.index.date  # type: ignore
+
+    analyzed = pd.DataFrame()
+    analyzed["High"] = df.groupby("date")["Price"].max()
+    analyzed["Low"] = df.groupby("date")["Price"].min()
+    analyzed["Date"] = df.groupby("date").max()["Price"].index
+    analyzed["Open_Timestamp"] = df.groupby("date")["Timestamp"].min()
+    analyzed["Close_Timestamp"] = df.groupby("date")["Timestamp"].max()
+    analyzed["Open"] = analyzed.apply(opents2price, axis=1)
+    analyzed["Close"] = analyzed.apply(closets2price, axis=1)
+    return analyzed
+
+
+def rollup_ohlc(prices):
+    """(day, open, high, low, close) rows of a fresh store holding `prices`."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = history.PriceHistory(os.path.join(tmp, "prices.db"))
+        store.store("bench", prices, int(min(ts for ts, _p in prices)), time.time())
+        with sqlite3.connect(store.db_file) as conn:
+            return conn.execute(
+                "SELECT day, open, high, low, close FROM candles ORDER BY day"
+            ).fetchall()
+
+
+def hourly_prices(days: int, seed: int = 1) -> list[list[float]]:
+    rng = random.Random(seed)
+    start = 1_700_000_000_000
+    price = 40_000.0
+    prices = []
+    for hour in range(days * 24):
+        price *= 1 + rng.gauss(0, 0.005)
+        prices.append([start + hour * 3_600_000, price])
+    return prices
+
+
+def best_of(func, prices, runs: int = 5) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func(prices)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    prices = hourly_prices(days)
+    legacy = best_of(legacy_ohlc, prices)
+    rollup = best_of(rollup_ohlc, prices)
+    print(f"{days} days, {len(prices)} hourly samples")
+    print(f"legacy  {legacy * 1000:8.1f} ms")
+    print(f"roll-up {rollup * 1000:8.1f} ms")
+    print(f"speedup {legacy / rollup:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,187 @@
 #!/usr/bin/env python
+import functools
 import time
+import threading
 import traceback
 import logging
+from typing import Callable
 
 import requests
 
+import alerts
+import aqi
+import chart
 import cronjob
+import outbox
+import renderer
+import upstream
 import config
 from commands import Dispatcher, send_message
+from engine import DispatchEngine
+from update_queue import UpdateQueue
+from webhook import WebhookServer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 
-def fetch_message_and_process(session):
-    try:
-        with open(config.OFFSET_FILE) as f:
-            offset = int(f.read().strip())
-            params = {"offset": offset + 1}
-    except IOError:
-        params = None
+def get_updates(
+    session: upstream.UpstreamClient,
+    offset: int | None = None,
+    timeout: int = config.POLL_TIMEOUT,
+    limit: int = config.POLL_LIMIT,
+    allowed_updates: list[str] | None = None,
+) -> list[dict]:
+    """Long poll Telegram, returns as soon as an update arrives or after `timeout` seconds."""
+    params: dict = {
+        "timeout": timeout,
+        "limit": limit,
+        "allowed_updates": allowed_updates or config.ALLOWED_UPDATES,
+    }
+    if offset is not None:
+        params["offset"] = offset
 
-    resp = session.get(config.TELEGRAM_BASE_URL + "getUpdates", json=params, timeout=20)
+    # give the HTTP request some room over the server side long poll timeout
+    resp = session.get(
+        config.TELEGRAM_BASE_URL + "getUpdates", json=params, timeout=timeout + 10
+    )
     d = resp.json()
 
     try:
-        rs = d["result"]
+        return d["result"]
     except KeyError:
         print(d)
         exit("Looks like a bad token")
 
-    update_id = None
-    for r in rs:
-        update_id = r["update_id"]
+
+def process_update(dispatcher: Dispatcher, r: dict) -> None:
+    try:
+        message = r["message"]
+        timestamp = message["date"]
+        # skip message older than 5 min
+        if time.time() - timestamp > 5 * 60:
+            return
+    except KeyError:
+        return
+    if "text" in message:
+        chat_id = r["message"]["chat"]["id"]
+        from_id = r["message"]["from"]["id"]
+        text = r["message"]["text"].strip()
+        logger.info("Processing %s from %s in chat %s", text, from_id, chat_id)
+        try:
+            dispatcher.dispatch(text, chat_id, from_id)
+        except Exception as e:
+            send_message(
+                dispatcher.session,
+                chat_id,
+                "Failed, error: {} {}: tb: {}".format(
+                    type(e), e, traceback.format_tb(e.__traceback__, limit=1)
+                ),
+            )
+
+
+def fetch_message_and_process(
+    session: upstream.UpstreamClient, engine: DispatchEngine, queue: UpdateQueue
+) -> None:
+    """Stores new updates in the queue, then hands them to the engine.
+
+    The next poll starts after the newest stored update: once an update is
+    in the queue it is replayed from there after a restart, Telegram does
+    not need to send it again.
+    """
+    last_update_id = queue.last_update_id()
+    offset = last_update_id + 1 if last_update_id is not None else None
+    for r in queue.put_batch(get_updates(session, offset=offset)):
+        engine.submit(r)
+
+
+def run_cron_forever(
+    dispatcher: Dispatcher, interval: int = config.CRON_INTERVAL
+) -> None:
+    while True:
+        # wake up at the start of each minute so no HH:MM slot is skipped
+        time.sleep(interval - time.time() % interval)
         try:
-            message = r["message"]
-            timestamp = message["date"]
-            # skip message older than 5 min
-            if time.time() - timestamp > 5 * 60:
-                continue
-        except KeyError:
-            continue
-        if "text" in message:
-            chat_id = r["message"]["chat"]["id"]
-            from_id = r["message"]["from"]["id"]
-            text = r["message"]["text"].strip()
-            logger.info("Processing %s from %s in chat %s", text, from_id, chat_id)
-            dispatcher = Dispatcher(session=session)
-            try:
-                dispatcher.dispatch(text, chat_id, from_id)
-            except Exception as e:
-                send_message(
-                    session,
-                    chat_id,
-                    "Failed, error: {} {}: tb: {}".format(
-                        type(e), e, traceback.format_tb(e.__traceback__, limit=1)
-                    ),
-                )
-
-            with open(config.OFFSET_FILE, "w") as f:
-                f.write(str(update_id))
+            cronjob.run_cron(dispatcher.dispatch, dispatcher.prefetch)
+        except Exception:
+            logger.exception("Cron tick failed")
+
+
+def start_engine(queue: UpdateQueue, handler: Callable[[dict], None]) -> DispatchEngine:
+    engine = DispatchEngine(
+        handler=handler,
+        max_workers=config.DISPATCH_WORKERS,
+        on_commit=queue.commit,
+    )
+    pending = queue.pending()
+    logger.info("Replaying %d unfinished updates", len(pending))
+    for r in pending:
+        engine.submit(r)
+    return engine
+
+
+def poll_forever(queue: UpdateQueue, dispatcher: Dispatcher) -> None:
+    S = dispatcher.session
+    # getUpdates is refused while a webhook is set
+    S.post(config.TELEGRAM_BASE_URL + "deleteWebhook", timeout=10)
+    engine = start_engine(queue, functools.partial(process_update, dispatcher))
+    while True:
+        try:
+            fetch_message_and_process(S, engine, queue)
+        except requests.exceptions.RequestException:
+            logger.exception("getUpdates failed, retry in 5s")
+            time.sleep(5)
+
+
+def serve_webhook(queue: UpdateQueue, dispatcher: Dispatcher) -> None:
+    engine: DispatchEngine | None = None
+
+    def accept(update: dict) -> None:
+        assert engine is not None
+        new = queue.put_batch([update])
+        if not new:
+            # Telegram redelivered an update we already have
+            server.received_at.pop(update["update_id"], None)
+        for r in new:
+            engine.submit(r)
+
+    server = WebhookServer(
+        (config.WEBHOOK_HOST, config.WEBHOOK_PORT),
+        on_update=accept,
+        secret_token=config.WEBHOOK_SECRET,
+    )
+    engine = start_engine(
+        queue, server.track(functools.partial(process_update, dispatcher))
+    )
+
+    params: dict = {
+        "url": config.WEBHOOK_URL,
+        "allowed_updates": config.ALLOWED_UPDATES,
+    }
+    if config.WEBHOOK_SECRET:
+        params["secret_token"] = config.WEBHOOK_SECRET
+    dispatcher.session.post(
+        config.TELEGRAM_BASE_URL + "setWebhook", json=params, timeout=10
+    )
+    logger.info("Webhook listening on %s:%s", *server.server_address[:2])
+    server.serve_forever()
 
 
 if __name__ == "__main__":
     logger.info("Bot is starting")
-    while True:
-        with requests.Session() as S:
-            fetch_message_and_process(session=S)
-            dispatcher = Dispatcher(session=S)
-            cronjob.run_cron(dispatcher.dispatch)
-            time.sleep(60)
+    S = upstream.get_client()
+    outbox.start(S, config.TELEGRAM_BASE_URL)
+    aqi.start()
+    alerts.start(notify=functools.partial(send_message, S))
+    if config.RENDER_WORKERS:
+        renderer.start(config.RENDER_WORKERS, warm_up=chart.warm_up)
+    queue = UpdateQueue(config.QUEUE_DB_FILE)
+    # one dispatcher for the whole process, shared by updates and cron
+    dispatcher = Dispatcher(session=S)
+    threading.Thread(
+        target=run_cron_forever, args=(dispatcher,), name="cron", daemon=True
+    ).start()
+    if config.WEBHOOK_URL:
+        serve_webhook(queue, dispatcher)
+    else:
+        poll_forever(queue, dispatcher)
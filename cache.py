@@ -0,0 +1,251 @@
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import singleflight
+
+logger = logging.getLogger()
+
+DISK_PATH = "/tmp/uds_cache.db"
+
+# seconds an upstream result is fresh
+SOURCE_TTLS = {
+    "weather": 5 * 60,
+    "aqi": 5 * 60,
+    "coingecko": 60,
+    "podcast": 30 * 60,
+    "aoc": 15 * 60,
+    "chart": 15 * 60,
+}
+DEFAULT_TTL = 60
+# once stale, an entry is still served for another ttl while it is refreshed
+# in the background; past that the caller waits for the refresh
+STALE_FACTOR = 1
+# stale data is served up to this age when the upstream fails
+MAX_STALE = 24 * 3600
+
+
+@dataclass
+class Entry:
+    value: Any
+    stored_at: float
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class TTLCache:
+    """Caches upstream results: an in-memory LRU plus an optional SQLite tier.
+
+    Entries are fresh for their source's TTL. Stale entries are served while
+    a background refresh runs, and when the upstream fails.
+    """
+
+    def __init__(self, maxsize: int = 1024, disk_path: str | None = None) -> None:
+        self.maxsize = maxsize
+        self.disk_path = disk_path
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, Entry] = OrderedDict()
+        self.refreshing: set[str] = set()
+        self.flights = singleflight.Group()
+        self.counters: dict[str, Counter] = {}
+        if disk_path:
+            self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite tier."""
+        with sqlite3.connect(self.disk_path) as conn:  # type: ignore[arg-type]
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                stored_at REAL
+            )
+            """)
+
+    def _count(self, source: str, event: str) -> None:
+        with self.lock:
+            self.counters.setdefault(source, Counter())[event] += 1
+
+    def _get(self, key: str) -> Entry | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        if not self.disk_path:
+            return None
+        with sqlite3.connect(self.disk_path) as conn:
+            row = conn.execute(
+                "SELECT value, stored_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = Entry(json.loads(row[0]), row[1])
+        self._put_memory(key, entry)
+        return entry
+
+    def _put_memory(self, key: str, entry: Entry) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def put(self, key: str, value: Any) -> Entry:
+        entry = Entry(value, time.time())
+        self._put_memory(key, entry)
+        if self.disk_path:
+            try:
+                data = json.dumps(value)
+            except TypeError:
+                # not JSON serializable, lives in memory only
+                return entry
+            with sqlite3.connect(self.disk_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, data, entry.stored_at),
+                )
+                conn.execute(
+                    "DELETE FROM cache WHERE stored_at < ?",
+                    (entry.stored_at - MAX_STALE,),
+                )
+        return entry
+
+    def _refresh(self, source: str, key: str, fetch: Callable[[], Any]) -> Entry:
+        def fetch_and_put() -> Entry:
+            entry = self.put(key, fetch())
+            self._count(source, "fetched")
+            return entry
+
+        # concurrent misses of one key wait for a single upstream call
+        entry, shared = self.flights.do(key, fetch_and_put)
+        if shared:
+            self._count(source, "coalesced")
+        return entry
+
+    def _refresh_in_background(
+        self, source: str, key: str, fetch: Callable[[], Any]
+    ) -> None:
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def run() -> None:
+            try:
+                self._refresh(source, key, fetch)
+            except Exception:
+                self._count(source, "errors")
+                logger.exception("Cache: refreshing %s failed", key)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"refresh-{source}", daemon=True).start()
+
+    def entry(
+        self,
+        source: str,
+        key: str,
+        fetch: Callable[[], Any],
+        ttl: float | None = None,
+    ) -> Entry:
+        """Returns the cached entry for `key`, calling `fetch` when needed."""
+        if ttl is None:
+            ttl = SOURCE_TTLS.get(source, DEFAULT_TTL)
+        key = f"{source}:{key}"
+        entry = self._get(key)
+        if entry is not None:
+            age = entry.age()
+            if age < ttl:
+                self._count(source, "hits")
+                return entry
+            if age < ttl * (1 + STALE_FACTOR):
+                self._count(source, "stale")
+                self._refresh_in_background(source, key, fetch)
+                return entry
+
+        self._count(source, "misses")
+        try:
+            return self._refresh(source, key, fetch)
+        except Exception:
+            self._count(source, "errors")
+            if entry is not None and entry.age() < MAX_STALE:
+                logger.warning("Cache: upstream failed, serving stale %s", key)
+                self._count(source, "stale_on_error")
+                return entry
+            raise
+
+    def peek(self, source: str, key: str) -> Entry | None:
+        """The entry stored for `key`, fresh or not, without fetching."""
+        return self._get(f"{source}:{key}")
+
+    def store(self, source: str, key: str, value: Any) -> Entry:
+        """Stores a value fetched outside `entry`, e.g. in a batch."""
+        self._count(source, "fetched")
+        return self.put(f"{source}:{key}", value)
+
+    def get_or_fetch(
+        self,
+        source: str,
+        key: str,
+        fetch: Callable[[], Any],
+        ttl: float | None = None,
+    ) -> Any:
+        return self.entry(source, key, fetch, ttl).value
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self.lock:
+            return {source: dict(c) for source, c in self.counters.items()}
+
+
+_cache: TTLCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TTLCache:
+    """The process wide cache, created on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTLCache(disk_path=DISK_PATH)
+        return _cache
+
+
+def make_key(*args, **kwargs) -> str:
+    return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+
+def keyword_key(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+def cached(
+    source: str, ttl: float | None = None, key: Callable[..., Any] | None = None
+) -> Callable:
+    """Caches a function's results under `source`, keyed on its arguments.
+
+    `key` normalizes the arguments, e.g. lower case keywords, so that calls
+    asking for the same thing share one entry and one upstream call.
+    The function must raise on failure, a returned value is cached.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            normalized = key(*args, **kwargs) if key else make_key(*args, **kwargs)
+            cache_key = f"{func.__name__}:{normalized}"
+            return get_cache().get_or_fetch(
+                source, cache_key, lambda: func(*args, **kwargs), ttl
+            )
+
+        return wrapper
+
+    return decorate
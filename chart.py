@@ -0,0 +1,214 @@
+import functools
+import time
+from typing import TYPE_CHECKING
+
+import cache
+import fanout
+import history
+import renderer
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DAYS = 60
+WIDTH = 900
+HEIGHT = 600
+# /c windows: 7d, 8w, 3m, 1y
+WINDOW_UNITS = {"d": 1, "w": 7, "m": 30, "y": 365}
+# coins on one comparison chart
+MAX_COMPARE = 6
+
+
+def normalize(closes: dict[str, list[tuple[str, float]]]) -> "pd.DataFrame":
+    """Percent returns of coins since the first day all of them have a price.
+
+    One pass over all coins' (day, close) rows: they are pivoted into a day
+    by coin frame, resampled to a daily grid with gaps carried forward, cut
+    to the days every coin covers and divided by the first of those days.
+    Columns are the coins, in the order of `closes`; empty without overlap.
+    """
+    import pandas as pd
+
+    rows = pd.concat(
+        [
+            pd.DataFrame(candles, columns=["Date", "Close"]).assign(Coin=coin)
+            for coin, candles in closes.items()
+        ]
+    )
+    prices = (
+        rows.assign(Date=pd.to_datetime(rows["Date"]))
+        .pivot_table(index="Date", columns="Coin", values="Close", aggfunc="last")
+        .reindex(columns=list(closes))
+        .resample("1D")
+        .last()
+        .ffill()
+        .dropna()
+    )
+    if prices.empty:
+        return prices
+    return prices.div(prices.iloc[0]).sub(1).mul(100)
+
+
+def parse_window(token: str) -> int | None:
+    """Days in a window like 7d or 1y, None if `token` is not one."""
+    count, unit = token[:-1], token[-1:].lower()
+    if not count.isdigit() or unit not in WINDOW_UNITS or int(count) == 0:
+        return None
+    return min(int(count) * WINDOW_UNITS[unit], history.MAX_DAYS)
+
+
+def render_candlestick(
+    candles: "pd.DataFrame", width: int = WIDTH, height: int = HEIGHT
+) -> bytes:
+    """PNG of a candlestick chart, rendered in memory."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(
+        data=[
+            go.Candlestick(
+                x=candles["Date"],
+                open=candles["Open"],
+                high=candles["High"],
+                low=candles["Low"],
+                close=candles["Close"],
+            )
+        ]
+    )
+
+    fig.update_layout(
+        plot_bgcolor="#333333",
+        paper_bgcolor="#333333",
+        font=dict(color="white"),
+        xaxis={"showgrid": False},
+        width=width,
+        height=height,
+    )
+
+    return fig.to_image(format="png")
+
+
+def render_returns(
+    returns: "pd.DataFrame", width: int = WIDTH, height: int = HEIGHT
+) -> bytes:
+    """PNG of a line chart of percent returns, one line per column."""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(
+        data=[
+            go.Scatter(x=returns.index, y=returns[coin], mode="lines", name=coin)
+            for coin in returns.columns
+        ]
+    )
+
+    fig.update_layout(
+        plot_bgcolor="#333333",
+        paper_bgcolor="#333333",
+        font=dict(color="white"),
+        xaxis={"showgrid": False},
+        yaxis={"ticksuffix": "%", "gridcolor": "#555555"},
+        width=width,
+        height=height,
+    )
+
+    return fig.to_image(format="png")
+
+
+def chart_key(
+    coin: str, days: int = DAYS, width: int = WIDTH, height: int = HEIGHT
+) -> str:
+    """Identifies a chart, charts of a coin change with the UTC day."""
+    day = time.strftime("%Y-%m-%d", time.gmtime())
+    return f"{coin}:{day}:{days}d:{width}x{height}"
+
+
+def comparison_key(
+    coins: list[str], days: int = DAYS, width: int = WIDTH, height: int = HEIGHT
+) -> str:
+    return chart_key("vs:" + ",".join(coins), days, width, height)
+
+
+def render_candles(
+    candles: list[tuple[str, float, float, float, float]], width: int, height: int
+) -> bytes:
+    import pandas as pd
+
+    frame = pd.DataFrame(candles, columns=["Date", "Open", "High", "Low", "Close"])
+    return render_candlestick(frame, width, height)
+
+
+def render_closes(
+    closes: dict[str, list[tuple[str, float]]], width: int, height: int
+) -> bytes:
+    returns = normalize(closes)
+    if returns.empty:
+        raise ValueError("No common price history for " + ", ".join(closes))
+    return render_returns(returns, width, height)
+
+
+def warm_up() -> None:
+    """Loads pandas and plotly and starts kaleido, run by renderer workers."""
+    render_candles([("2024-01-01", 1.0, 2.0, 0.5, 1.5)], 10, 10)
+
+
+def render(
+    coin: str, days: int = DAYS, width: int = WIDTH, height: int = HEIGHT
+) -> bytes:
+    """PNG of a coin's daily candles over the last `days` days.
+
+    Candles come from the local price history, the renderer pool draws
+    them when it runs.
+    """
+    candles = history.get_store().candles(coin, days)
+    if not candles:
+        raise ValueError(f"No price history for {coin}")
+    pool = renderer.get_pool()
+    if pool is None:
+        return render_candles(candles, width, height)
+    return pool.run(render_candles, candles, width, height)
+
+
+def get_chart(
+    coin: str, days: int = DAYS, width: int = WIDTH, height: int = HEIGHT
+) -> bytes:
+    """PNG of a coin's daily candles, rendered once per chart cache window."""
+    return cache.get_cache().get_or_fetch(
+        "chart",
+        chart_key(coin, days, width, height),
+        lambda: render(coin, days, width, height),
+    )
+
+
+def render_comparison(
+    coins: list[str], days: int = DAYS, width: int = WIDTH, height: int = HEIGHT
+) -> bytes:
+    """PNG of several coins' returns over the last `days` days.
+
+    Each coin's daily candles come from the local price history, one
+    incremental fetch per coin, all coins at once.
+    """
+    store = history.get_store()
+    results = fanout.fan_out(
+        {coin: functools.partial(store.candles, coin, days) for coin in coins}
+    )
+    closes = {}
+    for coin, result in results.items():
+        if not result.ok:
+            raise ValueError(f"Price history of {coin} {result.status()}")
+        if not result.value:
+            raise ValueError(f"No price history for {coin}")
+        closes[coin] = [(day, close) for day, _o, _h, _l, close in result.value]
+    pool = renderer.get_pool()
+    if pool is None:
+        return render_closes(closes, width, height)
+    return pool.run(render_closes, closes, width, height)
+
+
+def get_comparison(
+    coins: list[str], days: int = DAYS, width: int = WIDTH, height: int = HEIGHT
+) -> bytes:
+    """PNG of several coins' returns, rendered once per chart cache window."""
+    return cache.get_cache().get_or_fetch(
+        "chart",
+        comparison_key(coins, days, width, height),
+        lambda: render_comparison(coins, days, width, height),
+    )
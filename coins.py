@@ -0,0 +1,189 @@
+import bisect
+import difflib
+import json
+import math
+import logging
+import os
+import threading
+import time
+
+import upstream
+
+logger = logging.getLogger()
+
+COINS_URL = "https://api.coingecko.com/api/v3/coins/list"
+MARKETS_URL = "https://api.coingecko.com/api/v3/coins/markets"
+# market cap ranks of the top coins, 250 per page, pick among shared symbols
+RANKED_PAGES = 4
+DISK_PATH = "/tmp/uds_coins.json"
+# seconds before the coin list on disk is fetched again
+REFRESH_INTERVAL = 24 * 3600
+# seconds between attempts while fetching the list fails
+RETRY_INTERVAL = 10 * 60
+
+# symbols shared by many coins resolve to these, and work without the list
+PINNED = {
+    "btc": "bitcoin",
+    "eth": "ethereum",
+    "usdt": "tether",
+    "bnb": "binancecoin",
+    "ada": "cardano",
+    "doge": "dogecoin",
+    "sol": "solana",
+    "xrm": "monero",
+    "xmr": "monero",
+    "xrp": "ripple",
+    "ltc": "litecoin",
+    "link": "chainlink",
+    "xlm": "stellar",
+}
+
+
+class CoinRegistry:
+    """Resolves coin symbols, ids and names to CoinGecko ids, in memory.
+
+    Built from CoinGecko's coin list. An id always resolves to its own
+    coin, then pinned symbols, other symbols and names are added without
+    replacing a key already taken. A symbol or name used by several coins
+    resolves to the one with the best market cap rank, unranked coins
+    fall back to the shortest id. A sorted key list serves prefix
+    suggestions, close matches are suggested for typos.
+    """
+
+    def __init__(
+        self,
+        coins: list[dict],
+        fetched_at: float = 0.0,
+        ranks: dict[str, int] | None = None,
+    ) -> None:
+        self.fetched_at = fetched_at
+        ranks = ranks or {}
+        self.ids: dict[str, str] = {}
+        for coin in coins:
+            self.ids.setdefault(coin["id"].lower(), coin["id"])
+        for symbol, coin_id in PINNED.items():
+            self.ids.setdefault(symbol, coin_id)
+        by_rank = sorted(
+            coins, key=lambda c: (ranks.get(c["id"], math.inf), len(c["id"]))
+        )
+        for field in ("symbol", "name"):
+            for coin in by_rank:
+                self.ids.setdefault(coin[field].lower(), coin["id"])
+        self.keys = sorted(self.ids)
+
+    def __len__(self) -> int:
+        return len(set(self.ids.values()))
+
+    def resolve(self, code: str) -> str:
+        """The CoinGecko id of a symbol, id or name, KeyError if unknown."""
+        return self.ids[code.lower().strip()]
+
+    def suggest(self, code: str, n: int = 5) -> list[str]:
+        """Known keys starting with `code`, or else close to it."""
+        code = code.lower().strip()
+        start = bisect.bisect_left(self.keys, code)
+        matches = [key for key in self.keys[start : start + n] if key.startswith(code)]
+        return matches or difflib.get_close_matches(code, self.keys, n=n)
+
+
+def fetch_coins() -> list[dict]:
+    resp = upstream.get(COINS_URL)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def fetch_ranks() -> dict[str, int]:
+    """Market cap rank of the top coins, by id."""
+    ranks: dict[str, int] = {}
+    for page in range(1, RANKED_PAGES + 1):
+        resp = upstream.get(
+            MARKETS_URL,
+            params={
+                "vs_currency": "usd",
+                "order": "market_cap_desc",
+                "per_page": 250,
+                "page": page,
+            },
+        )
+        resp.raise_for_status()
+        for coin in resp.json():
+            if coin.get("market_cap_rank"):
+                ranks[coin["id"]] = coin["market_cap_rank"]
+    return ranks
+
+
+def load(path: str | None = None) -> CoinRegistry | None:
+    try:
+        with open(path or DISK_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return CoinRegistry(data["coins"], data["fetched_at"], data.get("ranks"))
+
+
+def refresh(path: str | None = None) -> CoinRegistry:
+    """Fetches the coin list and market cap ranks, stores them on disk."""
+    path = path or DISK_PATH
+    coins = fetch_coins()
+    try:
+        ranks = fetch_ranks()
+    except Exception:
+        # ranks only break symbol ties, the list is still worth keeping
+        logger.exception("Coins: fetching market cap ranks failed")
+        ranks = {}
+    fetched_at = time.time()
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": fetched_at, "coins": coins, "ranks": ranks}, f)
+    os.replace(tmp, path)
+    logger.info("Coins: stored %d coins, %d ranked", len(coins), len(ranks))
+    return CoinRegistry(coins, fetched_at, ranks)
+
+
+_registry: CoinRegistry | None = None
+_registry_lock = threading.Lock()
+_refreshing = threading.Lock()
+_last_attempt = 0.0
+
+
+def _refresh_in_background() -> None:
+    global _last_attempt
+    if time.time() - _last_attempt < RETRY_INTERVAL:
+        return
+    if not _refreshing.acquire(blocking=False):
+        return
+    _last_attempt = time.time()
+
+    def run() -> None:
+        global _registry
+        try:
+            _registry = refresh()
+        except Exception:
+            logger.exception("Coins: refreshing the coin list failed")
+        finally:
+            _refreshing.release()
+
+    threading.Thread(target=run, name="coins-refresh", daemon=True).start()
+
+
+def get_registry() -> CoinRegistry:
+    """The process wide registry, loaded from disk on first use.
+
+    Without a list on disk it is fetched once, a list older than a day is
+    refreshed in the background. If CoinGecko is down only pinned coins
+    are known until a retry succeeds.
+    """
+    global _registry, _last_attempt
+    with _registry_lock:
+        if _registry is None:
+            _registry = load()
+        if _registry is None:
+            _last_attempt = time.time()
+            try:
+                _registry = refresh()
+            except Exception:
+                logger.exception("Coins: fetching the coin list failed")
+                _registry = CoinRegistry([])
+    if time.time() - _registry.fetched_at > REFRESH_INTERVAL:
+        _refresh_in_background()
+    return _registry
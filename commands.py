@@ -1,18 +1,28 @@
 import logging
 import os
-import json
 import time
-import datetime
-import hashlib
+import functools
 import random
-from typing import MutableMapping, BinaryIO, cast
+import threading
+from dataclasses import dataclass
+from typing import Callable, BinaryIO
 
 import requests
-import uds
+import alerts
+import aoc
+import aqi
+import cache
+import chart
+import coins
+import fanout
+import geo
 import jp_dict
+import lookups
 import cronjob
-import llm
-import jp_podcast
+import outbox
+import prices
+import upstream
+import weather
 
 import config
 
@@ -20,155 +30,175 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger()
 
 BOT_TOKEN = os.environ["BOT_TOKEN"]
-# get temp token from https://openweathermap.org/
-API_TEMP = os.environ["WEATHER_TOKEN"]
-AOC_SESSION = os.environ.get("AOC_SESSION")
 
 os.environ["TZ"] = "Asia/Ho_Chi_Minh"
 
+TEM_USAGE = "Usage: /tem set Hanoi, Da Nang - /tem reset - /tem <city>, <city>"
 
-dbpath = ":memory:"
-db = jp_dict.init_kanji_db(dbpath)
-kanji_service = jp_dict.KanjiService(db)
+# commands of these costs run in the limited slow slots
+SLOW_COSTS = ("heavy", "llm")
 
+# https://core.telegram.org/bots/api#sendmessage
+TELEGRAM_MESSAGE_LIMIT = 4096
 
-def aoc21(topn: int = 10) -> str:
-    cookies = {"session": AOC_SESSION}
 
-    if not isinstance(AOC_SESSION, str):
-        raise ValueError("AOC_SESSION must be a non-empty string")
+@functools.cache
+def get_kanji_service() -> jp_dict.KanjiService:
+    # loading joyo_final.json takes a while, done on the first /jo only
+    dbpath = ":memory:"
+    db = jp_dict.init_kanji_db(dbpath)
+    return jp_dict.KanjiService(db)
 
-    h = hashlib.sha256(AOC_SESSION.encode("utf-8")).hexdigest()
-    datafile = f"/tmp/uds_aoc_{h}"
 
-    d = {}
-    timestamp = ""
-    try:
-        if os.stat(datafile).st_mtime > time.time() - 15 * 60:
-            logger.info("AOC: Cache fresh, use it")
+def _get_coin_name(code: str) -> str:
+    return coins.get_registry().resolve(code)
 
-            timestamp = time.strftime(
-                "%Y%m%d %H:%M", time.gmtime(os.stat(datafile).st_mtime)
-            )
 
-            with open(datafile) as f:
-                d = json.load(f)
-    except IOError:
-        pass
+def _unknown_coin_text(code: str) -> str:
+    suggestions = coins.get_registry().suggest(code)
+    if suggestions:
+        return f"Unknown coin {code}, did you mean: {', '.join(suggestions)}"
+    return f"Unknown coin {code}"
 
-    if not d:
-        timestamp = datetime.datetime.now().strftime("%Y%m%d %H:%M")
-        logger.info("AOC: Getting newest data")
 
-        # Filter out None values
-        cookies = {key: value for key, value in cookies.items() if value is not None}
-        # Cast to the expected type that requests.get() requires
-        typed_cookies: MutableMapping[str, str] = cast(
-            MutableMapping[str, str], cookies
-        )
-        r = requests.get(
-            "https://adventofcode.com/2024/leaderboard/private/view/416592.json",
-            cookies=typed_cookies,
-        )
+def send_message(
+    session: upstream.UpstreamClient, chat_id: int, text: str = "hi"
+) -> None:
+    msg = {
+        "chat_id": chat_id,
+        "text": text,
+    }
+    box = outbox.get_outbox()
+    if box is not None:
+        # delivered in the background within Telegram rate limits
+        box.submit(chat_id, "sendMessage", msg)
+        return
+    session.post(config.TELEGRAM_BASE_URL + "sendMessage", json=msg, timeout=10)
 
-        d = r.json()
-        with open(datafile, "wt") as f:
-            json.dump(d, f)
 
-    scoreboard = [
-        (e["name"], e["local_score"], e["stars"])
-        for e in sorted(
-            d["members"].values(), key=lambda i: i["local_score"], reverse=True
-        )
-        if e["stars"] > 0
-    ]
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Splits text into parts Telegram accepts, on line breaks where possible."""
+    parts: list[str] = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        parts.append(current)
+    return parts
 
-    lines = [
-        f"{idx}. " + " ".join((str(p) for p in i))
-        for idx, i in enumerate(scoreboard[:topn], start=1)
-    ]
 
-    return f"AoC PyMi At {timestamp}UTC - refresh each 15m\n" + "\n".join(lines)
+class Reply:
+    """Collects a handler's output lines and sends them as one message.
 
+    Use as a context manager, the message is sent when the block exits. On
+    an error the lines collected so far are still sent, marked incomplete,
+    and the error is raised. A reply without lines sends `empty`. It is
+    only split when it exceeds Telegram's size limit.
+    """
 
-def _get_coin_name(code: str) -> str:
-    return dict(
-        [
-            ("btc", "bitcoin"),
-            ("eth", "ethereum"),
-            ("usdt", "tether"),
-            ("bnb", "binancecoin"),
-            ("ada", "cardano"),
-            ("doge", "dogecoin"),
-            ("sol", "solana"),
-            ("xrm", "monero"),
-            ("xrp", "xrp"),
-            ("ltc", "litecoin"),
-            ("link", "chainlink"),
-            ("xlm", "stellar"),
-        ]
-    )[code]
-
-
-def get_aqi_hanoi() -> tuple:
-    resp = requests.get(
-        "https://api.waqi.info/mapq/bounds/?bounds=20.96111901161895,105.75405120849611,21.09571147652958,105.91609954833986"
-    )
-    locs = resp.json()
-    if len(locs) > 0:
-        for i in locs:
-            if i["aqi"].isdigit() and int(i["aqi"]) > 0:
-                return i["city"], i["aqi"], i["utime"]
-        return locs[0]["city"], None, locs[0]["utime"]
+    def __init__(
+        self,
+        session: upstream.UpstreamClient,
+        chat_id: int,
+        empty: str = "No result",
+    ) -> None:
+        self.session = session
+        self.chat_id = chat_id
+        self.empty = empty
+        self.lines: list[str] = []
+
+    def add(self, text: str) -> None:
+        self.lines.append(text)
+
+    def send(self) -> None:
+        text = "\n".join(self.lines) or self.empty
+        for part in split_message(text):
+            send_message(session=self.session, chat_id=self.chat_id, text=part)
+        self.lines = []
+
+    def __enter__(self) -> "Reply":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.send()
+        elif self.lines:
+            self.add("(incomplete, an error occurred)")
+            self.send()
+
+
+def send_photo(chat_id: int, photo: BinaryIO | bytes | str) -> requests.Response:
+    """Uploads a photo, or resends one Telegram has when given its file_id."""
+    params: dict = {"chat_id": chat_id}
+    files = None
+    if isinstance(photo, str):
+        params["photo"] = photo
     else:
-        return "Hanoi", None, None
-
-
-def get_aqi_hcm() -> tuple:
-    url = "https://airnet.waqi.info/airnet/map/bounds"
+        files = {"photo": ("photo.png", photo) if isinstance(photo, bytes) else photo}
+    box = outbox.get_outbox()
+    if box is not None:
+        # sent now for its file_id, within the outbox's rate limits
+        box.acquire(chat_id)
+    resp = upstream.post(
+        config.TELEGRAM_BASE_URL + "sendPhoto", data=params, files=files
+    )
+    if box is not None and resp.status_code == 429:
+        box.rate_limited(chat_id, resp)
+    return resp
 
-    tz_hcm = datetime.timezone(datetime.timedelta(hours=7))
-    current_time = datetime.datetime.utcnow().isoformat()
 
-    data = {
-        "bounds": "106.57606490366962,10.710644309189911,106.83509113187337,10.906718682210693",
-        "zoom": "11",
-        "xscale": "1303.4747344074406",
-        "width": "678",
-        "time": current_time,
-    }
+def photo_file_id(resp: requests.Response) -> str | None:
+    """file_id of the largest size of a sent photo."""
+    try:
+        return resp.json()["result"]["photo"][-1]["file_id"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
 
-    response = requests.post(url, data=data)
-    locs = response.json()["data"]
 
-    if len(locs) > 0:
-        highest_aqi = max(locs, key=lambda x: x["u"] if isinstance(x["u"], int) else 0)
+def send_chart(chat_id: int, coin: str, days: int = chart.DAYS) -> None:
+    """Sends a coin's chart, by file_id when it was uploaded before.
 
-        if highest_aqi:
-            name = highest_aqi["n"]
-            aqi_value = highest_aqi["a"]
-            utime = datetime.datetime.fromtimestamp(
-                highest_aqi["u"], tz=tz_hcm
-            ).strftime("%Y-%m-%d %H:%M:%S")
-            return name, aqi_value, utime
+    Telegram keeps uploaded photos, so a chart is rendered and uploaded
+    once per cache window, repeats only send its file_id.
+    """
+    _send_cached_photo(
+        chat_id, chart.chart_key(coin, days), lambda: chart.get_chart(coin, days)
+    )
 
-    return "Ho Chi Minh City", None, None
 
+def send_comparison(chat_id: int, coins: list[str], days: int = chart.DAYS) -> None:
+    """Sends a chart comparing coins' returns, like send_chart."""
+    _send_cached_photo(
+        chat_id,
+        chart.comparison_key(coins, days),
+        lambda: chart.get_comparison(coins, days),
+    )
 
-def send_message(session: requests.Session, chat_id: int, text: str = "hi") -> None:
-    msg = {
-        "chat_id": chat_id,
-        "text": text,
-    }
-    session.post(config.TELEGRAM_BASE_URL + "sendMessage", json=msg, timeout=10)
 
+def _send_cached_photo(chat_id: int, key: str, render: Callable[[], bytes]) -> None:
+    store = cache.get_cache()
+    entry = store.peek("chart_file", key)
+    if entry is not None and entry.age() < cache.SOURCE_TTLS["chart"]:
+        resp = send_photo(chat_id, entry.value)
+        if resp.ok:
+            return
+        logger.warning("Chart: resending %s by file_id failed", key)
 
-def send_photo(chat_id: int, file_opened: BinaryIO) -> requests.Response:
-    method = "sendPhoto"
-    params = {"chat_id": chat_id}
-    files = {"photo": file_opened}
-    resp = requests.post(config.TELEGRAM_BASE_URL + method, params, files=files)
-    return resp
+    resp = send_photo(chat_id, render())
+    resp.raise_for_status()
+    file_id = photo_file_id(resp)
+    if file_id:
+        store.store("chart_file", key, file_id)
 
 
 def fit_meanings_to_message(url: str, meanings: list) -> str:
@@ -188,128 +218,130 @@ def fit_meanings_to_message(url: str, meanings: list) -> str:
 
 
 def get_temp(cities: list) -> list:
-    results = []
-    for city in cities:
-        data_temp = requests.get(
-            "https://api.openweathermap.org/data/2.5/weather?q={}&appid={}".format(
-                city, API_TEMP
-            )
-        ).json()
-        results.append(
-            {
-                "name": data_temp["name"],
-                "temp_now": round(data_temp["main"]["temp"] - 273.15),
-                "feels_like": round(data_temp["main"]["feels_like"] - 273.15),
-                "humidity": data_temp["main"]["humidity"],
-                "weather": data_temp["weather"][0]["description"],
-            }
-        )
-    return results
+    """Weather of the known cities among `cities`, one upstream call for all."""
+    temps, unknown = weather.get_service().get_weather(cities)
+    if unknown:
+        logger.info("Temp: unknown cities %s", unknown)
+    return temps
 
 
-def get_price_btc(coin: str = "bitcoin") -> dict:
-    """
-    Fetches the current Bitcoin price in USD, market cap, and 24-hour price change from the CoinGecko API.
-    Returns the data as a JSON object.
-    """
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={coin}&vs_currencies=usd&include_market_cap=true&include_24hr_change=true"
+def format_aqi(result: fanout.Result, region: str) -> str:
+    name = aqi.region_name(region)
+    if not result.ok:
+        return f"PM2.5 at {name}: {result.status()}"
+    snapshot = result.value
+    station = snapshot.worst
+    if station is None:
+        return f"No AQI available for {name}"
+    return f"PM2.5 {station.aqi} at {station.name} at {station.updated} (data {aqi.format_age(snapshot.age())})"
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an error for bad responses (4xx and 5xx)
-        data = response.json()
-
-        # Extract Bitcoin price, market cap, and 24-hour change
-        btc_data = {
-            "price_usd": data[coin]["usd"],
-            "market_cap_usd": data[coin]["usd_market_cap"],
-            "change_24h_percent": data[coin]["usd_24h_change"],
-        }
 
-        return btc_data
-    except requests.exceptions.RequestException as e:
-        return {"error": str(e)}
+@lookups.cached("uds")
+def urbandictionary(keyword: str) -> dict:
+    import uds
 
+    result = uds.urbandictionary(keyword)
+    if not result["means"]:
+        raise lookups.NotFound(keyword)
+    return result
 
-def create_chart(coin: str = "bitcoin") -> None:
-    import pandas as pd
-    import plotly.graph_objects as go
 
-    def opents2price(row):
-        ts = row["Open_Timestamp"]
-        rs = float(df[df["Timestamp"] == ts]["Price"].values)
-        return rs
+@lookups.cached("cambridge")
+def cambridge(keyword: str) -> dict:
+    import uds
 
-    def closets2price(row):
-        ts = row["Close_Timestamp"]
-        rs = float(df[df["Timestamp"] == ts]["Price"].values)
-        return rs
+    result = uds.cambridge(keyword)
+    if not result["means"]:
+        raise lookups.NotFound(keyword)
+    return result
 
-    data = requests.get(
-        f"https://api.coingecko.com/api/v3/coins/{coin}/market_chart?vs_currency=usd&days=60",
-        timeout=7,
-    ).json()
 
-    df = pd.DataFrame(
-        data["prices"],
-        columns=["Timestamp", "Price"],
-    )
-
-    df.index = pd.to_datetime(df["Timestamp"], unit="ms")  # type: ignore
-    df["date"] = df.index.date  # type: ignore
-
-    analyzed = pd.DataFrame()
-    analyzed["High"] = df.groupby("date")["Price"].max()
-    analyzed["Low"] = df.groupby("date")["Price"].min()
-    analyzed["Date"] = df.groupby("date").max()["Price"].index
-    analyzed["Open_Timestamp"] = df.groupby("date")["Timestamp"].min()
-    analyzed["Close_Timestamp"] = df.groupby("date")["Timestamp"].max()
-    analyzed["Open"] = analyzed.apply(opents2price, axis=1)
-    analyzed["Close"] = analyzed.apply(closets2price, axis=1)
-
-    fig = go.Figure(
-        data=[
-            go.Candlestick(
-                x=analyzed["Date"],
-                open=analyzed["Open"],
-                high=analyzed["High"],
-                low=analyzed["Low"],
-                close=analyzed["Close"],
-            )
-        ]
-    )
-
-    fig.update_layout(
-        plot_bgcolor="#333333",
-        paper_bgcolor="#333333",
-        font=dict(color="white"),
-        xaxis={"showgrid": False},
-        width=900,
-        height=600,
-    )
+@lookups.cached("cambridge_fr")
+def cambridge_fr(keyword: str) -> dict:
+    import uds
 
-    fig.write_image("/tmp/chartimage.png")
+    result = uds.cambridge_fr(keyword)
+    if not result["means"]:
+        raise lookups.NotFound(keyword)
+    return result
 
 
 def kanji(grade: int = 2, nth: int = -1) -> str:
     if nth == -1:
         nth = random.randrange(jp_dict.NUMBER_OF_YOJO_WORDS)
-    k = kanji_service.get_kanji(grade=grade, nth=nth)
+    k = get_kanji_service().get_kanji(grade=grade, nth=nth)
 
     return "{}: {}\n{}\n{}".format(k.char, k.meaning, k.reading, k.url)
 
 
+@dataclass(frozen=True)
+class Command:
+    name: str
+    handler: Callable[["Dispatcher", str, int, int], None]
+    aliases: tuple[str, ...] = ()
+    # "cheap": local only, "upstream": calls an API, "llm" and "heavy" are
+    # slow and share config.SLOW_COMMAND_WORKERS slots
+    cost: str = "upstream"
+    # seconds, slower runs are logged
+    timeout: float = 10
+
+
+def command(
+    aliases: tuple[str, ...] = (),
+    cost: str = "upstream",
+    timeout: float = 10,
+) -> Callable:
+    """Attaches routing metadata to a `Dispatcher.dispatch_*` method."""
+
+    def decorate(func: Callable) -> Callable:
+        func.command_meta = {  # type: ignore[attr-defined]
+            "aliases": aliases,
+            "cost": cost,
+            "timeout": timeout,
+        }
+        return func
+
+    return decorate
+
+
+def build_registry(cls: type) -> dict[str, Command]:
+    """Maps every command name and alias of `cls` to its Command."""
+    registry: dict[str, Command] = {}
+    for attr, func in vars(cls).items():
+        if not attr.startswith("dispatch_"):
+            continue
+        cmd = Command(
+            name=attr.removeprefix("dispatch_"),
+            handler=func,
+            **getattr(func, "command_meta", {}),
+        )
+        for name in (cmd.name, *cmd.aliases):
+            if name in registry:
+                raise ValueError(f"Command {name} registered twice")
+            registry[name] = cmd
+    return registry
+
+
 class Dispatcher:
-    def __init__(self, session: requests.Session) -> None:
+    def __init__(self, session: upstream.UpstreamClient) -> None:
         self.session = session
+        # slow commands may not hold every dispatch worker
+        self.slow_slots = threading.BoundedSemaphore(config.SLOW_COMMAND_WORKERS)
 
+    @command()
     def dispatch_uds(self, text: str, chat_id: int, from_id: int) -> None:
         _uds, keyword = text.split(" ", 1)
 
         try:
-            result = uds.urbandictionary(keyword)
+            result = urbandictionary(keyword, owner=from_id)
             url, meanings = result["url"], result["means"]
 
+        except lookups.NotFound:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"No UrbanDictionary result for `{keyword}`",
+            )
         except Exception:
             logger.exception(keyword)
         else:
@@ -321,16 +353,23 @@ class Dispatcher:
             )
             logger.info("UDS: served keyword %s", keyword)
 
+    @command()
     def dispatch_cam(self, text: str, chat_id: int, from_id: int) -> None:
         _cam, keyword = text.split(" ", 1)
 
         try:
-            result = uds.cambridge(keyword)
+            result = cambridge(keyword, owner=from_id)
             url, ipa, meanings = (
                 result["url"],
                 result["ipa"],
                 result["means"],
             )
+        except lookups.NotFound:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"No Cambridge result for `{keyword}`",
+            )
         except Exception:
             logger.exception(keyword)
         else:
@@ -343,46 +382,36 @@ class Dispatcher:
             logger.info("UDS: served cam keyword %s", keyword)
 
     def dispatch_hi(self, text: str, chat_id: int, from_id: int) -> None:
-        if not API_TEMP:
+        if not weather.API_KEY:
             send_message(
                 session=self.session,
                 chat_id=chat_id,
                 text="To show weather data, you need a key api and set `WEATHER_TOKEN` env, go to https://openweathermap.org/api to get one.",
             )
         else:
-            cities = ["Ho Chi Minh", "Hanoi"]
-            temp_cities = get_temp(cities)
-            for temp in temp_cities:
-                send_message(
-                    session=self.session,
-                    chat_id=chat_id,
-                    text=f"Weather in {temp['name']} is {temp['weather']}, temp now: {temp['temp_now']}, feels like: {temp['feels_like']}, humidity:  {temp['humidity']}%",
-                )
-                logger.info("Temp: served city %s", temp["name"])
-            city = "hcm&hn"
-
-            location, value, utime = get_aqi_hcm()
-            if location is not None or value is not None or utime is not None:
-                send_message(
-                    session=self.session,
-                    chat_id=chat_id,
-                    text=f"PM2.5 {value} at {location} at {utime}",
-                )
-            else:
-                send_message(
-                    session=self.session,
-                    chat_id=chat_id,
-                    text="No AQI available for Ho Chi Minh City",
-                )
-
-            location, value, utime = get_aqi_hanoi()
-            send_message(
-                session=self.session,
-                chat_id=chat_id,
-                text=f"PM2.5 {value} at {location} at {utime}",
+            cities = weather.get_service().chat_cities(chat_id)
+            # independent upstreams, the reply waits for the slowest only
+            results = fanout.fan_out(
+                {
+                    "temp": functools.partial(get_temp, cities),
+                    "hcm": functools.partial(aqi.snapshot, "hcm"),
+                    "hanoi": functools.partial(aqi.snapshot, "hanoi"),
+                }
             )
-            logger.info("AQI: served city %s", city)
-
+            with Reply(self.session, chat_id) as reply:
+                if results["temp"].ok:
+                    for temp in results["temp"].value:
+                        reply.add(weather.format_temp(temp))
+                        logger.info("Temp: served city %s", temp["name"])
+                else:
+                    reply.add(f"Weather: {results['temp'].status()}")
+                city = "hcm&hn"
+
+                reply.add(format_aqi(results["hcm"], "hcm"))
+                reply.add(format_aqi(results["hanoi"], "hanoi"))
+                logger.info("AQI: served city %s", city)
+
+    @command(cost="cheap")
     def dispatch_jo(self, text: str, chat_id: int, from_id: int) -> None:
         parts = text.split(" ")
         if len(parts) == 2:
@@ -401,16 +430,23 @@ class Dispatcher:
             logger.info("Get joyo kanji grade: %d #%d", grade, nth)
         send_message(session=self.session, chat_id=chat_id, text=kanji(grade, int(nth)))
 
+    @command()
     def dispatch_fr(self, text: str, chat_id: int, from_id: int) -> None:
         _cam, keyword = text.split(" ", 1)
 
         try:
-            result = uds.cambridge_fr(keyword)
+            result = cambridge_fr(keyword, owner=from_id)
             url, ipa, meanings = (
                 result["url"],
                 result["ipa"],
                 result["means"],
             )
+        except lookups.NotFound:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"No Cambridge result for `{keyword}`",
+            )
         except Exception:
             logger.exception(keyword)
         else:
@@ -422,12 +458,19 @@ class Dispatcher:
             )
             logger.info("UDS: served camfr keyword %s", keyword)
 
+    @command(cost="llm", timeout=60)
     def dispatch_jk(self, text: str, chat_id: int, from_id: int) -> None:
+        import llm
+
         msg = llm.gen_joke()
         send_message(session=self.session, chat_id=chat_id, text=msg[:300])
         logger.info("served a joke")
 
+    @command(cost="llm", timeout=60)
     def dispatch_nikkei(self, text: str, chat_id: int, from_id: int) -> None:
+        import jp_podcast
+        import llm
+
         episodes = jp_podcast.get_latest_podcast_episodes()
         latest = episodes[0]
 
@@ -435,22 +478,32 @@ class Dispatcher:
         send_message(session=self.session, chat_id=chat_id, text=f"{msg}\n{latest.url}")
         logger.info("served nikkeime")
 
+    @command(cost="llm", timeout=60)
     def dispatch_lt(self, text: str, chat_id: int, from_id: int) -> None:
+        import llm
+
         _lt, keyword = text.split(" ", 1)
         msg = llm.translate(keyword)
         send_message(session=self.session, chat_id=chat_id, text=msg[:300])
         logger.info(f"LLM translated {text}")
 
+    @command(aliases=("jisho",))
     def dispatch_ji(self, text: str, chat_id: int, from_id: int) -> None:
         _cam, keyword = text.split(" ", 1)
 
         try:
-            result = jp_dict.search_jisho(keyword)
+            result = jp_dict.search_jisho(keyword, owner=from_id)
             url, ipa, meanings = (
                 result["url"],
                 result["reading"],
                 result["means"],
             )
+        except lookups.NotFound:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"No Jisho result for `{keyword}`",
+            )
         except Exception:
             logger.exception(keyword)
         else:
@@ -463,86 +516,141 @@ class Dispatcher:
             logger.info("Jisho: served ji keyword %s", keyword)
 
     def dispatch_aqi(self, text: str, chat_id: int, from_id: int) -> None:
-        city = "hn&hcm&jp"
-        location, value, utime = get_aqi_hanoi()
-        send_message(
-            session=self.session,
-            chat_id=chat_id,
-            text=f"PM2.5 {value} at {location} at {utime}",
-        )
+        name = text.split(" ", 1)[1].strip() if " " in text else ""
+        if name:
+            self._aqi_place(name, chat_id)
+            return
 
-        location, value, utime = get_aqi_hcm()
-        send_message(
-            session=self.session,
-            chat_id=chat_id,
-            text=f"PM2.5 {value} at {location} at {utime}",
+        city = "hn&hcm&jp"
+        # read from the refresher's snapshots, WAQI is only hit without one
+        results = fanout.fan_out(
+            {region: functools.partial(aqi.snapshot, region) for region in aqi.REGIONS}
         )
+        with Reply(self.session, chat_id) as reply:
+            for region, result in results.items():
+                reply.add(format_aqi(result, region))
 
         logger.info("AQI: served city %s", city)
 
+    def _aqi_place(self, name: str, chat_id: int) -> None:
+        place = geo.find_place(name)
+        if place is None:
+            suggestions = geo.suggest_places(name)
+            hint = f", did you mean {', '.join(suggestions)}?" if suggestions else ""
+            send_message(self.session, chat_id, f"Unknown place {name}{hint}")
+            return
+
+        found = aqi.nearby(place)
+        worst = aqi.worst_station([station for _distance, station in found])
+        nearest = next(
+            ((d, station) for d, station in found if station.aqi is not None), None
+        )
+        with Reply(self.session, chat_id) as reply:
+            if worst is None or nearest is None:
+                reply.add(
+                    f"No AQI available within {aqi.PLACE_RADIUS_KM} km of {place.name}"
+                )
+                return
+            distance, station = nearest
+            reply.add(
+                f"PM2.5 {station.aqi} at {station.name} at {station.updated}, {distance:.1f} km from {place.name}"
+            )
+            if worst is not station:
+                reply.add(f"Worst nearby: PM2.5 {worst.aqi} at {worst.name}")
+        logger.info("AQI: served place %s", place.name)
+
+    @command(aliases=("weather",))
     def dispatch_tem(self, text: str, chat_id: int, from_id: int) -> None:
-        if not API_TEMP:
+        if not weather.API_KEY:
             send_message(
                 session=self.session,
                 chat_id=chat_id,
                 text="To show weather data, you need a key api and set `WEATHER_TOKEN` env, go to https://openweathermap.org/api to get one.",
             )
+            return
+
+        service = weather.get_service()
+        args = text.split(" ", 1)[1].strip() if " " in text else ""
+        action, _, rest = args.partition(" ")
+        if action == "set":
+            cities = weather.parse_cities(rest)[: weather.MAX_CHAT_CITIES]
+        elif action == "reset":
+            service.set_chat_cities(chat_id, [])
+            cities = service.chat_cities(chat_id)
+        elif args:
+            # one off lookup, the chat's list is kept
+            cities = weather.parse_cities(args)[: weather.MAX_CHAT_CITIES]
         else:
-            cities = ["Ho Chi Minh", "Hanoi"]
-            temp_cities = get_temp(cities)
-            for temp in temp_cities:
-                send_message(
-                    session=self.session,
-                    chat_id=chat_id,
-                    text=f"Weather in {temp['name']} is {temp['weather']}, temp now: {temp['temp_now']}, feels like: {temp['feels_like']}, humidity:  {temp['humidity']}%",
-                )
-                logger.info("Temp: served city %s", temp["name"])
+            cities = service.chat_cities(chat_id)
 
+        temps, unknown = service.get_weather(cities) if cities else ([], [])
+        with Reply(self.session, chat_id, empty="Weather unavailable") as reply:
+            for temp in temps:
+                reply.add(weather.format_temp(temp))
+                logger.info("Temp: served city %s", temp["name"])
+            for name in unknown:
+                reply.add(f"Unknown city: {name}")
+            if action == "set":
+                # unknown names are not saved, none known keeps the list
+                known = [name for name in cities if name not in unknown]
+                if known:
+                    service.set_chat_cities(chat_id, known)
+                    logger.info("Temp: chat %s cities set to %s", chat_id, known)
+                else:
+                    reply.add(TEM_USAGE)
+
+    @command(aliases=("price",))
     def dispatch_btc(self, text: str, chat_id: int, from_id: int) -> None:
-        try:
-            code = text.split(" ")[1].lower()
-        except IndexError:
-            code = "btc"
+        codes = [code.lower() for code in text.split()[1:]] or ["btc"]
+        coin_ids = {}
+        unknown = []
+        for code in dict.fromkeys(codes[: prices.MAX_COINS]):
+            try:
+                coin_ids[code] = _get_coin_name(code)
+            except KeyError:
+                unknown.append(code)
 
-        try:
-            coin_code = _get_coin_name(code)
-        except KeyError:
-            send_message(
-                session=self.session,
-                chat_id=chat_id,
-                text="Try coin in list:[btc, eth, usdt, bnb, ada, doge, xrp, ltc, link, xlm]",
-            )
-        else:
-            prices_data = get_price_btc(coin_code)
-            send_message(
-                session=self.session,
-                chat_id=chat_id,
-                text=f"""{coin_code.upper()} ${prices_data["price_usd"]}
-    Cap ${round(prices_data["market_cap_usd"] / 1000000000, 1)}B
-    24h {round(prices_data["change_24h_percent"], 1)}% """,
-            )
+        if not coin_ids:
+            send_message(self.session, chat_id, _unknown_coin_text(unknown[0]))
+            return
 
-    def dispatch_c(self, text: str, chat_id: int, from_id: int) -> None:
         try:
-            code = text.split(" ")[1].lower()
-        except IndexError:
-            code = "btc"
+            quotes = prices.get_quotes(list(dict.fromkeys(coin_ids.values())))
+        except requests.exceptions.RequestException as e:
+            send_message(self.session, chat_id, f"Price unavailable: {e}")
+            return
 
-        try:
-            coin_code = _get_coin_name(code)
-        except KeyError:
-            send_message(
-                session=self.session,
-                chat_id=chat_id,
-                text="Try coin in list:[btc, eth, usdt, bnb, ada, doge, xrp, ltc, link, xlm]",
-            )
+        with Reply(self.session, chat_id, empty="Price unavailable") as reply:
+            for coin_code in coin_ids.values():
+                if coin_code in quotes:
+                    reply.add(prices.format_quote(coin_code, quotes[coin_code]))
+            if unknown:
+                reply.add(f"Unknown coins: {', '.join(unknown)}")
+
+    @command(aliases=("chart",), cost="heavy", timeout=60)
+    def dispatch_c(self, text: str, chat_id: int, from_id: int) -> None:
+        args = text.split()[1:]
+        window = chart.parse_window(args[-1]) if args else None
+        if window:
+            args.pop()
+        days = window or chart.DAYS
+        codes = [code.lower() for code in args] or ["btc"]
+
+        coin_codes = []
+        for code in codes:
+            try:
+                coin_codes.append(_get_coin_name(code))
+            except KeyError:
+                send_message(self.session, chat_id, _unknown_coin_text(code))
+                return
+        coin_codes = list(dict.fromkeys(coin_codes))[: chart.MAX_COMPARE]
 
         try:
-            create_chart(coin_code)
-            imgfile = "/tmp/chartimage.png"
-            with open(imgfile, "rb") as f:
-                send_photo(chat_id, f)
-            logger.info("Get price of %s", coin_code)
+            if len(coin_codes) == 1:
+                send_chart(chat_id, coin_codes[0], days)
+            else:
+                send_comparison(chat_id, coin_codes, days)
+            logger.info("Get price of %s", ", ".join(coin_codes))
         except Exception as e:
             send_message(
                 session=self.session,
@@ -550,14 +658,64 @@ class Dispatcher:
                 text=f"Create chart failed with error: {e}, {type(e)}",
             )
 
+    @command()
     def dispatch_aoc(self, text: str, chat_id: int, from_id: int) -> None:
+        args = text.split()[1:]
+        service = aoc.get_service()
+        if args and args[0] in ("add", "del"):
+            self._aoc_board(args, chat_id)
+            return
+
+        boards = service.chat_boards(chat_id)
+        topn = int(args[0]) if args and args[0].isdigit() else 10
+        calls: dict[str, Callable[[], object]]
+        if args and args[0] == "changes":
+            calls = {
+                f"{year}/{board_id}": functools.partial(
+                    service.changes, chat_id, year, board_id
+                )
+                for year, board_id in boards
+            }
+        else:
+            calls = {
+                f"{year}/{board_id}": functools.partial(
+                    service.scoreboard, year, board_id
+                )
+                for year, board_id in boards
+            }
+
+        parts = []
+        for name, result in fanout.fan_out(calls).items():
+            if not result.ok:
+                parts.append(f"AoC {name}: {result.status()}")
+            elif isinstance(result.value, aoc.Scoreboard):
+                parts.append(aoc.format_board(result.value, topn))
+            else:
+                board, changes = result.value
+                if changes is None:
+                    parts.append(f"{aoc.board_title(board)}: watching for changes")
+                elif changes:
+                    parts.append(aoc.format_changes(board, changes))
+        # a cron job posts nothing when nothing changed
+        if parts:
+            send_message(session=self.session, chat_id=chat_id, text="\n\n".join(parts))
+
+    def _aoc_board(self, args: list[str], chat_id: int) -> None:
+        service = aoc.get_service()
         try:
-            _cmd, topn_str = text.split(" ", 1)
-            topn = int(topn_str)
-        except Exception:
-            topn = 10
-        send_message(session=self.session, chat_id=chat_id, text=aoc21(topn))
+            year, board_id = int(args[1]), int(args[2])
+            if args[0] == "add":
+                service.add_board(chat_id, year, board_id)
+                text = f"Following AoC {year} board {board_id}"
+            elif service.remove_board(chat_id, year, board_id):
+                text = f"Stopped following AoC {year} board {board_id}"
+            else:
+                text = f"Not following AoC {year} board {board_id}"
+        except (IndexError, ValueError) as e:
+            text = f"Usage: /aoc add|del <year> <board id> ({e})"
+        send_message(session=self.session, chat_id=chat_id, text=text)
 
+    @command(aliases=("addcron",), cost="cheap")
     def dispatch_cron(self, text: str, chat_id: int, from_id: int) -> None:
         try:
             job_uuid = cronjob.add_job(text, chat_id, from_id)
@@ -574,6 +732,7 @@ class Dispatcher:
                 text=f"Cron job added successfully! To delete this job: /delcron {job_uuid}",
             )
 
+    @command(cost="cheap")
     def dispatch_delcron(self, text: str, chat_id: int, from_id: int) -> None:
         try:
             cronjob.del_job(text, chat_id, from_id)
@@ -590,6 +749,7 @@ class Dispatcher:
                 text="Cron job deleted successfully!",
             )
 
+    @command(cost="cheap")
     def dispatch_listcron(self, text: str, chat_id: int, from_id: int) -> None:
         try:
             jobs = cronjob.list_job(text, chat_id, from_id)
@@ -609,7 +769,65 @@ class Dispatcher:
                 text=jobs_str,
             )
 
+    @command(cost="cheap")
+    def dispatch_alert(self, text: str, chat_id: int, from_id: int) -> None:
+        if len(text.split()) == 1:
+            self.dispatch_listalert(text, chat_id, from_id)
+            return
+        try:
+            alert = alerts.add_alert(text, chat_id, from_id)
+        except Exception as e:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"Add alert failed with error: {e}, {type(e)}",
+            )
+        else:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"Alert {alert.describe()} added! To delete it: /delalert {alert.uuid}",
+            )
+
+    @command(cost="cheap")
+    def dispatch_delalert(self, text: str, chat_id: int, from_id: int) -> None:
+        try:
+            deleted = alerts.del_alert(text, chat_id, from_id)
+        except Exception as e:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"Delete alert failed with error: {e}, {type(e)}",
+            )
+        else:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text="Alert deleted successfully!" if deleted else "No such alert",
+            )
+
+    @command(aliases=("alerts",), cost="cheap")
+    def dispatch_listalert(self, text: str, chat_id: int, from_id: int) -> None:
+        try:
+            found = alerts.list_alerts(from_id)
+        except Exception as e:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text=f"List alerts failed with error: {e}, {type(e)}",
+            )
+        else:
+            send_message(
+                session=self.session,
+                chat_id=chat_id,
+                text="\n".join(f"{a.uuid} - {a.describe()}" for a in found)
+                or "No alerts",
+            )
+
+    @command(cost="llm", timeout=60)
     def dispatch_x(self, text: str, chat_id: int, from_id: int) -> None:
+        import llm
+
         _x, *cmd = text.split(" ")
 
         self.dispatch(" ".join(cmd), chat_id, from_id)
@@ -619,16 +837,68 @@ class Dispatcher:
         send_message(session=self.session, chat_id=chat_id, text=msg[:300])
         logger.info(f"LLM x {text}")
 
+    def prefetch(self, texts: list[str]) -> None:
+        """Warms the cache for a batch of commands, e.g. the due cron jobs.
+
+        The prices of every /btc among them are fetched in one call, the
+        commands then run on cached quotes.
+        """
+        coin_ids = set()
+        for text in texts:
+            cmd, *codes = text.split() or [""]
+            pure_cmd = cmd.lstrip("/").partition("@")[0]
+            command = COMMANDS.get(pure_cmd)
+            if command is None or command.name != "btc":
+                continue
+            for code in codes or ["btc"]:
+                try:
+                    coin_ids.add(_get_coin_name(code.lower()))
+                except KeyError:
+                    pass
+        if coin_ids:
+            try:
+                prices.get_quotes(sorted(coin_ids))
+            except requests.exceptions.RequestException:
+                logger.exception("Prefetching prices failed")
+
     def dispatch(self, text: str, chat_id: int, from_id: int) -> None:
         if not text or not text.strip():
             logger.warn("Received empty message, skipping")
             return
 
         cmd, *_ = text.split()
-        pure_cmd = cmd.strip().lstrip("/")
-        func = getattr(self, f"dispatch_{pure_cmd}", print)
-        if func is None:
-            logger.warn(f"dispatch_{pure_cmd} method not exist, skip from {text}")
+        # in groups commands may be addressed to a bot: /cmd@botname
+        pure_cmd, _, botname = cmd.lstrip("/").partition("@")
+        if botname and config.BOT_USERNAME and botname != config.BOT_USERNAME:
+            return
+        command = COMMANDS.get(pure_cmd)
+        if command is None:
+            logger.debug("Unknown command %s, skip from %s", pure_cmd, text)
             return
-        logger.info(f"dispatching {func.__name__} from {text}")
-        func(text, chat_id, from_id)
+        if botname:
+            # handlers parse the text as /cmd args
+            text = f"/{pure_cmd}{text[len(cmd) :]}"
+
+        slow = command.cost in SLOW_COSTS
+        if slow and not self.slow_slots.acquire(blocking=False):
+            logger.info("Command %s refused, no slow slot left", command.name)
+            send_message(self.session, chat_id, f"Busy, try /{pure_cmd} again soon")
+            return
+        logger.info(f"dispatching {command.name} from {text}")
+        started = time.monotonic()
+        try:
+            command.handler(self, text, chat_id, from_id)
+        finally:
+            if slow:
+                self.slow_slots.release()
+        elapsed = time.monotonic() - started
+        if elapsed > command.timeout:
+            logger.warning(
+                "Command %s took %.1fs, over its %ss budget",
+                command.name,
+                elapsed,
+                command.timeout,
+            )
+
+
+COMMANDS = build_registry(Dispatcher)
@@ -3,4 +3,30 @@ import os
 
 BOT_TOKEN: str = os.environ["BOT_TOKEN"]
 TELEGRAM_BASE_URL: str = f"https://api.telegram.org/bot{BOT_TOKEN}/"
-OFFSET_FILE: str = "/tmp/uds_telegrambot_offset"
+# commands addressed to another bot, /cmd@otherbot, are ignored when set
+BOT_USERNAME: str = os.environ.get("BOT_USERNAME", "")
+# received updates are queued here before dispatch, replayed after a crash
+QUEUE_DB_FILE: str = "/tmp/uds_telegrambot_updates.db"
+
+# getUpdates long polling https://core.telegram.org/bots/api#getupdates
+POLL_TIMEOUT: int = int(os.environ.get("POLL_TIMEOUT", "50"))
+POLL_LIMIT: int = 100
+ALLOWED_UPDATES: list[str] = ["message"]
+
+# seconds between cron ticks, cron jobs are scheduled with minute precision
+CRON_INTERVAL: int = 60
+
+# updates from different chats are dispatched in parallel by this many threads
+DISPATCH_WORKERS: int = int(os.environ.get("DISPATCH_WORKERS", "8"))
+# of those, at most this many run "heavy" or "llm" commands at once
+SLOW_COMMAND_WORKERS: int = int(os.environ.get("SLOW_COMMAND_WORKERS", "4"))
+
+# set WEBHOOK_URL to receive updates by webhook instead of getUpdates polling,
+# the local server is expected to sit behind an HTTPS reverse proxy
+WEBHOOK_URL: str = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_SECRET: str | None = os.environ.get("WEBHOOK_SECRET")
+WEBHOOK_HOST: str = os.environ.get("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT: int = int(os.environ.get("WEBHOOK_PORT", "8080"))
+
+# worker processes rendering charts, 0 renders in the bot process
+RENDER_WORKERS: int = int(os.environ.get("RENDER_WORKERS", "1"))
@@ -2,23 +2,19 @@ import datetime
 import uuid
 import sqlite3
 import json
+import logging
 import re
-import yaml
+import threading
 from dataclasses import dataclass
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 
-from cronjob_config import Config
+if TYPE_CHECKING:
+    from cronjob_config import Config
 
-# Load and validate config
-with open("config.yaml", "r") as f:
-    config_data = yaml.safe_load(f)
-    config = Config.model_validate(config_data)
+logger = logging.getLogger()
 
-# Now you can access with proper typing
-if config.storage.backend == "sql":
-    DB_FILE = config.storage.database_file
-else:
-    JSON_FILE = config.storage.file_path
+CONFIG_FILE = "config.yaml"
 
 MAX_JOBS_PER_OWNER = 10
 
@@ -218,10 +214,35 @@ class JSONStorage(Storage):
             return [j for j in jobs if j["hour"] == hour and j["minute"] == minute]
 
 
-# Initialize storage based on config
-storage = (
-    SQLStorage(DB_FILE) if config.storage.backend == "sql" else JSONStorage(JSON_FILE)
-)
+# Initialized on first use, reading config and opening the db is not free
+storage: Storage | None = None
+_storage_lock = threading.Lock()
+
+
+def load_config(config_file: str = CONFIG_FILE) -> "Config":
+    """The validated storage config, shared by cron jobs and alerts."""
+    import yaml
+    from cronjob_config import Config
+
+    with open(config_file, "r") as f:
+        return Config.model_validate(yaml.safe_load(f))
+
+
+def init_storage(config_file: str = CONFIG_FILE) -> Storage:
+    """Builds the storage backend chosen in the config file."""
+    config = load_config(config_file)
+    if config.storage.backend == "sql":
+        return SQLStorage(config.storage.database_file)
+    return JSONStorage(config.storage.file_path)
+
+
+def get_storage() -> Storage:
+    """The configured storage, created on first use."""
+    global storage
+    with _storage_lock:
+        if storage is None:
+            storage = init_storage()
+        return storage
 
 
 @dataclass
@@ -256,7 +277,7 @@ def add_job(text: str, chat_id: int, owner: int) -> str:
     """Adds a new cron job to storage."""
     command, hour, minute = parse_job(text)
     job_uuid = str(uuid.uuid4())
-    storage.add_job(job_uuid, chat_id, owner, hour, minute, command)
+    get_storage().add_job(job_uuid, chat_id, owner, hour, minute, command)
     return job_uuid
 
 
@@ -266,23 +287,33 @@ def del_job(text: str, chat_id: int, owner: int) -> bool:
     if len(parts) != 2 or not parts[1]:
         raise ValueError("Invalid delete format. Expected '/delcron UUID'")
     job_uuid = parts[1].strip()
-    return storage.del_job(job_uuid, owner)
+    return get_storage().del_job(job_uuid, owner)
 
 
 def list_job(text: str, chat_id: int, owner: int) -> list[Job]:
     """Lists all cron jobs for a specific owner as Job objects."""
-    jobs_data = storage.list_jobs(owner)
+    jobs_data = get_storage().list_jobs(owner)
     return [Job(**job) for job in jobs_data]
 
 
-def run_cron(dispatch_func):
-    """Fetches and runs due cron jobs."""
+def run_cron(dispatch_func, prefetch_func=None):
+    """Fetches and runs due cron jobs.
+
+    `prefetch_func` gets the commands about to run, so their upstream data
+    can be fetched in batches first.
+    """
     now = datetime.datetime.now(datetime.UTC)
     current_hour = now.hour
     current_minute = now.minute
 
-    jobs_data = storage.get_due_jobs(current_hour, current_minute)
+    jobs_data = get_storage().get_due_jobs(current_hour, current_minute)
     jobs_to_run = [Job(**job) for job in jobs_data]
+    if prefetch_func is not None and jobs_to_run:
+        try:
+            prefetch_func([job.command for job in jobs_to_run])
+        except Exception:
+            # the jobs fetch what they need themselves
+            logger.exception("Cron prefetch failed")
 
     for job in jobs_to_run:
         # Avoid running cron management commands themselves if scheduled
@@ -290,7 +321,16 @@ def run_cron(dispatch_func):
         try:
             first_command_part = job.command.split()[0].lstrip("/")
             # List of commands that should not be executed by the cron runner itself
-            management_commands = {"cron", "addcron", "delcron", "listcron"}
+            management_commands = {
+                "cron",
+                "addcron",
+                "delcron",
+                "listcron",
+                "alert",
+                "delalert",
+                "listalert",
+                "alerts",
+            }
             if first_command_part in management_commands:
                 continue
         except IndexError:
@@ -10,6 +10,7 @@ class SqlStorage(BaseModel):
 class JsonStorage(BaseModel):
     backend: Literal["json"]
     file_path: str
+    alerts_file_path: str = "alerts.json"
 
 
 class Config(BaseModel):
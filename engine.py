@@ -0,0 +1,96 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+logger = logging.getLogger()
+
+
+def chat_key(update: dict) -> int:
+    """Updates sharing a key are run one after another, in order."""
+    try:
+        return update["message"]["chat"]["id"]
+    except KeyError:
+        # no chat to keep in order with, run it on its own lane
+        return update["update_id"]
+
+
+class DispatchEngine:
+    """Runs updates from different chats in parallel on a thread pool.
+
+    Updates of the same chat are queued on a per-chat lane and run in the
+    order they were submitted. The committed offset only moves past an
+    update when it and every update submitted before it have finished,
+    so a restart from the committed offset never skips unfinished work.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[dict], None],
+        max_workers: int = 8,
+        max_pending: int = 1000,
+        on_commit: Callable[[int], None] | None = None,
+    ) -> None:
+        self.handler = handler
+        self.max_pending = max_pending
+        self.on_commit = on_commit
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="dispatch"
+        )
+        self.cond = threading.Condition()
+        self.lanes: dict[int, deque[dict]] = {}
+        # submitted update ids, oldest first, and the finished subset of them
+        self.inflight: deque[int] = deque()
+        self.finished: set[int] = set()
+        self.committed: int | None = None
+
+    def submit(self, update: dict) -> None:
+        key = chat_key(update)
+        with self.cond:
+            # backpressure: stop taking updates when workers are far behind
+            while len(self.inflight) >= self.max_pending:
+                self.cond.wait()
+            self.inflight.append(update["update_id"])
+            lane = self.lanes.get(key)
+            if lane is not None:
+                lane.append(update)
+                return
+            self.lanes[key] = deque([update])
+        self.executor.submit(self._drain, key)
+
+    def _drain(self, key: int) -> None:
+        while True:
+            with self.cond:
+                lane = self.lanes[key]
+                if not lane:
+                    del self.lanes[key]
+                    return
+                update = lane[0]
+            try:
+                self.handler(update)
+            except Exception:
+                logger.exception("Failed to process update %s", update["update_id"])
+            with self.cond:
+                lane.popleft()
+                self._finish(update["update_id"])
+
+    def _finish(self, update_id: int) -> None:
+        self.finished.add(update_id)
+        committed = None
+        while self.inflight and self.inflight[0] in self.finished:
+            committed = self.inflight.popleft()
+            self.finished.remove(committed)
+        if committed is not None:
+            self.committed = committed
+            if self.on_commit is not None:
+                self.on_commit(committed)
+        self.cond.notify_all()
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until every submitted update has finished."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.inflight, timeout)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+# seconds a command waits for its upstream calls, slower ones are dropped
+DEADLINE = 8.0
+
+
+@dataclass
+class Result:
+    value: Any = None
+    error: BaseException | None = None
+    timed_out: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out
+
+    def status(self) -> str:
+        if self.timed_out:
+            return "timed out"
+        if self.error is not None:
+            return f"failed ({type(self.error).__name__})"
+        return "ok"
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fanout")
+        return _executor
+
+
+def fan_out(
+    calls: dict[str, Callable[[], Any]], timeout: float = DEADLINE
+) -> dict[str, Result]:
+    """Runs independent calls concurrently, waits at most `timeout` for all.
+
+    Returns a Result per call name, in the order of `calls`. Calls still
+    running at the deadline are marked timed out and left to finish in the
+    background, their results are dropped.
+    """
+    executor = get_executor()
+    futures: dict[str, Future] = {
+        name: executor.submit(call) for name, call in calls.items()
+    }
+    done, _not_done = wait(futures.values(), timeout=timeout)
+
+    results = {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            results[name] = Result(timed_out=True)
+        elif future.exception() is not None:
+            results[name] = Result(error=future.exception())
+        else:
+            results[name] = Result(value=future.result())
+    return results
@@ -0,0 +1,181 @@
+import difflib
+import functools
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+import cache
+
+GAZETTEER_FILE = os.path.join(os.path.dirname(__file__), "gazetteer.json")
+EARTH_RADIUS_KM = 6371.0
+# ~28 km cells, a place query touches a handful of them
+CELL_DEGREES = 0.25
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounds_around(
+    lat: float, lon: float, radius_km: float
+) -> tuple[float, float, float, float]:
+    """(south, west, north, east) of a box enclosing the circle."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+class GridIndex:
+    """Points bucketed in a lat/lon grid, for radius queries.
+
+    A query only scans the cells overlapping its circle, so it stays fast as
+    points are added. Items need `lat` and `lon` attributes, adding an item
+    with the key of an indexed one replaces it, items not added again for
+    `max_age` seconds are dropped. Each cell remembers when its whole area
+    was last fetched, so callers know when the index is too old.
+    """
+
+    def __init__(
+        self, cell_degrees: float = CELL_DEGREES, max_age: float | None = None
+    ) -> None:
+        self.cell_degrees = cell_degrees
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # cell: {key: (added at, item)}
+        self.cells: dict[tuple[int, int], dict[Any, tuple[float, Any]]] = {}
+        self.refreshed: dict[tuple[int, int], float] = {}
+
+    def __len__(self) -> int:
+        with self.lock:
+            return sum(len(items) for items in self.cells.values())
+
+    def cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return (
+            math.floor(lat / self.cell_degrees),
+            math.floor(lon / self.cell_degrees),
+        )
+
+    def _cells_in(
+        self, south: float, west: float, north: float, east: float
+    ) -> Iterator[tuple[int, int]]:
+        row0, col0 = self.cell(south, west)
+        row1, col1 = self.cell(north, east)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                yield row, col
+
+    def cover(
+        self, bounds: tuple[float, float, float, float]
+    ) -> tuple[float, float, float, float]:
+        """`bounds` grown to the edges of the cells it overlaps."""
+        south, west, north, east = bounds
+        d = self.cell_degrees
+        return (
+            math.floor(south / d) * d,
+            math.floor(west / d) * d,
+            (math.floor(north / d) + 1) * d,
+            (math.floor(east / d) + 1) * d,
+        )
+
+    def add_all(self, items: dict[Any, Any], at: float | None = None) -> None:
+        at = time.time() if at is None else at
+        with self.lock:
+            for key, item in items.items():
+                cell = self.cell(item.lat, item.lon)
+                self.cells.setdefault(cell, {})[key] = (at, item)
+            if self.max_age is not None:
+                self._drop_before(at - self.max_age)
+
+    def _drop_before(self, oldest: float) -> None:
+        for cell in list(self.cells):
+            items = self.cells[cell]
+            for key in [k for k, (added, _item) in items.items() if added < oldest]:
+                del items[key]
+            if not items:
+                del self.cells[cell]
+
+    def mark_refreshed(
+        self, bounds: tuple[float, float, float, float], at: float
+    ) -> None:
+        """Marks the cells `bounds` fully contains as fetched at `at`."""
+        south, west, north, east = bounds
+        d = self.cell_degrees
+        with self.lock:
+            for row in range(math.ceil(south / d), math.floor(north / d)):
+                for col in range(math.ceil(west / d), math.floor(east / d)):
+                    self.refreshed[row, col] = at
+
+    def refreshed_at(self, bounds: tuple[float, float, float, float]) -> float:
+        """When the least recently fetched cell of `bounds` was fetched, 0 if never."""
+        south, west, north, east = bounds
+        d = self.cell_degrees
+        # cells the box only touches at an edge hold none of it
+        rows = range(
+            math.floor(south / d), max(math.ceil(north / d), 1 + math.floor(south / d))
+        )
+        cols = range(
+            math.floor(west / d), max(math.ceil(east / d), 1 + math.floor(west / d))
+        )
+        with self.lock:
+            return min(
+                (self.refreshed.get((row, col), 0.0) for row in rows for col in cols),
+                default=0.0,
+            )
+
+    def within(
+        self, lat: float, lon: float, radius_km: float
+    ) -> list[tuple[float, Any]]:
+        """(distance km, item) of the items within `radius_km`, nearest first."""
+        found = []
+        oldest = -math.inf if self.max_age is None else time.time() - self.max_age
+        with self.lock:
+            for cell in self._cells_in(*bounds_around(lat, lon, radius_km)):
+                for added, item in self.cells.get(cell, {}).values():
+                    if added < oldest:
+                        continue
+                    distance = haversine_km(lat, lon, item.lat, item.lon)
+                    if distance <= radius_km:
+                        found.append((distance, item))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+@dataclass
+class Place:
+    name: str
+    lat: float
+    lon: float
+
+
+@functools.cache
+def load_gazetteer(path: str = GAZETTEER_FILE) -> dict[str, Place]:
+    """Places by normalized name and alias, read once."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    places = {}
+    for entry in data:
+        place = Place(entry["name"], entry["lat"], entry["lon"])
+        for name in [entry["name"], *entry.get("aliases", [])]:
+            places[cache.keyword_key(name)] = place
+    return places
+
+
+def find_place(name: str) -> Place | None:
+    return load_gazetteer().get(cache.keyword_key(name))
+
+
+def suggest_places(name: str, n: int = 3) -> list[str]:
+    places = load_gazetteer()
+    matches = difflib.get_close_matches(cache.keyword_key(name), places, n=n)
+    return list(dict.fromkeys(places[m].name for m in matches))
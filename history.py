@@ -0,0 +1,224 @@
+import logging
+import sqlite3
+import threading
+import time
+
+import requests
+
+import singleflight
+import upstream
+
+logger = logging.getLogger()
+
+DB_FILE = "/tmp/uds_prices.db"
+RANGE_URL = "https://api.coingecko.com/api/v3/coins/{}/market_chart/range"
+# the free API serves a year of history
+MAX_DAYS = 365
+# raw samples are kept this long, daily candles forever
+RAW_RETENTION = 90 * 86400
+# a coin's tail is not fetched again sooner than this, in seconds
+MIN_REFRESH = 5 * 60
+# longest range CoinGecko answers with hourly samples, in seconds
+HOURLY_SPAN = 90 * 86400
+
+DAY_MS = 86400 * 1000
+
+
+def _fetch_chunk(coin: str, start: float, end: float) -> list[list[float]]:
+    resp = upstream.get(
+        RANGE_URL.format(coin),
+        params={"vs_currency": "usd", "from": int(start), "to": int(end)},
+        timeout=7,
+    )
+    resp.raise_for_status()
+    return resp.json()["prices"]
+
+
+def fetch_range(coin: str, start: float, end: float) -> list[list[float]]:
+    """[timestamp ms, price] samples of a coin between two unix times.
+
+    CoinGecko answers ranges over 90 days with daily points only, longer
+    ranges are fetched in chunks to keep hourly samples for the candles.
+    """
+    samples: list[list[float]] = []
+    while start < end:
+        chunk_end = min(start + HOURLY_SPAN, end)
+        samples.extend(_fetch_chunk(coin, start, chunk_end))
+        start = chunk_end
+    return samples
+
+
+class PriceHistory:
+    """Local SQLite store of CoinGecko prices with daily OHLC rollups.
+
+    Only the part of a window not stored yet is fetched: the tail since the
+    last stored sample, and the head when a longer window than before is
+    asked. The candles of the days a fetch touched are recomputed in SQL.
+    """
+
+    def __init__(self, db_file: str) -> None:
+        self.db_file = db_file
+        self.flights = singleflight.Group()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                coin TEXT,
+                ts INTEGER,
+                price REAL,
+                PRIMARY KEY (coin, ts)
+            ) WITHOUT ROWID
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS candles (
+                coin TEXT,
+                day TEXT,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                PRIMARY KEY (coin, day)
+            ) WITHOUT ROWID
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS coverage (
+                coin TEXT PRIMARY KEY,
+                first_ts INTEGER,
+                fetched_at REAL
+            )
+            """)
+
+    def _coverage(self, coin: str) -> tuple[int, float] | None:
+        with sqlite3.connect(self.db_file) as conn:
+            return conn.execute(
+                "SELECT first_ts, fetched_at FROM coverage WHERE coin = ?", (coin,)
+            ).fetchone()
+
+    def _last_ts(self, conn: sqlite3.Connection, coin: str) -> int | None:
+        return conn.execute(
+            "SELECT MAX(ts) FROM samples WHERE coin = ?", (coin,)
+        ).fetchone()[0]
+
+    def store(
+        self, coin: str, samples: list[list[float]], first_ts: int, now: float
+    ) -> None:
+        """Stores fetched samples and rolls up the days they fall in."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO samples (coin, ts, price) VALUES (?, ?, ?)",
+                [(coin, int(ts), price) for ts, price in samples],
+            )
+            if samples:
+                timestamps = [int(ts) for ts, _price in samples]
+                since = min(timestamps)
+                self._roll_up(conn, coin, since - since % DAY_MS, max(timestamps))
+            conn.execute(
+                "DELETE FROM samples WHERE coin = ? AND ts < ?",
+                (coin, int((now - RAW_RETENTION) * 1000)),
+            )
+            conn.execute(
+                """
+                INSERT INTO coverage (coin, first_ts, fetched_at) VALUES (?, ?, ?)
+                ON CONFLICT (coin) DO UPDATE SET
+                    first_ts = MIN(first_ts, excluded.first_ts),
+                    fetched_at = excluded.fetched_at
+                """,
+                (coin, first_ts, now),
+            )
+
+    def _roll_up(
+        self, conn: sqlite3.Connection, coin: str, since: int, until: int
+    ) -> None:
+        """Recomputes the candles of the days between two sample times.
+
+        Days that began before the raw retention cutoff lost samples to
+        pruning, their stored candles are kept and only missing ones added.
+        """
+        cutoff = int((time.time() - RAW_RETENTION) * 1000)
+        intact_since = time.strftime(
+            "%Y-%m-%d", time.gmtime(-(-cutoff // DAY_MS) * DAY_MS / 1000)
+        )
+        conn.execute(
+            """
+            INSERT INTO candles (coin, day, open, high, low, close)
+            SELECT g.coin, g.day,
+                (SELECT price FROM samples WHERE coin = g.coin AND ts = g.first_ts),
+                g.high, g.low,
+                (SELECT price FROM samples WHERE coin = g.coin AND ts = g.last_ts)
+            FROM (
+                SELECT coin, date(ts / 1000, 'unixepoch') AS day,
+                    MIN(ts) AS first_ts, MAX(ts) AS last_ts,
+                    MAX(price) AS high, MIN(price) AS low
+                FROM samples
+                WHERE coin = ? AND ts >= ? AND ts < ?
+                GROUP BY day
+            ) AS g
+            WHERE true
+            ON CONFLICT (coin, day) DO UPDATE SET
+                open = excluded.open,
+                high = excluded.high,
+                low = excluded.low,
+                close = excluded.close
+            WHERE excluded.day >= ?
+            """,
+            (coin, since, until - until % DAY_MS + DAY_MS, intact_since),
+        )
+
+    def update(self, coin: str, days: int) -> None:
+        """Fetches what the store lacks of the last `days` days."""
+        days = min(days, MAX_DAYS)
+        now = time.time()
+        start = now - days * 86400
+        coverage = self._coverage(coin)
+        if coverage is None:
+            self.store(coin, fetch_range(coin, start, now), int(start * 1000), now)
+            return
+
+        first_ts, fetched_at = coverage
+        if start * 1000 < first_ts - DAY_MS:
+            # a longer window than stored, fetch the missing head
+            head = fetch_range(coin, start, first_ts / 1000)
+            self.store(coin, head, int(start * 1000), fetched_at)
+        if now - fetched_at >= MIN_REFRESH:
+            with sqlite3.connect(self.db_file) as conn:
+                last_ts = self._last_ts(conn, coin)
+            since = last_ts / 1000 if last_ts else start
+            self.store(coin, fetch_range(coin, since, now), first_ts, now)
+
+    def candles(
+        self, coin: str, days: int
+    ) -> list[tuple[str, float, float, float, float]]:
+        """(day, open, high, low, close) of the last `days` days, oldest first."""
+        try:
+            # chats asking for one coin at once share the fetch
+            self.flights.do(f"{coin}:{days}", lambda: self.update(coin, days))
+        except requests.exceptions.RequestException:
+            logger.exception("History: updating %s failed, serving stored", coin)
+        since = time.strftime(
+            "%Y-%m-%d", time.gmtime(time.time() - min(days, MAX_DAYS) * 86400)
+        )
+        with sqlite3.connect(self.db_file) as conn:
+            return conn.execute(
+                """
+                SELECT day, open, high, low, close FROM candles
+                WHERE coin = ? AND day >= ? ORDER BY day
+                """,
+                (coin, since),
+            ).fetchall()
+
+
+_store: PriceHistory | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PriceHistory:
+    """The process wide price history, created on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PriceHistory(DB_FILE)
+        return _store
@@ -3,9 +3,13 @@ import json
 import time
 import sqlite3
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-import requests
-import requests_html
+import lookups
+import upstream
+
+if TYPE_CHECKING:
+    import requests_html
 
 
 # https://jisho.org/robots.txt
@@ -14,8 +18,11 @@ DELAY = 10
 NUMBER_OF_YOJO_WORDS = 2136
 
 
+@lookups.cached("jisho")
 def search_jisho(word: str) -> dict:
-    resp = requests.get(f"https://jisho.org/api/v1/search/words?keyword={word}").json()
+    resp = upstream.get(
+        "https://jisho.org/api/v1/search/words", params={"keyword": word}
+    ).json()
     data = resp["data"]
     for result in data:
         # return only the first result if exists
@@ -32,10 +39,12 @@ def search_jisho(word: str) -> dict:
             "means": means,
         }
         return res
-    return {"url": "", "reading": "", "means": ""}
+    raise lookups.NotFound(word)
 
 
 def fetch_jisho_grade_words(grade: int = 1):
+    import requests_html
+
     sess = requests_html.HTMLSession()
 
     page = 1
@@ -54,7 +63,7 @@ def fetch_jisho_grade_words(grade: int = 1):
         time.sleep(DELAY)
 
 
-def get_a_node(node: requests_html.Element) -> dict:
+def get_a_node(node: "requests_html.Element") -> dict:
     kanji, meaning, *kun_on = node.text.splitlines()[3:]
     e = node.xpath("//a")[0]
     url = e.attrs["href"].strip("/")
@@ -67,14 +76,15 @@ def get_a_node(node: requests_html.Element) -> dict:
 
 
 def init_kanji_db(dbpath: str) -> sqlite3.Connection:
+    # the connection is only read after init, dispatch threads share it
     if os.path.exists(dbpath):
-        conn = sqlite3.connect(dbpath)
+        conn = sqlite3.connect(dbpath, check_same_thread=False)
         return conn
 
     json_path = os.path.join(os.path.dirname(__file__), "joyo_final.json")
     ws = json.load(open(json_path))
 
-    conn = sqlite3.connect(dbpath)
+    conn = sqlite3.connect(dbpath, check_same_thread=False)
 
     conn.execute(
         "CREATE TABLE IF NOT EXISTS kanji_chars (id INTEGER PRIMARY KEY, kanji text, meaning text, reading text, grade text, url text);"
@@ -1,7 +1,9 @@
-import requests
 import json
 from dataclasses import dataclass
 
+import cache
+import upstream
+
 
 @dataclass
 class PodcastEpisode:
@@ -10,9 +12,10 @@ class PodcastEpisode:
     url: str
 
 
+@cache.cached("podcast")
 def get_latest_podcast_episodes() -> list[PodcastEpisode]:
     URL = "https://podcasts.apple.com/jp/podcast/%E3%81%AA%E3%81%8C%E3%82%89%E6%97%A5%E7%B5%8C/id1627014612"
-    resp = requests.get(URL)
+    resp = upstream.get(URL)
     resp.raise_for_status()
     resp.encoding = "utf-8"
     text = resp.text
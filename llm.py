@@ -1,20 +1,26 @@
-import requests
 import os
 from typing import Final
 
+import upstream
 
-session: Final = requests.Session()
 
 # Local Ollama
 MODEL: Final = "gemma3:1b"
 LLM_ENDPOINT: Final = "http://localhost:11434/api/generate"
+# generating is slow, do not cut it with the default upstream timeout
+LLM_TIMEOUT: Final = 120
 
 # Google Gemini API
-GEMINI_API_KEY: Final = os.environ["GEMINI_API_KEY"]
 GEMINI_MODEL: Final = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
-LLM_GEMINI_ENDPOINT: Final = "https://generativelanguage.googleapis.com/v1beta/models/{}:generateContent?key={}".format(
-    GEMINI_MODEL, GEMINI_API_KEY
-)
+
+
+def gemini_endpoint() -> str:
+    # read on use, the bot starts without GEMINI_API_KEY and only the
+    # Gemini backed commands fail
+    return "https://generativelanguage.googleapis.com/v1beta/models/{}:generateContent?key={}".format(
+        GEMINI_MODEL, os.environ["GEMINI_API_KEY"]
+    )
+
 
 SYSTEM_PROMPT_GEN_EXAMPLE: Final = """
 You are a multilingual language model specialized in generating clear and natural example sentences.
@@ -46,7 +52,9 @@ def gen_joke() -> str:
         "stream": False,
         "options": {"temperature": 0.8, "top_p": 0.9},
     }
-    msg = session.post(LLM_ENDPOINT, json=payload).json()["response"]
+    msg = upstream.post(LLM_ENDPOINT, json=payload, timeout=LLM_TIMEOUT).json()[
+        "response"
+    ]
     return msg
 
 
@@ -59,7 +67,9 @@ def translate(word) -> str:
 example:""",
         "stream": False,
     }
-    msg = session.post(LLM_ENDPOINT, json=payload).json()["response"]
+    msg = upstream.post(LLM_ENDPOINT, json=payload, timeout=LLM_TIMEOUT).json()[
+        "response"
+    ]
     return msg
 
 
@@ -77,7 +87,7 @@ def translate_sentence(s: str) -> str:
         "contents": [{"parts": [{"text": prompt}]}],
     }
 
-    resp = session.post(LLM_GEMINI_ENDPOINT, json=payload).json()
+    resp = upstream.post(gemini_endpoint(), json=payload, timeout=LLM_TIMEOUT).json()
     msg = resp["candidates"][0]["content"]["parts"][0]["text"]
 
     return msg
@@ -88,7 +98,7 @@ def gen_example(word_def: str) -> str:
         "system_instruction": {"parts": [{"text": SYSTEM_PROMPT_GEN_EXAMPLE}]},
         "contents": [{"parts": [{"text": f'write an example for "{word_def}"'}]}],
     }
-    resp = session.post(LLM_GEMINI_ENDPOINT, json=payload).json()
+    resp = upstream.post(gemini_endpoint(), json=payload, timeout=LLM_TIMEOUT).json()
     msg = resp["candidates"][0]["content"]["parts"][0]["text"]
 
     return msg
@@ -0,0 +1,297 @@
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import cache
+import singleflight
+
+logger = logging.getLogger()
+
+DB_FILE = "/tmp/uds_lookups.db"
+
+# seconds a dictionary answer is fresh
+SOURCE_TTLS = {
+    "uds": 24 * 3600,
+    "cambridge": 7 * 24 * 3600,
+    "cambridge_fr": 7 * 24 * 3600,
+    "jisho": 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+# "not found" is remembered for less, dictionaries gain words
+NOT_FOUND_TTL = 6 * 3600
+# past these, the least recently used entries are dropped
+MAX_ENTRIES = 50_000
+MEMORY_ENTRIES = 2048
+# stores between two disk evictions
+EVICT_EVERY = 100
+# words kept per user, loaded into memory on their first lookup
+RECENT_WORDS = 50
+# seconds between two writes of a user's repeat lookup of a word
+REMEMBER_EVERY = 10 * 60
+
+
+class NotFound(Exception):
+    """The dictionary has no entry for the keyword."""
+
+
+@dataclass
+class Lookup:
+    value: Any
+    found: bool
+    stored_at: float
+
+    def fresh(self, source: str) -> bool:
+        ttl = SOURCE_TTLS.get(source, DEFAULT_TTL) if self.found else NOT_FOUND_TTL
+        return time.time() - self.stored_at < ttl
+
+
+class LookupCache:
+    """Dictionary answers keyed by (source, normalized keyword), in SQLite.
+
+    A memory LRU in front answers repeats without touching the disk.
+    "Not found" is cached too, for NOT_FOUND_TTL. Past `max_entries` the
+    least recently used rows are evicted. The words a user looked up last
+    are loaded into memory on their first lookup after a restart.
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        max_entries: int = MAX_ENTRIES,
+        memory_entries: int = MEMORY_ENTRIES,
+    ) -> None:
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.lock = threading.Lock()
+        self.memory: OrderedDict[tuple[str, str], Lookup] = OrderedDict()
+        # memory hits whose used_at is written on the next eviction
+        self.touched: set[tuple[str, str]] = set()
+        self.flights = singleflight.Group()
+        self.preloaded: set[int] = set()
+        # (owner, source, keyword): when its asked_at was last written
+        self.remembered: dict[tuple[int, str, str], float] = {}
+        self.stores = 0
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS lookups (
+                source TEXT,
+                keyword TEXT,
+                value TEXT,
+                found INTEGER,
+                stored_at REAL,
+                used_at REAL,
+                PRIMARY KEY (source, keyword)
+            )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS lookups_used_at ON lookups (used_at)"
+            )
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS recent (
+                owner INTEGER,
+                source TEXT,
+                keyword TEXT,
+                asked_at REAL,
+                PRIMARY KEY (owner, source, keyword)
+            )
+            """)
+
+    def _put_memory(self, key: tuple[str, str], entry: Lookup) -> None:
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _get(self, key: tuple[str, str]) -> Lookup | None:
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+                self.touched.add(key)
+                return entry
+        with sqlite3.connect(self.db_file) as conn:
+            row = conn.execute(
+                "SELECT value, found, stored_at FROM lookups WHERE source = ? AND keyword = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE lookups SET used_at = ? WHERE source = ? AND keyword = ?",
+                (time.time(), *key),
+            )
+        entry = Lookup(json.loads(row[0]), bool(row[1]), row[2])
+        self._put_memory(key, entry)
+        return entry
+
+    def _put(self, key: tuple[str, str], entry: Lookup) -> None:
+        self._put_memory(key, entry)
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO lookups (source, keyword, value, found, stored_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    *key,
+                    json.dumps(entry.value),
+                    entry.found,
+                    entry.stored_at,
+                    entry.stored_at,
+                ),
+            )
+        with self.lock:
+            self.stores += 1
+            evict = self.stores % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drops the least recently used rows past `max_entries`."""
+        with self.lock:
+            touched, self.touched = self.touched, set()
+        now = time.time()
+        with sqlite3.connect(self.db_file) as conn:
+            conn.executemany(
+                "UPDATE lookups SET used_at = ? WHERE source = ? AND keyword = ?",
+                [(now, *key) for key in touched],
+            )
+            conn.execute(
+                """
+                DELETE FROM lookups WHERE rowid IN (
+                    SELECT rowid FROM lookups ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def _fetch(self, key: tuple[str, str], fetch: Callable[[], Any]) -> Lookup:
+        try:
+            entry = Lookup(fetch(), True, time.time())
+        except NotFound:
+            entry = Lookup(None, False, time.time())
+        self._put(key, entry)
+        return entry
+
+    def preload(self, owner: int) -> None:
+        """Loads the cached answers of `owner`'s recent words into memory."""
+        with sqlite3.connect(self.db_file) as conn:
+            rows = conn.execute(
+                """
+                SELECT l.source, l.keyword, l.value, l.found, l.stored_at
+                FROM recent AS r JOIN lookups AS l
+                    ON l.source = r.source AND l.keyword = r.keyword
+                WHERE r.owner = ?
+                ORDER BY r.asked_at
+                """,
+                (owner,),
+            ).fetchall()
+        for source, keyword, value, found, stored_at in rows:
+            entry = Lookup(json.loads(value), bool(found), stored_at)
+            self._put_memory((source, keyword), entry)
+
+    def _remember(self, owner: int, key: tuple[str, str]) -> None:
+        item = (owner, *key)
+        now = time.time()
+        with self.lock:
+            if now - self.remembered.get(item, 0.0) < REMEMBER_EVERY:
+                return
+            if len(self.remembered) > self.memory_entries:
+                self.remembered = {
+                    k: at
+                    for k, at in self.remembered.items()
+                    if now - at < REMEMBER_EVERY
+                }
+            self.remembered[item] = now
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recent (owner, source, keyword, asked_at) VALUES (?, ?, ?, ?)",
+                (*item, now),
+            )
+            conn.execute(
+                """
+                DELETE FROM recent WHERE owner = ? AND rowid NOT IN (
+                    SELECT rowid FROM recent WHERE owner = ?
+                    ORDER BY asked_at DESC LIMIT ?
+                )
+                """,
+                (owner, owner, RECENT_WORDS),
+            )
+
+    def lookup(
+        self,
+        source: str,
+        keyword: str,
+        fetch: Callable[[], Any],
+        owner: int | None = None,
+    ) -> Any:
+        """The answer for `keyword`, calling `fetch` when none is fresh.
+
+        Raises NotFound when the dictionary has no entry. When `fetch`
+        fails, a stale answer is served if there is one.
+        """
+        key = (source, cache.keyword_key(keyword))
+        if owner is not None:
+            with self.lock:
+                first = owner not in self.preloaded
+                self.preloaded.add(owner)
+            if first:
+                self.preload(owner)
+
+        entry = self._get(key)
+        if entry is None or not entry.fresh(source):
+            try:
+                entry, _shared = self.flights.do(
+                    f"{source}:{key[1]}", lambda: self._fetch(key, fetch)
+                )
+            except Exception:
+                if entry is None or not entry.found:
+                    raise
+                logger.warning("Lookups: %s failed, serving stale %s", source, key[1])
+
+        if owner is not None:
+            self._remember(owner, key)
+        if not entry.found:
+            raise NotFound(keyword)
+        return entry.value
+
+
+_lookups: LookupCache | None = None
+_lookups_lock = threading.Lock()
+
+
+def get_lookups() -> LookupCache:
+    """The process wide lookup cache, created on first use."""
+    global _lookups
+    with _lookups_lock:
+        if _lookups is None:
+            _lookups = LookupCache(DB_FILE)
+        return _lookups
+
+
+def cached(source: str) -> Callable:
+    """Caches a one keyword dictionary lookup under `source`.
+
+    The function raises NotFound when the dictionary has no entry, that
+    answer is cached as well. Callers pass `owner` to count the word as
+    one of the user's recent lookups.
+    """
+
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(keyword: str, owner: int | None = None) -> Any:
+            return get_lookups().lookup(source, keyword, lambda: func(keyword), owner)
+
+        return wrapper
+
+    return decorate
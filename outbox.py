@@ -0,0 +1,274 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+import requests
+
+import upstream
+
+logger = logging.getLogger()
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+MAX_ATTEMPTS = 3
+CIRCUIT_OPEN_PAUSE = 5.0
+
+METRICS = ("queued", "sent", "retried", "rate_limited", "failed", "dropped")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # set from a 429 retry_after, no token is handed out before it
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill(now)
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        self.paused_until = now + seconds
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+@dataclass
+class Outgoing:
+    chat_id: int
+    method: str
+    payload: dict
+    queued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class Outbox:
+    """Delivers Telegram API calls from a bounded queue, within rate limits.
+
+    Each chat has its own token bucket and its messages are sent in order,
+    one at a time. A global bucket caps the bot-wide rate. On 429 the chat
+    is paused for `retry_after` and the message is retried.
+    """
+
+    def __init__(
+        self,
+        session: upstream.UpstreamClient,
+        base_url: str,
+        workers: int = 4,
+        maxsize: int = 1000,
+        put_timeout: float = 5.0,
+    ) -> None:
+        self.session = session
+        self.base_url = base_url
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self.cond = threading.Condition()
+        self.lanes: dict[int, deque[Outgoing]] = {}
+        self.busy: set[int] = set()
+        self.buckets: dict[int, TokenBucket] = {}
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.size = 0
+        self.metrics: Counter = Counter()
+        self.queue_delay_total = 0.0
+        self.threads = [
+            threading.Thread(target=self._work, name=f"outbox-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self) -> "Outbox":
+        for t in self.threads:
+            t.start()
+        return self
+
+    def submit(self, chat_id: int, method: str, payload: dict) -> bool:
+        """Queue an API call, blocks up to `put_timeout` while the queue is full."""
+        with self.cond:
+            if not self.cond.wait_for(
+                lambda: self.size < self.maxsize, self.put_timeout
+            ):
+                self.metrics["dropped"] += 1
+                logger.error("Outbox full, dropped %s to chat %s", method, chat_id)
+                return False
+            self.lanes.setdefault(chat_id, deque()).append(
+                Outgoing(chat_id, method, payload)
+            )
+            self.size += 1
+            self.metrics["queued"] += 1
+            self.cond.notify_all()
+            return True
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.buckets[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+        return bucket
+
+    def acquire(self, chat_id: int) -> None:
+        """Blocks until `chat_id` may be sent a call outside the queue.
+
+        For calls whose response the caller needs, like sendPhoto: the call
+        takes its tokens from the same buckets as the queued messages.
+        """
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                bucket = self._bucket(chat_id)
+                wait = max(bucket.wait_time(now), self.global_bucket.wait_time(now))
+                if wait == 0:
+                    bucket.take()
+                    self.global_bucket.take()
+                    return
+                self.cond.wait(wait)
+
+    def rate_limited(self, chat_id: int, resp: requests.Response) -> None:
+        """Pauses a chat on a 429, for the `retry_after` Telegram asks."""
+        try:
+            retry_after = float(resp.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            retry_after = 1.0
+        logger.warning(
+            "Outbox: chat %s rate limited, retry after %ss", chat_id, retry_after
+        )
+        with self.cond:
+            self.metrics["rate_limited"] += 1
+            self._bucket(chat_id).pause(time.monotonic(), retry_after)
+            self.cond.notify_all()
+
+    def _next(self) -> Outgoing:
+        """Blocks until a message of some chat may be sent, and claims it."""
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                wait: float | None = None
+                for chat_id, lane in self.lanes.items():
+                    if not lane or chat_id in self.busy:
+                        continue
+                    bucket = self._bucket(chat_id)
+                    chat_wait = max(
+                        bucket.wait_time(now), self.global_bucket.wait_time(now)
+                    )
+                    if chat_wait == 0:
+                        bucket.take()
+                        self.global_bucket.take()
+                        self.busy.add(chat_id)
+                        return lane[0]
+                    wait = chat_wait if wait is None else min(wait, chat_wait)
+                self.cond.wait(wait)
+
+    def _work(self) -> None:
+        while True:
+            msg = self._next()
+            done = self._deliver(msg)
+            with self.cond:
+                self.busy.discard(msg.chat_id)
+                if done:
+                    lane = self.lanes[msg.chat_id]
+                    lane.popleft()
+                    self.size -= 1
+                    if not lane:
+                        del self.lanes[msg.chat_id]
+                        self._prune_buckets()
+                self.cond.notify_all()
+
+    def _deliver(self, msg: Outgoing) -> bool:
+        """Sends one message, returns False when it should be retried."""
+        msg.attempts += 1
+        try:
+            resp = self.session.post(
+                self.base_url + msg.method, json=msg.payload, timeout=10
+            )
+        except upstream.CircuitOpenError:
+            # Telegram is down, wait for it without using up the attempts
+            with self.cond:
+                self._bucket(msg.chat_id).pause(time.monotonic(), CIRCUIT_OPEN_PAUSE)
+            msg.attempts -= 1
+            return False
+        except requests.exceptions.RequestException:
+            logger.exception("Outbox: %s to chat %s failed", msg.method, msg.chat_id)
+            return self._give_up_after_attempts(msg)
+
+        if resp.status_code == 429:
+            self.rate_limited(msg.chat_id, resp)
+            # 429 is not the message's fault, do not count it as an attempt
+            msg.attempts -= 1
+            return False
+
+        if resp.status_code >= 500:
+            return self._give_up_after_attempts(msg)
+
+        with self.cond:
+            if resp.ok:
+                self.metrics["sent"] += 1
+                self.queue_delay_total += time.monotonic() - msg.queued_at
+            else:
+                # 4xx other than 429, e.g. bot blocked by user: retrying won't help
+                self.metrics["failed"] += 1
+                logger.error(
+                    "Outbox: %s to chat %s refused: %s",
+                    msg.method,
+                    msg.chat_id,
+                    resp.text,
+                )
+        return True
+
+    def _give_up_after_attempts(self, msg: Outgoing) -> bool:
+        with self.cond:
+            if msg.attempts < MAX_ATTEMPTS:
+                self.metrics["retried"] += 1
+                self._bucket(msg.chat_id).pause(time.monotonic(), msg.attempts)
+                return False
+            self.metrics["failed"] += 1
+        return True
+
+    def _prune_buckets(self) -> None:
+        if len(self.buckets) < 1000:
+            return
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.buckets.items() if b.is_idle(now)]:
+            if chat_id not in self.lanes:
+                del self.buckets[chat_id]
+
+    def stats(self) -> dict:
+        with self.cond:
+            sent = self.metrics["sent"]
+            return {
+                **{k: self.metrics[k] for k in METRICS},
+                "pending": self.size,
+                "avg_queue_delay": self.queue_delay_total / sent if sent else 0.0,
+            }
+
+
+_outbox: Outbox | None = None
+
+
+def start(session: upstream.UpstreamClient, base_url: str, **kwargs) -> Outbox:
+    """Start the process wide outbox, `send_message` goes through it from now on."""
+    global _outbox
+    _outbox = Outbox(session, base_url, **kwargs).start()
+    return _outbox
+
+
+def get_outbox() -> Outbox | None:
+    return _outbox
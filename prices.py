@@ -0,0 +1,78 @@
+import logging
+
+import cache
+import singleflight
+import upstream
+
+logger = logging.getLogger()
+
+SIMPLE_PRICE_URL = "https://api.coingecko.com/api/v3/simple/price"
+# coins accepted in one /btc, they all go in a single call
+MAX_COINS = 25
+
+_flights = singleflight.Group()
+
+
+def _fetch_quotes(coin_ids: list[str]) -> dict[str, dict]:
+    response = upstream.get(
+        SIMPLE_PRICE_URL,
+        params={
+            "ids": ",".join(coin_ids),
+            "vs_currencies": "usd",
+            "include_market_cap": "true",
+            "include_24hr_change": "true",
+        },
+    )
+    response.raise_for_status()
+    data = response.json()
+    return {
+        coin: {
+            "price_usd": data[coin]["usd"],
+            "market_cap_usd": data[coin]["usd_market_cap"],
+            "change_24h_percent": data[coin]["usd_24h_change"],
+        }
+        for coin in coin_ids
+        if coin in data
+    }
+
+
+def get_quotes(
+    coin_ids: list[str], max_age: float = cache.MAX_STALE
+) -> dict[str, dict]:
+    """USD quotes of CoinGecko coin ids, in one upstream call at most.
+
+    Quotes are cached per coin for the coingecko TTL and shared by every
+    chat, only the coins without a fresh quote are fetched. When CoinGecko
+    fails, stale quotes up to `max_age` seconds old are served. Coins
+    without such a quote are left out of the result.
+    """
+    ttl = cache.SOURCE_TTLS["coingecko"]
+    store = cache.get_cache()
+    entries = {coin: store.peek("coingecko", f"quote:{coin}") for coin in coin_ids}
+    missing = sorted(
+        coin for coin, entry in entries.items() if entry is None or entry.age() >= ttl
+    )
+    if missing:
+        try:
+            # identical batches asked at once, e.g. by cron jobs, share a call
+            quotes, _shared = _flights.do(
+                ",".join(missing), lambda: _fetch_quotes(missing)
+            )
+            for coin, quote in quotes.items():
+                entries[coin] = store.store("coingecko", f"quote:{coin}", quote)
+        except Exception:
+            if not any(e is not None and e.age() < max_age for e in entries.values()):
+                raise
+            logger.exception("Prices: fetching %s failed, serving stale", missing)
+
+    return {
+        coin: entry.value
+        for coin, entry in entries.items()
+        if entry is not None and entry.age() < max_age
+    }
+
+
+def format_quote(code: str, quote: dict) -> str:
+    return f"""{code.upper()} ${quote["price_usd"]}
+    Cap ${round(quote["market_cap_usd"] / 1000000000, 1)}B
+    24h {round(quote["change_24h_percent"], 1)}% """
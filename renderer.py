@@ -0,0 +1,133 @@
+import logging
+import multiprocessing
+import queue
+from multiprocessing.connection import Connection
+from typing import Any, Callable
+
+logger = logging.getLogger()
+
+# seconds a render may take before its worker is killed and replaced
+RENDER_TIMEOUT = 30.0
+# seconds a job waits for a free worker
+ACQUIRE_TIMEOUT = 30.0
+
+# spawned, not forked: the bot process runs threads and holds sockets
+_context = multiprocessing.get_context("spawn")
+
+
+class RendererError(Exception):
+    """A job failed in, or took down, its renderer process."""
+
+
+class RenderTimeout(RendererError):
+    """A job ran over its timeout, its renderer was replaced."""
+
+
+def _serve(conn: Connection, warm_up: Callable[[], None] | None) -> None:
+    """Worker loop: runs (func, args) jobs from the pipe, sends back results."""
+    if warm_up is not None:
+        try:
+            warm_up()
+        except Exception:
+            logger.exception("Renderer: warm up failed")
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send(("ok", func(*args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class Renderer:
+    """One worker process and the pipe to it."""
+
+    def __init__(self, warm_up: Callable[[], None] | None) -> None:
+        self.conn, child = _context.Pipe()
+        self.process = _context.Process(
+            target=_serve, args=(child, warm_up), name="renderer", daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def run(self, func: Callable, args: tuple, timeout: float) -> Any:
+        self.conn.send((func, args))
+        if not self.conn.poll(timeout):
+            raise RenderTimeout(f"Render took over {timeout}s")
+        status, value = self.conn.recv()
+        if status == "error":
+            raise RendererError(value)
+        return value
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class RendererPool:
+    """Persistent worker processes that render charts off the bot process.
+
+    Workers import the plotting libraries and start kaleido once, in
+    `warm_up`, then take jobs one at a time from the idle queue. A worker
+    that crashes or runs over the job timeout is killed and replaced, the
+    caller gets a RendererError and the bot carries on.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        warm_up: Callable[[], None] | None = None,
+        timeout: float = RENDER_TIMEOUT,
+    ) -> None:
+        self.warm_up = warm_up
+        self.timeout = timeout
+        self.idle: queue.Queue[Renderer] = queue.Queue()
+        for _ in range(size):
+            self.idle.put(Renderer(warm_up))
+
+    def run(self, func: Callable, *args, timeout: float | None = None) -> Any:
+        """Runs `func(*args)` in a worker, `func` must be importable."""
+        try:
+            worker = self.idle.get(timeout=ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise RenderTimeout("No free renderer") from None
+        try:
+            result = worker.run(func, args, timeout or self.timeout)
+        except RenderTimeout:
+            worker = self._replace(worker)
+            raise
+        except (EOFError, OSError) as e:
+            worker = self._replace(worker)
+            raise RendererError(f"Renderer died: {e!r}") from e
+        finally:
+            self.idle.put(worker)
+        return result
+
+    def _replace(self, worker: Renderer) -> Renderer:
+        logger.warning("Renderer: replacing worker %s", worker.process.pid)
+        worker.kill()
+        return Renderer(self.warm_up)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+_pool: RendererPool | None = None
+
+
+def start(size: int, warm_up: Callable[[], None] | None = None) -> RendererPool:
+    """Start the process wide pool, charts render in it from now on."""
+    global _pool
+    _pool = RendererPool(size, warm_up)
+    return _pool
+
+
+def get_pool() -> RendererPool | None:
+    return _pool
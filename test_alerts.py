@@ -0,0 +1,270 @@
+import operator
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import alerts
+import cronjob
+from alerts import (
+    Alert,
+    AlertEngine,
+    JSONAlertStorage,
+    MaxAlertsReachedError,
+    SQLAlertStorage,
+    ThresholdIndex,
+)
+from coins import CoinRegistry
+
+
+OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+def make_alert(n, op, threshold, coin="bitcoin", owner=1):
+    return Alert(f"uuid-{n}", 100, owner, coin, op, threshold)
+
+
+def quote(price):
+    return {"price_usd": price, "market_cap_usd": 0, "change_24h": 0}
+
+
+class TestThresholdIndex(unittest.TestCase):
+    """Tests for ThresholdIndex, the sorted alerts of one coin."""
+
+    def test_crossed(self):
+        index = ThresholdIndex()
+        for n, (op, threshold) in enumerate(
+            [
+                (">", 100),
+                (">=", 100),
+                (">", 110),
+                (">", 90),
+                ("<", 80),
+                ("<=", 70),
+                ("<", 95),
+            ]
+        ):
+            index.add(make_alert(n, op, threshold))
+
+        fired = index.crossed(100)
+        # > 100 is strict, it waits for a price above 100
+        self.assertEqual(
+            sorted(a.describe() for a in fired),
+            ["bitcoin > 90", "bitcoin >= 100"],
+        )
+        self.assertEqual(len(index), 5)
+        # fired alerts are gone
+        self.assertEqual(index.crossed(100), [])
+        self.assertEqual(
+            sorted(a.describe() for a in index.crossed(70)),
+            ["bitcoin < 80", "bitcoin < 95", "bitcoin <= 70"],
+        )
+        self.assertEqual(
+            [a.describe() for a in index.crossed(100.5)], ["bitcoin > 100"]
+        )
+
+    def test_remove(self):
+        index = ThresholdIndex()
+        index.add(make_alert(1, ">", 100))
+        index.add(make_alert(2, ">", 100))
+        index.remove("uuid-1")
+        index.remove("uuid-missing")
+
+        self.assertEqual([a.uuid for a in index.crossed(200)], ["uuid-2"])
+        self.assertEqual(len(index), 0)
+
+    def test_many_alerts(self):
+        """crossed matches a linear scan over thousands of alerts."""
+        rng = random.Random(42)
+        index = ThresholdIndex()
+        pending = []
+        for n in range(5000):
+            alert = make_alert(n, rng.choice(list(OPS)), rng.randint(0, 1000))
+            index.add(alert)
+            pending.append(alert)
+
+        for price in [500, 300, 700, 0, 1000, 300]:
+            expected = {a.uuid for a in pending if OPS[a.op](price, a.threshold)}
+            fired = {a.uuid for a in index.crossed(price)}
+            self.assertEqual(fired, expected)
+            pending = [a for a in pending if a.uuid not in fired]
+        self.assertEqual(len(index), len(pending))
+
+
+class TestAlertEngine(unittest.TestCase):
+    """Tests for AlertEngine ticks."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.storage = SQLAlertStorage(os.path.join(self.test_dir, "alerts.db"))
+        patcher = patch("alerts.prices.get_quotes")
+        self.get_quotes = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.notify = MagicMock()
+
+    def test_one_quote_call_per_tick(self):
+        engine = AlertEngine(self.storage, self.notify)
+        for n in range(10):
+            engine.add(make_alert(n, ">", 100 + n, owner=n))
+            engine.add(make_alert(100 + n, "<", 10 + n, coin="ethereum", owner=n))
+        self.get_quotes.return_value = {"bitcoin": quote(105), "ethereum": quote(20)}
+
+        fired = engine.tick()
+
+        self.get_quotes.assert_called_once()
+        self.assertEqual(
+            sorted(self.get_quotes.call_args.args[0]), ["bitcoin", "ethereum"]
+        )
+        # bitcoin > 100..104 fire, no ethereum threshold is above 20
+        self.assertEqual(len(fired), 5)
+        self.assertEqual(self.notify.call_count, 5)
+        self.assertEqual(len(self.storage.list_alerts()), 15)
+
+    def test_alerts_loaded_from_storage(self):
+        self.storage.add_alert(make_alert(1, "<", 50))
+        engine = AlertEngine(self.storage, self.notify)
+        self.get_quotes.return_value = {"bitcoin": quote(40)}
+
+        self.assertEqual([a.uuid for a in engine.tick()], ["uuid-1"])
+        self.notify.assert_called_once_with(100, "Alert bitcoin < 50: now $40")
+        self.assertEqual(self.storage.list_alerts(), [])
+
+    def test_stale_quotes_not_fired(self):
+        """Coins without a recent quote wait for the next tick."""
+        engine = AlertEngine(self.storage, self.notify, interval=60)
+        engine.add(make_alert(1, ">", 100))
+        engine.add(make_alert(2, ">", 10, coin="ethereum"))
+        self.get_quotes.return_value = {"ethereum": quote(20)}
+
+        self.assertEqual([a.uuid for a in engine.tick()], ["uuid-2"])
+        self.assertEqual(self.get_quotes.call_args.kwargs["max_age"], 120)
+        self.assertEqual(len(engine.indexes["bitcoin"]), 1)
+
+    def test_no_alerts_no_call(self):
+        engine = AlertEngine(self.storage, self.notify)
+        self.assertEqual(engine.tick(), [])
+        self.get_quotes.assert_not_called()
+
+    def test_remove_checks_owner(self):
+        engine = AlertEngine(self.storage, self.notify)
+        engine.add(make_alert(1, ">", 100, owner=1))
+
+        self.assertFalse(engine.remove("uuid-1", owner=2))
+        self.assertTrue(engine.remove("uuid-1", owner=1))
+        self.assertEqual(len(engine.indexes["bitcoin"]), 0)
+        self.assertEqual(engine.tick(), [])
+
+
+class TestJSONAlertStorage(unittest.TestCase):
+    """Tests for JSONAlertStorage."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.storage = JSONAlertStorage(os.path.join(self.test_dir, "alerts.json"))
+
+    def test_add_list_delete(self):
+        self.storage.add_alert(make_alert(1, ">", 100, owner=1))
+        self.storage.add_alert(make_alert(2, "<", 50, owner=2))
+
+        self.assertEqual([a.uuid for a in self.storage.list_alerts(1)], ["uuid-1"])
+        self.assertEqual(len(self.storage.list_alerts()), 2)
+        self.assertFalse(self.storage.del_alert("uuid-1", owner=2))
+        self.assertTrue(self.storage.del_alert("uuid-1", owner=1))
+        self.assertEqual([a.uuid for a in self.storage.list_alerts()], ["uuid-2"])
+
+    def test_concurrent_writes(self):
+        """Adds and deletes from several threads lose no change."""
+        for n in range(10):
+            self.storage.add_alert(make_alert(n, ">", 100, owner=n))
+
+        def add(n):
+            self.storage.add_alert(make_alert(100 + n, ">", 100, owner=n))
+
+        threads = [threading.Thread(target=add, args=(n,)) for n in range(10)]
+        threads += [
+            threading.Thread(target=self.storage.del_alert, args=(f"uuid-{n}",))
+            for n in range(10)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(
+            sorted(a.uuid for a in self.storage.list_alerts()),
+            sorted(f"uuid-{100 + n}" for n in range(10)),
+        )
+
+    def test_max_alerts(self):
+        for n in range(alerts.MAX_ALERTS_PER_OWNER):
+            self.storage.add_alert(make_alert(n, ">", 100))
+        with self.assertRaises(MaxAlertsReachedError):
+            self.storage.add_alert(make_alert(999, ">", 100))
+
+
+class TestInitStorage(unittest.TestCase):
+    """Alerts and cron jobs read the same storage config."""
+
+    def test_json_config(self):
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        config_file = os.path.join(test_dir, "config.yaml")
+        with open(config_file, "w") as f:
+            f.write(
+                "storage:\n"
+                "  backend: json\n"
+                f"  file_path: {os.path.join(test_dir, 'jobs.json')}\n"
+                f"  alerts_file_path: {os.path.join(test_dir, 'alerts.json')}\n"
+            )
+
+        storage = alerts.init_storage(config_file)
+        self.assertIsInstance(storage, JSONAlertStorage)
+        self.assertEqual(storage.file_path, os.path.join(test_dir, "alerts.json"))
+        self.assertEqual(
+            cronjob.init_storage(config_file).file_path,
+            os.path.join(test_dir, "jobs.json"),
+        )
+
+
+class TestParseAlert(unittest.TestCase):
+    """Tests for parse_alert."""
+
+    def setUp(self):
+        registry = CoinRegistry([{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}])
+        patcher = patch("alerts.coins.get_registry", return_value=registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse(self):
+        self.assertEqual(
+            alerts.parse_alert("/alert btc > 100000"), ("bitcoin", ">", 100000)
+        )
+        self.assertEqual(
+            alerts.parse_alert("/alert BTC<=95,500"), ("bitcoin", "<=", 95500)
+        )
+        self.assertEqual(
+            alerts.parse_alert("/alert btc > 1.5k"), ("bitcoin", ">", 1500)
+        )
+        self.assertEqual(
+            alerts.parse_alert("/alert btc >= 1.5k"), ("bitcoin", ">=", 1500)
+        )
+
+    def test_invalid(self):
+        for text in [
+            "/alert btc",
+            "/alert btc = 10",
+            "/alert btc > 1..0",
+            "/alert btc => 10",
+        ]:
+            with self.assertRaises(ValueError):
+                alerts.parse_alert(text)
+        with self.assertRaisesRegex(ValueError, "Unknown coin"):
+            alerts.parse_alert("/alert nocoin > 10")
+
+
+if __name__ == "__main__":
+    unittest.main()
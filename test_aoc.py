@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import aoc
+from cache import TTLCache
+
+
+def board_json(*members):
+    """members: (id, name, score, stars)."""
+    return {
+        "members": {
+            str(id): {"id": id, "name": name, "local_score": score, "stars": stars}
+            for id, name, score, stars in members
+        }
+    }
+
+
+class TestScoreboard(unittest.TestCase):
+    """Tests for parse_scoreboard and diff."""
+
+    def test_sorted_once(self):
+        board = aoc.parse_scoreboard(
+            board_json(
+                (1, "an", 10, 4),
+                (2, "binh", 30, 6),
+                (3, None, 20, 5),
+                (4, "idle", 0, 0),
+            ),
+            2024,
+            1,
+            0.0,
+        )
+        self.assertEqual(
+            [m.name for m in board.members], ["binh", "anonymous #3", "an"]
+        )
+        self.assertEqual(board.standings(), {"2": (6, 1), "3": (5, 2), "1": (4, 3)})
+
+    def test_diff(self):
+        seen = {"1": (4, 1), "2": (2, 2), "3": (1, 3)}
+        board = aoc.parse_scoreboard(
+            board_json(
+                (1, "an", 10, 4),
+                (2, "binh", 30, 6),
+                (3, "chi", 1, 1),
+                (5, "dung", 5, 2),
+            ),
+            2024,
+            1,
+            0.0,
+        )
+        changes = aoc.diff(seen, board)
+
+        self.assertEqual(
+            [c.describe() for c in changes],
+            [
+                "binh +4* (6*) #2 -> #1",
+                "an #1 -> #2",
+                "dung joined at #3 with 2*",
+                "chi #3 -> #4",
+            ],
+        )
+
+
+class TestLeaderboardService(unittest.TestCase):
+    """Boards refresh once per cache window, changes are posted once."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.service = aoc.LeaderboardService(os.path.join(self.test_dir, "aoc.db"))
+        self.cache = TTLCache()
+        patcher = patch("aoc.cache.get_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("aoc.SESSION", "session")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resp = MagicMock()
+        self.resp.json.return_value = board_json((1, "an", 10, 4))
+        patcher = patch("aoc.upstream.get", return_value=self.resp)
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expire(self):
+        for entry in self.cache.entries.values():
+            entry.stored_at -= 3600
+
+    def test_board_held_until_refresh(self):
+        board = self.service.scoreboard(2024, 1)
+        self.assertIs(self.service.scoreboard(2024, 1), board)
+        self.get.assert_called_once()
+        self.assertIn(
+            "2024/leaderboard/private/view/1.json", self.get.call_args.args[0]
+        )
+
+        self.service.scoreboard(2023, 1)
+        self.assertEqual(self.get.call_count, 2)
+
+        self.expire()
+        self.resp.json.return_value = board_json((1, "an", 20, 6))
+        refreshed = self.service.scoreboard(2024, 1)
+        self.assertIsNot(refreshed, board)
+        self.assertEqual(refreshed.members[0].stars, 6)
+
+    def test_changes(self):
+        board, changes = self.service.changes(100, 2024, 1)
+        self.assertIsNone(changes)
+        # nothing refreshed, nothing to post
+        self.assertEqual(self.service.changes(100, 2024, 1)[1], [])
+
+        self.expire()
+        self.resp.json.return_value = board_json((1, "an", 20, 6), (2, "binh", 1, 1))
+        _board, changes = self.service.changes(100, 2024, 1)
+        self.assertEqual(
+            [c.describe() for c in changes],
+            ["an +2* (6*)", "binh joined at #2 with 1*"],
+        )
+        self.assertEqual(self.service.changes(100, 2024, 1)[1], [])
+        # other chats keep their own standings
+        self.assertIsNone(self.service.changes(200, 2024, 1)[1])
+
+    def test_chat_boards(self):
+        self.assertEqual(self.service.chat_boards(100), [aoc.DEFAULT_BOARD])
+        self.service.add_board(100, 2023, 7)
+        self.service.add_board(100, 2022, 7)
+        self.assertEqual(self.service.chat_boards(100), [(2022, 7), (2023, 7)])
+        self.assertTrue(self.service.remove_board(100, 2022, 7))
+        self.assertFalse(self.service.remove_board(100, 2022, 7))
+
+        for board_id in range(aoc.MAX_CHAT_BOARDS - 1):
+            self.service.add_board(100, 2024, board_id)
+        with self.assertRaises(ValueError):
+            self.service.add_board(100, 2024, 99)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import aqi
+from aqi import AqiRefresher, Station, build_snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_worst_station_precomputed(self):
+        stations = [
+            Station("a", 80, "t1"),
+            Station("b", None, "t2"),
+            Station("c", 153, "t3"),
+        ]
+        self.assertEqual(build_snapshot("hanoi", stations).worst.name, "c")
+        self.assertIsNone(build_snapshot("hanoi", [Station("b", None, "t")]).worst)
+
+
+class TestAqiRefresher(unittest.TestCase):
+    """Tests for the AqiRefresher."""
+
+    def test_failed_refresh_keeps_snapshot(self):
+        fetch = MagicMock(return_value=[Station("a", 80, "t1")])
+        refresher = AqiRefresher({"hanoi": ("Hanoi", fetch)})
+        refresher.refresh_all()
+        first = refresher.get("hanoi")
+
+        fetch.side_effect = ValueError("WAQI down")
+        refresher.refresh_all()
+
+        self.assertIs(refresher.get("hanoi"), first)
+        self.assertEqual(first.worst.aqi, 80)
+
+    def test_snapshot_served_without_upstream(self):
+        """Commands read the refresher's snapshot, the fetcher is not called."""
+        fetch = MagicMock(return_value=[Station("a", 80, "t1")])
+        refresher = AqiRefresher({"hanoi": ("Hanoi", fetch)})
+        refresher.refresh("hanoi")
+
+        with (
+            patch("aqi._refresher", refresher),
+            patch.dict(
+                aqi.REGIONS, {"hanoi": ("Hanoi", MagicMock(side_effect=AssertionError))}
+            ),
+        ):
+            self.assertEqual(aqi.snapshot("hanoi").worst.name, "a")
+        fetch.assert_called_once()
+
+    def test_periodic_refresh(self):
+        fetch = MagicMock(return_value=[])
+        refresher = AqiRefresher({"hcm": ("HCM", fetch)}, interval=0.01).start()
+        self.addCleanup(refresher.stop)
+        for _ in range(500):
+            if fetch.call_count >= 3:
+                break
+            refresher.stopped.wait(0.01)
+        self.assertGreaterEqual(fetch.call_count, 3)
+        self.assertIsNotNone(refresher.get("hcm"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cache import TTLCache, cached
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    """Tests for the TTLCache."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch("cache.time.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TTLCache(maxsize=2)
+
+    def test_hit_and_miss(self):
+        """A fresh entry is served without fetching again."""
+        fetch = MagicMock(return_value=1)
+        self.assertEqual(self.cache.get_or_fetch("s", "k", fetch, ttl=10), 1)
+        self.assertEqual(self.cache.get_or_fetch("s", "k", fetch, ttl=10), 1)
+        fetch.assert_called_once()
+        self.assertEqual(self.cache.stats()["s"]["hits"], 1)
+        self.assertEqual(self.cache.stats()["s"]["misses"], 1)
+
+    def test_stale_while_revalidate(self):
+        """A stale entry is served at once and refreshed in the background."""
+        self.cache.get_or_fetch("s", "k", lambda: "old", ttl=10)
+        self.clock.now += 15
+        refreshed = threading.Event()
+
+        def fetch():
+            refreshed.set()
+            return "new"
+
+        self.assertEqual(self.cache.get_or_fetch("s", "k", fetch, ttl=10), "old")
+        self.assertTrue(refreshed.wait(5))
+        for _ in range(100):
+            if self.cache.get_or_fetch("s", "k", fetch, ttl=10) == "new":
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(self.cache.get_or_fetch("s", "k", fetch, ttl=10), "new")
+
+    def test_expired_entry_is_fetched(self):
+        """Past the stale window the caller waits for a fresh value."""
+        self.cache.get_or_fetch("s", "k", lambda: "old", ttl=10)
+        self.clock.now += 25
+        self.assertEqual(
+            self.cache.get_or_fetch("s", "k", lambda: "new", ttl=10), "new"
+        )
+
+    def test_stale_served_on_error(self):
+        """When the upstream fails, an old entry is better than nothing."""
+        self.cache.get_or_fetch("s", "k", lambda: "old", ttl=10)
+        self.clock.now += 3600
+
+        def fail():
+            raise ConnectionError("down")
+
+        self.assertEqual(self.cache.get_or_fetch("s", "k", fail, ttl=10), "old")
+        self.assertEqual(self.cache.stats()["s"]["stale_on_error"], 1)
+        with self.assertRaises(ConnectionError):
+            self.cache.get_or_fetch("s", "other", fail, ttl=10)
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted first."""
+        for key in ("a", "b"):
+            self.cache.get_or_fetch("s", key, lambda key=key: key, ttl=10)
+        self.cache.get_or_fetch("s", "a", lambda: "a", ttl=10)
+        self.cache.get_or_fetch("s", "c", lambda: "c", ttl=10)
+        self.assertEqual(list(self.cache.entries), ["s:a", "s:c"])
+
+
+class TestDiskTier(unittest.TestCase):
+    """Tests for the SQLite tier of the TTLCache."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.temp_dir, "test_cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_survives_restart(self):
+        """Entries are read back from disk by a new cache."""
+        TTLCache(disk_path=self.db_file).get_or_fetch(
+            "s", "k", lambda: {"a": [1, 2]}, ttl=60
+        )
+        fetch = MagicMock()
+        value = TTLCache(disk_path=self.db_file).get_or_fetch("s", "k", fetch, ttl=60)
+        self.assertEqual(value, {"a": [1, 2]})
+        fetch.assert_not_called()
+
+
+class TestCachedDecorator(unittest.TestCase):
+    """Tests for the cached decorator."""
+
+    @patch("cache.get_cache")
+    def test_keyed_on_arguments(self, mock_get_cache):
+        """Different arguments are cached separately."""
+        mock_get_cache.return_value = TTLCache()
+        calls = []
+
+        @cached("s")
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(double(1), 2)
+        self.assertEqual(double(1), 2)
+        self.assertEqual(double(2), 4)
+        self.assertEqual(calls, [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, call, patch
+
+import chart
+from cache import TTLCache
+
+
+class TestGetChart(unittest.TestCase):
+    """Charts are rendered once per cache window, in memory."""
+
+    def setUp(self):
+        patcher = patch("chart.cache.get_cache", return_value=TTLCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rendered_once(self):
+        release = threading.Event()
+        renders = []
+
+        def render(coin, days, width, height):
+            renders.append(coin)
+            release.wait(5)
+            return b"png-" + coin.encode()
+
+        results = []
+        with patch("chart.render", side_effect=render):
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(chart.get_chart("bitcoin"))
+                )
+                for _ in range(3)
+            ]
+            for t in threads:
+                t.start()
+            threading.Event().wait(0.1)
+            release.set()
+            for t in threads:
+                t.join(5)
+            self.assertEqual(chart.get_chart("bitcoin"), b"png-bitcoin")
+            chart.get_chart("ethereum")
+
+        self.assertEqual(results, [b"png-bitcoin"] * 3)
+        self.assertEqual(renders, ["bitcoin", "ethereum"])
+
+    def test_key_covers_params(self):
+        self.assertNotEqual(
+            chart.chart_key("bitcoin"), chart.chart_key("bitcoin", days=7)
+        )
+        with patch("chart.time.gmtime", return_value=(2024, 12, 1, 0, 0, 0, 6, 336, 0)):
+            self.assertEqual(
+                chart.chart_key("bitcoin"), "bitcoin:2024-12-01:60d:900x600"
+            )
+
+
+class TestParseWindow(unittest.TestCase):
+    def test_parse_window(self):
+        self.assertEqual(chart.parse_window("7d"), 7)
+        self.assertEqual(chart.parse_window("2W"), 14)
+        self.assertEqual(chart.parse_window("1y"), 365)
+        self.assertEqual(chart.parse_window("5y"), 365)
+        for token in ["btc", "0d", "d", "7x", "-1d"]:
+            self.assertIsNone(chart.parse_window(token), token)
+
+
+class TestNormalize(unittest.TestCase):
+    """Tests for chart.normalize."""
+
+    def test_aligned_to_common_start(self):
+        returns = chart.normalize(
+            {
+                "bitcoin": [
+                    ("2024-01-01", 90.0),
+                    ("2024-01-02", 100.0),
+                    ("2024-01-03", 110.0),
+                    ("2024-01-04", 150.0),
+                ],
+                # starts a day later and misses a day
+                "ethereum": [("2024-01-02", 10.0), ("2024-01-04", 5.0)],
+            }
+        )
+
+        self.assertEqual(list(returns.columns), ["bitcoin", "ethereum"])
+        self.assertEqual(
+            [str(day.date()) for day in returns.index],
+            ["2024-01-02", "2024-01-03", "2024-01-04"],
+        )
+        self.assertEqual([round(x, 6) for x in returns["bitcoin"]], [0.0, 10.0, 50.0])
+        self.assertEqual(list(returns["ethereum"]), [0.0, 0.0, -50.0])
+
+    def test_no_overlap(self):
+        returns = chart.normalize({"bitcoin": [("2024-01-01", 1.0)], "ethereum": []})
+        self.assertTrue(returns.empty)
+
+
+class TestRenderComparison(unittest.TestCase):
+    """Comparison charts fetch each coin's history once, render once."""
+
+    def test_one_fetch_per_coin(self):
+        candles = {
+            "bitcoin": [("2024-01-01", 1, 2, 0.5, 1.5)],
+            "ethereum": [("2024-01-01", 1, 2, 0.5, 1.0)],
+        }
+        store = MagicMock()
+        store.candles.side_effect = lambda coin, days: candles[coin]
+        with (
+            patch("chart.history.get_store", return_value=store),
+            patch("chart.renderer.get_pool", return_value=None),
+            patch("chart.render_returns", return_value=b"png") as render,
+        ):
+            png = chart.render_comparison(["bitcoin", "ethereum"], days=7)
+
+        self.assertEqual(png, b"png")
+        self.assertEqual(
+            sorted(store.candles.call_args_list),
+            [call("bitcoin", 7), call("ethereum", 7)],
+        )
+        self.assertEqual(
+            list(render.call_args.args[0].columns), ["bitcoin", "ethereum"]
+        )
+
+    def test_missing_history(self):
+        store = MagicMock()
+        store.candles.side_effect = lambda coin, days: []
+        with patch("chart.history.get_store", return_value=store):
+            with self.assertRaisesRegex(ValueError, "No price history"):
+                chart.render_comparison(["bitcoin", "ethereum"])
+
+
+if __name__ == "__main__":
+    unittest.main()
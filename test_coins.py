@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import coins
+from coins import CoinRegistry
+
+COIN_LIST = [
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "bitcoin-wrapped-fake", "symbol": "btc", "name": "Fake BTC"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "pepe", "symbol": "pepe", "name": "Pepe"},
+    {"id": "pepecoin-network", "symbol": "pepecoin", "name": "PepeCoin"},
+    {"id": "shiba-inu", "symbol": "shib", "name": "Shiba Inu"},
+    {"id": "shibainu-clone", "symbol": "shibx", "name": "Shib X"},
+]
+
+
+class TestCoinRegistry(unittest.TestCase):
+    """Tests for the CoinRegistry."""
+
+    def setUp(self):
+        self.registry = CoinRegistry(COIN_LIST)
+
+    def test_resolve(self):
+        self.assertEqual(self.registry.resolve("BTC"), "bitcoin")
+        self.assertEqual(self.registry.resolve("shib"), "shiba-inu")
+        self.assertEqual(self.registry.resolve("shiba inu"), "shiba-inu")
+        self.assertEqual(self.registry.resolve("pepecoin-network"), "pepecoin-network")
+        with self.assertRaises(KeyError):
+            self.registry.resolve("nocoin")
+
+    def test_ids_not_taken_by_names(self):
+        registry = CoinRegistry(
+            [
+                {"id": "uniswap", "symbol": "uni", "name": "Uniswap"},
+                {"id": "uni", "symbol": "uni", "name": "uniswap"},
+            ]
+        )
+        self.assertEqual(registry.resolve("uniswap"), "uniswap")
+        self.assertEqual(registry.resolve("uni"), "uni")
+
+    def test_shared_symbol_by_market_cap(self):
+        ton = [
+            {"id": "the-open-network", "symbol": "ton", "name": "Toncoin"},
+            {"id": "tontoken", "symbol": "ton", "name": "TonToken"},
+        ]
+        ranks = {"the-open-network": 20, "tontoken": 3000}
+        self.assertEqual(
+            CoinRegistry(ton, ranks=ranks).resolve("ton"), "the-open-network"
+        )
+        # without ranks the shortest id is the fallback
+        self.assertEqual(CoinRegistry(ton).resolve("ton"), "tontoken")
+
+    def test_pinned_without_list(self):
+        self.assertEqual(CoinRegistry([]).resolve("sol"), "solana")
+
+    def test_suggest(self):
+        self.assertEqual(self.registry.suggest("pep")[:2], ["pepe", "pepecoin"])
+        self.assertIn("ethereum", self.registry.suggest("etherum"))
+
+
+class TestGetRegistry(unittest.TestCase):
+    """The coin list is read from disk, fetched only when missing or old."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        path = os.path.join(self.test_dir, "coins.json")
+        for name, value in [
+            ("DISK_PATH", path),
+            ("_registry", None),
+            ("_last_attempt", 0.0),
+        ]:
+            patcher = patch.object(coins, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("coins.fetch_coins", return_value=COIN_LIST)
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("coins.fetch_ranks", return_value={})
+        self.fetch_ranks = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fetched_once_then_from_disk(self):
+        self.assertEqual(coins.get_registry().resolve("pepe"), "pepe")
+        coins._registry = None
+        self.assertEqual(coins.get_registry().resolve("pepe"), "pepe")
+        self.fetch.assert_called_once()
+
+    def test_ranks_stored(self):
+        self.fetch_ranks.return_value = {"bitcoin-wrapped-fake": 1, "bitcoin": 2}
+        with patch.object(coins, "PINNED", {}):
+            self.assertEqual(
+                coins.get_registry().resolve("btc"), "bitcoin-wrapped-fake"
+            )
+            self.assertEqual(coins.load().resolve("btc"), "bitcoin-wrapped-fake")
+        # ranks are optional, the list is kept when they fail
+        self.fetch_ranks.side_effect = OSError("down")
+        self.assertEqual(coins.refresh().resolve("btc"), "bitcoin")
+
+    def test_fetch_failure_keeps_pinned(self):
+        self.fetch.side_effect = OSError("down")
+        self.assertEqual(coins.get_registry().resolve("btc"), "bitcoin")
+        coins.get_registry()
+        self.fetch.assert_called_once()
+
+    def test_old_list_refreshed_in_background(self):
+        coins.get_registry()
+        with patch("coins.time.time", return_value=time.time() + 2 * 86400):
+            coins.get_registry()
+            for _ in range(100):
+                if self.fetch.call_count == 2 and not coins._refreshing.locked():
+                    break
+                time.sleep(0.01)
+        self.assertEqual(self.fetch.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
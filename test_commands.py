@@ -0,0 +1,223 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+
+# config reads BOT_TOKEN on import
+os.environ.setdefault("BOT_TOKEN", "test")
+
+import commands  # noqa: E402
+import cronjob  # noqa: E402
+from commands import Command, Reply, build_registry, command, split_message  # noqa: E402
+
+
+class TestSplitMessage(unittest.TestCase):
+    """Tests for split_message."""
+
+    def test_short_text_kept(self):
+        self.assertEqual(split_message("a\nb"), ["a\nb"])
+        self.assertEqual(split_message(""), [])
+
+    def test_split_on_line_breaks(self):
+        self.assertEqual(split_message("aaa\nbbb\ncc", limit=7), ["aaa\nbbb", "cc"])
+
+    def test_exact_limit(self):
+        self.assertEqual(split_message("abcd", limit=4), ["abcd"])
+        self.assertEqual(split_message("ab\ncd", limit=5), ["ab\ncd"])
+        # one more character and the line break is where it splits
+        self.assertEqual(split_message("ab\ncde", limit=5), ["ab", "cde"])
+
+    def test_long_line_cut(self):
+        self.assertEqual(split_message("abcdefghij", limit=4), ["abcd", "efgh", "ij"])
+        self.assertEqual(
+            split_message("x\nabcdefgh\ny", limit=4), ["x", "abcd", "efgh", "y"]
+        )
+
+    def test_parts_within_limit(self):
+        text = "\n".join("line %d " % n * (n % 7) for n in range(500))
+        parts = split_message(text, limit=100)
+        self.assertTrue(all(len(part) <= 100 for part in parts))
+        self.assertEqual("".join(parts).replace("\n", ""), text.replace("\n", ""))
+
+
+class TestReply(unittest.TestCase):
+    """Tests for Reply, the collected output of a handler."""
+
+    def setUp(self):
+        patcher = patch("commands.send_message")
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent(self):
+        return [call.kwargs["text"] for call in self.send.call_args_list]
+
+    def test_one_message(self):
+        with Reply(MagicMock(), 1) as reply:
+            reply.add("a")
+            reply.add("b")
+        self.assertEqual(self.sent(), ["a\nb"])
+
+    def test_long_reply_split(self):
+        lines = ["x" * 3000, "y" * 3000]
+        with Reply(MagicMock(), 1) as reply:
+            for line in lines:
+                reply.add(line)
+        self.assertEqual(self.sent(), lines)
+
+    def test_empty_sends_fallback(self):
+        with Reply(MagicMock(), 1, empty="Nothing here"):
+            pass
+        self.assertEqual(self.sent(), ["Nothing here"])
+
+    def test_lines_sent_on_error(self):
+        with self.assertRaises(KeyError):
+            with Reply(MagicMock(), 1) as reply:
+                reply.add("a")
+                raise KeyError("b")
+        self.assertEqual(self.sent(), ["a\n(incomplete, an error occurred)"])
+
+        self.send.reset_mock()
+        with self.assertRaises(KeyError):
+            with Reply(MagicMock(), 1):
+                raise KeyError("b")
+        self.send.assert_not_called()
+
+    def test_btc_without_quotes(self):
+        dispatcher = commands.Dispatcher(MagicMock())
+        with (
+            patch("commands._get_coin_name", return_value="bitcoin"),
+            patch("commands.prices.get_quotes", return_value={}),
+        ):
+            dispatcher.dispatch_btc("/btc", 1, 2)
+        self.assertEqual(self.sent(), ["Price unavailable"])
+
+
+class TestSendPhoto(unittest.TestCase):
+    """send_photo takes its token from the outbox buckets."""
+
+    def test_through_outbox_buckets(self):
+        box = MagicMock()
+        limited = MagicMock(status_code=429)
+        with (
+            patch("commands.outbox.get_outbox", return_value=box),
+            patch("commands.upstream.post", return_value=limited) as post,
+        ):
+            self.assertIs(commands.send_photo(1, "file-id"), limited)
+        box.acquire.assert_called_once_with(1)
+        box.rate_limited.assert_called_once_with(1, limited)
+        self.assertEqual(
+            post.call_args.kwargs["data"], {"chat_id": 1, "photo": "file-id"}
+        )
+
+
+class TestRegistry(unittest.TestCase):
+    """Tests for build_registry."""
+
+    def test_names_and_aliases(self):
+        class Handlers:
+            @command(aliases=("p", "price"), cost="cheap", timeout=5)
+            def dispatch_btc(self, text, chat_id, from_id):
+                pass
+
+            def dispatch_plain(self, text, chat_id, from_id):
+                pass
+
+            def helper(self):
+                pass
+
+        registry = build_registry(Handlers)
+        self.assertEqual(set(registry), {"btc", "p", "price", "plain"})
+        self.assertIs(registry["p"], registry["btc"])
+        self.assertEqual(registry["price"].name, "btc")
+        self.assertEqual((registry["btc"].cost, registry["btc"].timeout), ("cheap", 5))
+        self.assertEqual(registry["plain"], Command("plain", Handlers.dispatch_plain))
+
+    def test_duplicate_names(self):
+        class Handlers:
+            @command(aliases=("b",))
+            def dispatch_a(self, text, chat_id, from_id):
+                pass
+
+            def dispatch_b(self, text, chat_id, from_id):
+                pass
+
+        with self.assertRaisesRegex(ValueError, "Command b registered twice"):
+            build_registry(Handlers)
+
+    def test_dispatcher_registry(self):
+        self.assertIs(commands.COMMANDS["price"], commands.COMMANDS["btc"])
+        self.assertEqual(commands.COMMANDS["c"].cost, "heavy")
+
+
+class TestDispatch(unittest.TestCase):
+    """Tests for Dispatcher.dispatch routing."""
+
+    def setUp(self):
+        self.handler = MagicMock()
+        self.slow = MagicMock()
+        registry = {
+            "echo": Command("echo", self.handler, aliases=("e",)),
+            "e": Command("echo", self.handler, aliases=("e",)),
+            "draw": Command("draw", self.slow, cost="heavy"),
+        }
+        for target, value in [
+            ("commands.COMMANDS", registry),
+            ("commands.config.BOT_USERNAME", "udsbot"),
+            ("commands.config.SLOW_COMMAND_WORKERS", 1),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch("commands.send_message")
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatcher = commands.Dispatcher(MagicMock())
+
+    def test_alias(self):
+        self.dispatcher.dispatch("/e hi", 1, 2)
+        self.handler.assert_called_once_with(self.dispatcher, "/e hi", 1, 2)
+
+    def test_botname(self):
+        self.dispatcher.dispatch("/echo@udsbot hi  there", 1, 2)
+        self.handler.assert_called_once_with(self.dispatcher, "/echo hi  there", 1, 2)
+
+        self.dispatcher.dispatch("/echo@otherbot hi", 1, 2)
+        self.handler.assert_called_once()
+
+        with patch("commands.config.BOT_USERNAME", ""):
+            self.dispatcher.dispatch("/echo@anybot hi", 1, 2)
+        self.assertEqual(self.handler.call_count, 2)
+
+    def test_botname_stripped_for_parsers(self):
+        self.dispatcher.dispatch("/echo@udsbot 07:00 /btc", 1, 2)
+        text = self.handler.call_args.args[1]
+        self.assertEqual(cronjob.parse_job(text), ("/btc", 7, 0))
+
+    def test_unknown_dropped(self):
+        for text in ["/nope hi", "hello there", "/", "   "]:
+            self.dispatcher.dispatch(text, 1, 2)
+        self.handler.assert_not_called()
+        self.send.assert_not_called()
+
+    def test_slow_slots(self):
+        def nested(dispatcher, text, chat_id, from_id):
+            # the only slot is held, a second slow command is refused
+            dispatcher.dispatch("/draw", 3, 4)
+
+        self.slow.side_effect = nested
+        self.dispatcher.dispatch("/draw", 1, 2)
+        self.slow.assert_called_once()
+        self.assertEqual(
+            self.send.call_args.args[1:], (3, "Busy, try /draw again soon")
+        )
+
+        # the slot is given back, also when the command fails
+        self.slow.side_effect = OSError
+        with self.assertRaises(OSError):
+            self.dispatcher.dispatch("/draw", 1, 2)
+        self.slow.side_effect = None
+        self.dispatcher.dispatch("/draw", 1, 2)
+        self.assertEqual(self.slow.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -416,6 +416,38 @@ class TestCronJobLogic(unittest.TestCase):
             any_order=True,
         )  # Order isn't guaranteed
 
+    @patch("datetime.datetime")
+    def test_run_cron_prefetch(self, mock_datetime, mock_storage):
+        """Test run_cron hands all due commands to prefetch before dispatching."""
+        mock_now = MagicMock()
+        mock_now.hour = 8
+        mock_now.minute = 0
+        mock_datetime.now.return_value = mock_now
+        mock_datetime.UTC = datetime.UTC
+        mock_storage.get_due_jobs.return_value = [
+            {
+                "uuid": f"uuid{i}",
+                "chat_id": 100 + i,
+                "owner": 200 + i,
+                "hour": 8,
+                "minute": 0,
+                "command": command,
+            }
+            for i, command in enumerate(["/btc eth", "/btc"])
+        ]
+        calls = MagicMock()
+
+        run_cron(calls.dispatch, calls.prefetch)
+
+        self.assertEqual(
+            calls.mock_calls,
+            [
+                call.prefetch(["/btc eth", "/btc"]),
+                call.dispatch("/btc eth", 100, 200),
+                call.dispatch("/btc", 101, 201),
+            ],
+        )
+
     @patch("datetime.datetime")
     def test_run_cron_no_due_jobs(self, mock_datetime, mock_storage):
         """Test run_cron when no jobs are due."""
@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+
+from engine import DispatchEngine, chat_key
+
+
+def make_update(update_id, chat_id=None):
+    update = {"update_id": update_id}
+    if chat_id is not None:
+        update["message"] = {"chat": {"id": chat_id}, "text": str(update_id)}
+    return update
+
+
+class TestDispatchEngine(unittest.TestCase):
+    """Tests for the DispatchEngine."""
+
+    def test_chat_key(self):
+        """Updates without a chat get their own lane."""
+        self.assertEqual(chat_key(make_update(1, chat_id=42)), 42)
+        self.assertEqual(chat_key(make_update(7)), 7)
+
+    def test_same_chat_runs_in_order(self):
+        """Updates of one chat are handled in submission order."""
+        seen = []
+
+        def handler(update):
+            # earlier updates sleep longer, would finish last if run in parallel
+            time.sleep((10 - update["update_id"]) / 1000)
+            seen.append(update["update_id"])
+
+        engine = DispatchEngine(handler, max_workers=4)
+        for i in range(10):
+            engine.submit(make_update(i, chat_id=1))
+        self.assertTrue(engine.join(timeout=5))
+        engine.shutdown()
+        self.assertEqual(seen, list(range(10)))
+
+    def test_different_chats_run_in_parallel(self):
+        """A slow chat does not block other chats."""
+        release = threading.Event()
+        fast_done = threading.Event()
+
+        def handler(update):
+            if update["message"]["chat"]["id"] == 1:
+                release.wait(5)
+            else:
+                fast_done.set()
+
+        engine = DispatchEngine(handler, max_workers=2)
+        engine.submit(make_update(1, chat_id=1))
+        engine.submit(make_update(2, chat_id=2))
+        self.assertTrue(fast_done.wait(5))
+        release.set()
+        self.assertTrue(engine.join(timeout=5))
+        engine.shutdown()
+
+    def test_commit_waits_for_unfinished_updates(self):
+        """The offset never moves past an update that is still running."""
+        release = threading.Event()
+        commits = []
+
+        def handler(update):
+            if update["update_id"] == 1:
+                release.wait(5)
+
+        engine = DispatchEngine(handler, max_workers=2, on_commit=commits.append)
+        engine.submit(make_update(1, chat_id=1))
+        engine.submit(make_update(2, chat_id=2))
+        engine.submit(make_update(3, chat_id=2))
+        time.sleep(0.05)
+        self.assertIsNone(engine.committed)
+        self.assertEqual(commits, [])
+
+        release.set()
+        self.assertTrue(engine.join(timeout=5))
+        engine.shutdown()
+        self.assertEqual(engine.committed, 3)
+        self.assertEqual(commits, [3])
+
+    def test_handler_exception_still_commits(self):
+        """A failing update is finished and does not block the offset."""
+
+        def handler(update):
+            raise RuntimeError("boom")
+
+        engine = DispatchEngine(handler, max_workers=1)
+        engine.submit(make_update(5, chat_id=1))
+        self.assertTrue(engine.join(timeout=5))
+        engine.shutdown()
+        self.assertEqual(engine.committed, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import threading
+import time
+import unittest
+
+import fanout
+
+
+class TestFanOut(unittest.TestCase):
+    """Tests for fan_out."""
+
+    def test_calls_run_concurrently(self):
+        """The total wait is the slowest call, not the sum of all."""
+
+        def slow(value):
+            time.sleep(0.2)
+            return value
+
+        started = time.monotonic()
+        results = fanout.fan_out({str(i): lambda i=i: slow(i) for i in range(5)})
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual([r.value for r in results.values()], [0, 1, 2, 3, 4])
+        self.assertTrue(all(r.ok for r in results.values()))
+
+    def test_slow_call_marked_timed_out(self):
+        """A call past the deadline is dropped, the others are kept."""
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        started = time.monotonic()
+        results = fanout.fan_out(
+            {"fast": lambda: "hcm", "slow": lambda: release.wait(5)}, timeout=0.1
+        )
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1)
+        self.assertEqual(results["fast"].value, "hcm")
+        self.assertTrue(results["slow"].timed_out)
+        self.assertEqual(results["slow"].status(), "timed out")
+
+    def test_error_captured(self):
+        """An exception is returned in the Result, not raised."""
+
+        def fail():
+            raise ValueError("boom")
+
+        results = fanout.fan_out({"bad": fail, "good": lambda: 1})
+
+        self.assertIsInstance(results["bad"].error, ValueError)
+        self.assertEqual(results["bad"].status(), "failed (ValueError)")
+        self.assertEqual(results["good"].value, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import random
+import time
+import unittest
+from unittest.mock import patch
+
+import aqi
+import geo
+from aqi import Station
+
+
+class TestGridIndex(unittest.TestCase):
+    """Tests for the GridIndex."""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = {
+            i: Station(f"s{i}", i, None, rng.uniform(8, 23), rng.uniform(102, 110))
+            for i in range(5000)
+        }
+        self.index = geo.GridIndex()
+        self.index.add_all(self.points)
+
+    def test_within_matches_brute_force(self):
+        lat, lon, radius = 21.0285, 105.8542, 60
+        expected = sorted(
+            (geo.haversine_km(lat, lon, p.lat, p.lon), p.name)
+            for p in self.points.values()
+            if geo.haversine_km(lat, lon, p.lat, p.lon) <= radius
+        )
+        found = self.index.within(lat, lon, radius)
+        self.assertTrue(expected)
+        self.assertEqual([(d, p.name) for d, p in found], expected)
+
+    def test_lookup_sub_millisecond(self):
+        runs = 200
+        started = time.perf_counter()
+        for _ in range(runs):
+            self.index.within(10.7769, 106.7009, aqi.PLACE_RADIUS_KM)
+        self.assertLess((time.perf_counter() - started) / runs, 0.001)
+
+    def test_refreshed_at(self):
+        bounds = geo.bounds_around(21.0, 105.8, 25)
+        self.assertEqual(self.index.refreshed_at(bounds), 0.0)
+        # cells the box only partly covers were not fully fetched
+        self.index.mark_refreshed(bounds, 100.0)
+        self.assertEqual(self.index.refreshed_at(bounds), 0.0)
+
+        covered = self.index.cover(bounds)
+        self.index.mark_refreshed(covered, 200.0)
+        self.assertEqual(self.index.refreshed_at(bounds), 200.0)
+        self.assertEqual(self.index.refreshed_at(covered), 200.0)
+
+    def test_old_stations_dropped(self):
+        index = geo.GridIndex(max_age=60)
+        index.add_all({"old": Station("old", 50, "t", 21.0, 105.8)}, at=100.0)
+        index.add_all({"new": Station("new", 50, "t", 21.01, 105.8)}, at=150.0)
+        self.assertEqual(len(index), 2)
+
+        index.add_all({"new": Station("new", 60, "t", 21.01, 105.8)}, at=200.0)
+        self.assertEqual(len(index), 1)
+        with patch("geo.time.time", return_value=230.0):
+            self.assertEqual([s.aqi for _d, s in index.within(21.0, 105.8, 5)], [60])
+        with patch("geo.time.time", return_value=300.0):
+            self.assertEqual(index.within(21.0, 105.8, 5), [])
+
+
+class TestGazetteer(unittest.TestCase):
+    def test_find_place(self):
+        self.assertEqual(geo.find_place("  Sai  GON ").name, "Ho Chi Minh City")
+        self.assertEqual(geo.find_place("da nang").name, "Da Nang")
+        self.assertIsNone(geo.find_place("Atlantis"))
+        self.assertIn("Da Nang", geo.suggest_places("danag"))
+
+
+class TestNearby(unittest.TestCase):
+    """aqi.nearby fetches an area once, then answers from the index."""
+
+    def test_area_fetched_once(self):
+        place = geo.Place("Test", 16.05, 108.2)
+        stations = [
+            Station("near", 50, "t", 16.06, 108.21),
+            Station("far", 90, "t", 17.5, 108.2),
+        ]
+        with (
+            patch.object(aqi, "station_index", geo.GridIndex()),
+            patch("aqi.fetch_bounds", return_value=stations) as fetch,
+        ):
+            first = aqi.nearby(place)
+            second = aqi.nearby(place)
+        fetch.assert_called_once()
+        self.assertEqual([s.name for _d, s in first], ["near"])
+        self.assertEqual(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
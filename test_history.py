@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from bench_ohlc import hourly_prices, legacy_ohlc, rollup_ohlc
+from history import DAY_MS, PriceHistory, fetch_range
+
+NOW = 1_700_000_000.0  # 2023-11-14 22:13 UTC
+
+
+def hourly(start_s, end_s, price=lambda ts: ts / 1e9):
+    start = int(start_s * 1000) // 3_600_000 * 3_600_000 + 3_600_000
+    return [[ts, price(ts)] for ts in range(start, int(end_s * 1000), 3_600_000)]
+
+
+class TestPriceHistory(unittest.TestCase):
+    """Tests for the PriceHistory store."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.store = PriceHistory(os.path.join(self.test_dir, "prices.db"))
+        self.now = NOW
+        patcher = patch("history.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch(
+            "history.fetch_range",
+            side_effect=lambda coin, start, end: hourly(start, end),
+        )
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ranges(self):
+        return [(c.args[1], c.args[2]) for c in self.fetch.call_args_list]
+
+    def test_candles_rolled_up(self):
+        candles = self.store.candles("bitcoin", 7)
+        samples = hourly(NOW - 7 * 86400, NOW)
+
+        self.assertEqual(len(candles), 8)
+        day, open_, high, low, close = candles[1]
+        in_day = [p for ts, p in samples if ts // DAY_MS == samples[0][0] // DAY_MS + 1]
+        self.assertEqual(
+            (open_, high, low, close), (in_day[0], max(in_day), min(in_day), in_day[-1])
+        )
+
+    def test_only_tail_fetched(self):
+        self.store.candles("bitcoin", 7)
+        self.store.candles("bitcoin", 7)
+        self.assertEqual(len(self.ranges()), 1)
+
+        self.now += 3600
+        candles = self.store.candles("bitcoin", 7)
+        start, end = self.ranges()[1]
+        self.assertGreater(start, NOW - 3600)
+        self.assertEqual(end, self.now)
+        self.assertEqual(candles[-1][4], hourly(NOW, self.now)[-1][1])
+
+    def test_longer_window_fetches_head_only(self):
+        self.store.candles("bitcoin", 7)
+        candles = self.store.candles("bitcoin", 30)
+        start, end = self.ranges()[1]
+        self.assertEqual(start, NOW - 30 * 86400)
+        self.assertEqual(end, NOW - 7 * 86400)
+        self.assertEqual(len(candles), 31)
+
+    def test_stored_candles_served_when_upstream_fails(self):
+        self.store.candles("bitcoin", 7)
+        self.now += 3600
+        self.fetch.side_effect = requests.exceptions.ConnectionError()
+        self.assertEqual(len(self.store.candles("bitcoin", 7)), 8)
+
+    def test_pruned_days_keep_their_candles(self):
+        """A head fetch past the retention cutoff leaves stored candles alone."""
+        before = {c[0]: c for c in self.store.candles("bitcoin", 120)}
+        self.now += 86400
+        after = {c[0]: c for c in self.store.candles("bitcoin", 200)}
+
+        # the last day was still open, the tail fetch completed it
+        del before[max(before)]
+        for day, candle in before.items():
+            self.assertEqual(after[day], candle, day)
+        self.assertGreaterEqual(len(after), 200)
+
+
+class TestRollUp(unittest.TestCase):
+    """The SQL roll-up builds the candles the old per-row lookups did."""
+
+    def test_matches_legacy(self):
+        # a partial last day, as CoinGecko returns
+        prices = hourly_prices(30)[:-5]
+        legacy = legacy_ohlc(prices)
+        candles = rollup_ohlc(prices)
+
+        self.assertEqual([c[0] for c in candles], [str(d) for d in legacy["Date"]])
+        for n, column in enumerate(["Open", "High", "Low", "Close"], start=1):
+            self.assertEqual([c[n] for c in candles], list(legacy[column]), column)
+
+    def test_unsorted_and_sparse_samples(self):
+        prices = [[2 * DAY_MS + 10, 5.0], [10, 1.0], [2 * DAY_MS, 4.0], [20, 2.0]]
+        self.assertEqual(
+            rollup_ohlc(prices),
+            [("1970-01-01", 1.0, 2.0, 1.0, 2.0), ("1970-01-03", 4.0, 5.0, 4.0, 5.0)],
+        )
+
+
+class TestFetchRange(unittest.TestCase):
+    """Long ranges are fetched in chunks CoinGecko answers hourly."""
+
+    def test_chunked(self):
+        with patch(
+            "history._fetch_chunk", side_effect=lambda coin, start, end: [[start, 1]]
+        ) as fetch:
+            samples = fetch_range("bitcoin", NOW - 200 * 86400, NOW)
+
+        spans = [(c.args[1], c.args[2]) for c in fetch.call_args_list]
+        self.assertEqual(
+            spans,
+            [
+                (NOW - 200 * 86400, NOW - 110 * 86400),
+                (NOW - 110 * 86400, NOW - 20 * 86400),
+                (NOW - 20 * 86400, NOW),
+            ],
+        )
+        self.assertEqual(len(samples), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
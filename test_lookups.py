@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import lookups
+from lookups import LookupCache, NotFound
+
+
+class TestLookupCache(unittest.TestCase):
+    """Tests for LookupCache."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.db_file = os.path.join(self.test_dir, "lookups.db")
+        self.lookups = LookupCache(self.db_file)
+
+    def test_repeat_served_without_fetch(self):
+        fetch = MagicMock(return_value={"means": ["a greeting"]})
+        self.lookups.lookup("uds", "Hello", fetch)
+        start = time.perf_counter()
+        value = self.lookups.lookup("uds", " hello ", fetch)
+
+        self.assertLess(time.perf_counter() - start, 0.01)
+        self.assertEqual(value, {"means": ["a greeting"]})
+        fetch.assert_called_once()
+        # a restart reads the answer from disk
+        self.assertEqual(LookupCache(self.db_file).lookup("uds", "hello", fetch), value)
+        fetch.assert_called_once()
+
+    def test_sources_kept_apart(self):
+        self.lookups.lookup("cambridge", "chat", lambda: "en")
+        self.assertEqual(
+            self.lookups.lookup("cambridge_fr", "chat", lambda: "fr"), "fr"
+        )
+
+    def test_not_found_cached(self):
+        fetch = MagicMock(side_effect=NotFound("xyzzy"))
+        for _ in range(2):
+            with self.assertRaises(NotFound):
+                self.lookups.lookup("uds", "xyzzy", fetch)
+        fetch.assert_called_once()
+
+        # not found expires sooner than answers
+        entry = self.lookups.memory[("uds", "xyzzy")]
+        entry.stored_at -= lookups.NOT_FOUND_TTL
+        fetch.side_effect = None
+        fetch.return_value = "found now"
+        self.assertEqual(self.lookups.lookup("uds", "xyzzy", fetch), "found now")
+
+    def test_stale_served_on_error(self):
+        self.lookups.lookup("jisho", "neko", lambda: "cat")
+        self.lookups.memory[("jisho", "neko")].stored_at -= 2 * 24 * 3600
+
+        fetch = MagicMock(side_effect=OSError("down"))
+        self.assertEqual(self.lookups.lookup("jisho", "neko", fetch), "cat")
+        fetch.assert_called_once()
+        with self.assertRaises(OSError):
+            self.lookups.lookup("jisho", "inu", fetch)
+
+    def test_lru_eviction(self):
+        small = LookupCache(self.db_file, max_entries=3, memory_entries=2)
+        with patch("lookups.EVICT_EVERY", 1):
+            for word in ["a", "b", "c"]:
+                small.lookup("uds", word, lambda word=word: word)
+            # "a" is used again, "b" is the least recently used
+            small.lookup("uds", "a", lambda: "refetched")
+            small.lookup("uds", "d", lambda: "d")
+
+        fresh = LookupCache(self.db_file)
+        fetch = MagicMock(return_value="refetched")
+        for word in ["a", "c", "d"]:
+            self.assertEqual(fresh.lookup("uds", word, fetch), word)
+        fetch.assert_not_called()
+        self.assertEqual(fresh.lookup("uds", "b", fetch), "refetched")
+
+    def test_recent_words_preloaded(self):
+        for word in ["neko", "inu"]:
+            self.lookups.lookup("jisho", word, lambda word=word: word.upper(), owner=1)
+        self.lookups.lookup("jisho", "tori", lambda: "TORI", owner=2)
+
+        restarted = LookupCache(self.db_file)
+        restarted.lookup("jisho", "neko", MagicMock(), owner=1)
+        self.assertEqual(set(restarted.memory), {("jisho", "neko"), ("jisho", "inu")})
+
+    def test_recent_words_capped(self):
+        with patch("lookups.RECENT_WORDS", 2):
+            for word in ["a", "b", "c"]:
+                self.lookups.lookup("uds", word, lambda word=word: word, owner=1)
+
+        restarted = LookupCache(self.db_file)
+        restarted.preload(1)
+        self.assertEqual(set(restarted.memory), {("uds", "b"), ("uds", "c")})
+
+    def test_repeat_words_refreshed(self):
+        with patch("lookups.RECENT_WORDS", 2):
+            for word in ["a", "b"]:
+                self.lookups.lookup("uds", word, lambda word=word: word, owner=1)
+            # asked again within REMEMBER_EVERY, not written again
+            self.lookups.lookup("uds", "a", MagicMock(), owner=1)
+            self.lookups.remembered[(1, "uds", "a")] -= lookups.REMEMBER_EVERY
+            self.lookups.lookup("uds", "a", MagicMock(), owner=1)
+            self.lookups.lookup("uds", "c", lambda: "c", owner=1)
+
+        restarted = LookupCache(self.db_file)
+        restarted.preload(1)
+        self.assertEqual(set(restarted.memory), {("uds", "a"), ("uds", "c")})
+
+
+class TestCached(unittest.TestCase):
+    def test_decorator(self):
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        store = LookupCache(os.path.join(test_dir, "lookups.db"))
+        calls = []
+
+        @lookups.cached("uds")
+        def define(keyword):
+            calls.append(keyword)
+            return keyword.upper()
+
+        with patch("lookups.get_lookups", return_value=store):
+            self.assertEqual(define("yeet", owner=1), "YEET")
+            self.assertEqual(define("Yeet"), "YEET")
+        self.assertEqual(calls, ["yeet"])
+
+
+if __name__ == "__main__":
+    unittest.main()
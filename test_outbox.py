@@ -0,0 +1,132 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import outbox
+from outbox import Outbox, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body or {"ok": self.ok}
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Records posted payloads, answers with the queued responses, then 200."""
+
+    def __init__(self, responses=()):
+        self.lock = threading.Lock()
+        self.responses = list(responses)
+        self.posted = []
+
+    def post(self, url, json=None, timeout=None):
+        with self.lock:
+            self.posted.append((url, json))
+            if self.responses:
+                return self.responses.pop(0)
+        return FakeResponse(200)
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Tests for the TokenBucket."""
+
+    def test_burst_then_wait(self):
+        """A bucket hands out its burst, then refills at its rate."""
+        bucket = TokenBucket(rate=2.0, capacity=2)
+        now = bucket.updated
+        for _ in range(2):
+            self.assertEqual(bucket.wait_time(now), 0)
+            bucket.take()
+        self.assertAlmostEqual(bucket.wait_time(now), 0.5)
+        self.assertEqual(bucket.wait_time(now + 0.5), 0)
+
+    def test_pause(self):
+        """A paused bucket waits for the pause even if it could refill sooner."""
+        bucket = TokenBucket(rate=100.0, capacity=1)
+        now = bucket.updated
+        bucket.pause(now, 3)
+        self.assertAlmostEqual(bucket.wait_time(now + 1), 2)
+        self.assertEqual(bucket.wait_time(now + 3), 0)
+
+
+class TestOutbox(unittest.TestCase):
+    """Tests for the Outbox."""
+
+    def test_per_chat_order(self):
+        """Messages of a chat are delivered in the order they were queued."""
+        session = FakeSession()
+        with patch.object(outbox, "CHAT_RATE", 1000.0):
+            box = Outbox(session, "https://t/", workers=3).start()
+            for i in range(5):
+                box.submit(1, "sendMessage", {"chat_id": 1, "text": str(i)})
+            self.assertTrue(wait_until(lambda: box.stats()["sent"] == 5))
+        self.assertEqual([p["text"] for _, p in session.posted], list("01234"))
+        self.assertEqual(box.stats()["pending"], 0)
+
+    def test_retry_after_429(self):
+        """A 429 pauses the chat for retry_after and the message is resent."""
+        limited = FakeResponse(
+            429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.2}}
+        )
+        session = FakeSession([limited])
+        box = Outbox(session, "https://t/", workers=1).start()
+        started = time.monotonic()
+        box.submit(1, "sendMessage", {"chat_id": 1, "text": "hi"})
+        self.assertTrue(wait_until(lambda: box.stats()["sent"] == 1))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(len(session.posted), 2)
+        self.assertEqual(box.stats()["rate_limited"], 1)
+
+    def test_bounded_queue_drops(self):
+        """A full queue drops new messages after put_timeout."""
+        box = Outbox(FakeSession(), "https://t/", maxsize=1, put_timeout=0.01)
+        # not started, nothing drains the queue
+        self.assertTrue(box.submit(1, "sendMessage", {}))
+        self.assertFalse(box.submit(2, "sendMessage", {}))
+        self.assertEqual(box.stats()["dropped"], 1)
+
+    def test_client_error_not_retried(self):
+        """A 4xx other than 429 is counted as failed and not retried."""
+        session = FakeSession([FakeResponse(403)])
+        box = Outbox(session, "https://t/", workers=1).start()
+        box.submit(1, "sendMessage", {"chat_id": 1})
+        self.assertTrue(wait_until(lambda: box.stats()["failed"] == 1))
+        self.assertEqual(len(session.posted), 1)
+
+    def test_acquire_shares_buckets(self):
+        """Calls outside the queue use up the chat's tokens too."""
+        session = FakeSession()
+        box = Outbox(session, "https://t/", workers=1)
+        with patch.object(outbox, "CHAT_RATE", 5.0):
+            for _ in range(outbox.CHAT_BURST):
+                box.acquire(1)
+            started = time.monotonic()
+            box.acquire(1)
+            self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+            box.rate_limited(1, FakeResponse(429, {"parameters": {"retry_after": 0.3}}))
+            box.start()
+            box.submit(1, "sendMessage", {"chat_id": 1})
+            self.assertTrue(wait_until(lambda: box.stats()["sent"] == 1))
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+        self.assertEqual(box.stats()["rate_limited"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+import prices
+from cache import TTLCache
+
+
+def quote(price):
+    return {"usd": price, "usd_market_cap": price * 10, "usd_24h_change": 1.5}
+
+
+class TestGetQuotes(unittest.TestCase):
+    """Tests for prices.get_quotes."""
+
+    def setUp(self):
+        self.cache = TTLCache()
+        patcher = patch("prices.cache.get_cache", return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resp = MagicMock()
+        patcher = patch("prices.upstream.get", return_value=self.resp)
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_call_for_many_coins(self):
+        self.resp.json.return_value = {"bitcoin": quote(100), "ethereum": quote(10)}
+        quotes = prices.get_quotes(["bitcoin", "ethereum", "nocoin"])
+
+        self.get.assert_called_once()
+        self.assertEqual(
+            self.get.call_args.kwargs["params"]["ids"], "bitcoin,ethereum,nocoin"
+        )
+        self.assertEqual(quotes["bitcoin"]["price_usd"], 100)
+        self.assertEqual(quotes["ethereum"]["market_cap_usd"], 100)
+        self.assertNotIn("nocoin", quotes)
+
+    def test_cached_quotes_shared(self):
+        """Only coins without a fresh quote are fetched."""
+        self.resp.json.return_value = {"bitcoin": quote(100)}
+        prices.get_quotes(["bitcoin"])
+        self.resp.json.return_value = {"solana": quote(5)}
+        quotes = prices.get_quotes(["bitcoin", "solana"])
+
+        self.assertEqual(self.get.call_count, 2)
+        self.assertEqual(self.get.call_args.kwargs["params"]["ids"], "solana")
+        self.assertEqual(set(quotes), {"bitcoin", "solana"})
+        prices.get_quotes(["solana", "bitcoin"])
+        self.assertEqual(self.get.call_count, 2)
+
+    def test_stale_served_on_error(self):
+        self.resp.json.return_value = {"bitcoin": quote(100)}
+        prices.get_quotes(["bitcoin"])
+        self.get.side_effect = requests.exceptions.ConnectionError()
+
+        with patch(
+            "cache.time.time",
+            return_value=self.cache.peek("coingecko", "quote:bitcoin").stored_at + 3600,
+        ):
+            self.assertEqual(
+                prices.get_quotes(["bitcoin"])["bitcoin"]["price_usd"], 100
+            )
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                prices.get_quotes(["ethereum"])
+            # callers acting on the price bound its age
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                prices.get_quotes(["bitcoin"], max_age=120)
+
+
+if __name__ == "__main__":
+    unittest.main()
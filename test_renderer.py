@@ -0,0 +1,39 @@
+import operator
+import os
+import time
+import unittest
+
+from renderer import RendererError, RendererPool, RenderTimeout
+
+
+class TestRendererPool(unittest.TestCase):
+    """Tests for the RendererPool, jobs are plain importable functions."""
+
+    def setUp(self):
+        self.pool = RendererPool(size=1, timeout=5)
+        self.addCleanup(self.pool.close)
+
+    def test_result_returned(self):
+        self.assertEqual(self.pool.run(operator.mul, b"ab", 3), b"ababab")
+
+    def test_job_error(self):
+        with self.assertRaisesRegex(RendererError, "ZeroDivisionError"):
+            self.pool.run(operator.truediv, 1, 0)
+        self.assertEqual(self.pool.run(operator.add, 1, 2), 3)
+
+    def test_timeout_replaces_worker(self):
+        started = time.monotonic()
+        with self.assertRaises(RenderTimeout):
+            self.pool.run(time.sleep, 10, timeout=0.5)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(self.pool.run(operator.add, 1, 2), 3)
+
+    def test_crash_replaces_worker(self):
+        """A renderer dying mid job fails the job, not the caller's process."""
+        with self.assertRaisesRegex(RendererError, "died"):
+            self.pool.run(os._exit, 1)
+        self.assertEqual(self.pool.run(operator.add, 1, 2), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import threading
+import unittest
+
+from cache import TTLCache
+from singleflight import Group
+
+
+class TestGroup(unittest.TestCase):
+    """Tests for the single-flight Group."""
+
+    def test_concurrent_calls_share_one_result(self):
+        """Callers of the same key wait for the first caller's call."""
+        group = Group()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "price"
+
+        def caller():
+            results.append(group.do("btc", fetch))
+
+        leader = threading.Thread(target=caller)
+        leader.start()
+        self.assertTrue(started.wait(5))
+        followers = [threading.Thread(target=caller) for _ in range(5)]
+        for t in followers:
+            t.start()
+        # give the followers time to join the call in flight
+        threading.Event().wait(0.1)
+        release.set()
+        for t in [leader, *followers]:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("price", False)] + [("price", True)] * 5)
+        self.assertEqual(group.calls, {})
+
+    def test_error_is_shared_and_not_remembered(self):
+        """An exception reaches the caller, the next call runs again."""
+        group = Group()
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            group.do("k", fail)
+        self.assertEqual(group.do("k", lambda: 1), (1, False))
+
+
+class TestCacheCoalescing(unittest.TestCase):
+    """Concurrent cache misses of a key make one upstream call."""
+
+    def test_misses_coalesced(self):
+        cache = TTLCache()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return 42
+
+        threads = [
+            threading.Thread(target=cache.get_or_fetch, args=("aqi", "hn", fetch))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        while cache.stats().get("aqi", {}).get("misses", 0) < 4:
+            threading.Event().wait(0.01)
+        threading.Event().wait(0.1)
+        release.set()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["aqi"]["coalesced"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# a cold start must stay well under a second
+IMPORT_BUDGET = 1.0
+
+# loaded on first use only
+LAZY_MODULES = [
+    "pandas",
+    "plotly",
+    "uds",
+    "llm",
+    "jp_podcast",
+    "requests_html",
+    "yaml",
+    "pydantic",
+    "cronjob_config",
+]
+
+SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import bot
+elapsed = time.perf_counter() - started
+import commands, cronjob
+print(json.dumps({
+    "elapsed": elapsed,
+    "loaded": [m for m in %r if m in sys.modules],
+    "kanji_loaded": commands.get_kanji_service.cache_info().currsize,
+    "storage_loaded": cronjob.storage is not None,
+}))
+""" % (LAZY_MODULES,)
+
+
+class TestStartup(unittest.TestCase):
+    """Importing the bot is fast and free of heavy side effects."""
+
+    def test_import_budget(self):
+        env = dict(os.environ, BOT_TOKEN="test", WEATHER_TOKEN="test")
+        env.pop("GEMINI_API_KEY", None)
+        out = subprocess.run(
+            [sys.executable, "-c", SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+
+        self.assertEqual(result["loaded"], [])
+        self.assertEqual(result["kanji_loaded"], 0)
+        self.assertFalse(result["storage_loaded"])
+        self.assertLess(result["elapsed"], IMPORT_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from update_queue import UpdateQueue
+
+
+class TestUpdateQueue(unittest.TestCase):
+    """Tests for the UpdateQueue."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.temp_dir, "test_updates.db")
+        self.queue = UpdateQueue(self.db_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_put_batch_dedupes_by_update_id(self):
+        """Updates already stored are not returned again."""
+        new = self.queue.put_batch([{"update_id": 1}, {"update_id": 2}])
+        self.assertEqual([u["update_id"] for u in new], [1, 2])
+
+        new = self.queue.put_batch([{"update_id": 2}, {"update_id": 3}])
+        self.assertEqual([u["update_id"] for u in new], [3])
+        self.assertEqual(self.queue.last_update_id(), 3)
+
+    def test_empty_queue(self):
+        """A fresh queue has no offset and nothing to replay."""
+        self.assertIsNone(self.queue.last_update_id())
+        self.assertEqual(self.queue.pending(), [])
+
+    def test_pending_survives_restart(self):
+        """Unfinished updates are replayed by a new queue on the same file."""
+        self.queue.put_batch(
+            [{"update_id": i, "message": {"text": str(i)}} for i in (10, 11, 12)]
+        )
+        self.queue.commit(10)
+
+        restarted = UpdateQueue(self.db_file)
+        pending = restarted.pending()
+        self.assertEqual([u["update_id"] for u in pending], [11, 12])
+        self.assertEqual(pending[0]["message"]["text"], "11")
+        self.assertEqual(restarted.last_update_id(), 12)
+
+    def test_commit_keeps_last_update_id(self):
+        """Committing everything still remembers where to poll from."""
+        self.queue.put_batch([{"update_id": 5}, {"update_id": 6}])
+        self.queue.commit(6)
+        self.assertEqual(self.queue.pending(), [])
+        self.assertEqual(self.queue.last_update_id(), 6)
+        # a late duplicate of a committed update is ignored
+        self.assertEqual(self.queue.put_batch([{"update_id": 6}]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
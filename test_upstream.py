@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+
+def make_response(status_code):
+    resp = MagicMock(spec=requests.Response)
+    resp.status_code = status_code
+    return resp
+
+
+@patch("upstream.time.sleep")
+class TestUpstreamClient(unittest.TestCase):
+    """Tests for the UpstreamClient."""
+
+    def setUp(self):
+        self.client = UpstreamClient(retries=2)
+        self.client.session = MagicMock()
+
+    def test_default_timeout(self, mock_sleep):
+        """Calls without a timeout get the default one."""
+        self.client.session.request.return_value = make_response(200)
+        self.client.get("https://example.com/a")
+        self.assertIn("timeout", self.client.session.request.call_args.kwargs)
+
+    def test_get_retried_on_503(self, mock_sleep):
+        """Idempotent calls are retried with backoff on a retryable status."""
+        self.client.session.request.side_effect = [
+            make_response(503),
+            make_response(200),
+        ]
+        resp = self.client.get("https://example.com/a")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.client.session.request.call_count, 2)
+        mock_sleep.assert_called_once()
+
+    def test_post_not_retried(self, mock_sleep):
+        """POST is not retried unless asked for."""
+        self.client.session.request.side_effect = requests.exceptions.ConnectionError
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post("https://example.com/a", json={})
+        self.assertEqual(self.client.session.request.call_count, 1)
+
+    def test_gives_up_after_retries(self, mock_sleep):
+        """The last response is returned once retries are used up."""
+        self.client.session.request.return_value = make_response(502)
+        resp = self.client.get("https://example.com/a")
+        self.assertEqual(resp.status_code, 502)
+        self.assertEqual(self.client.session.request.call_count, 3)
+
+    def test_circuit_per_host(self, mock_sleep):
+        """A failing host opens its circuit, other hosts are not affected."""
+        self.client.session.request.side_effect = requests.exceptions.Timeout
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client.get("https://down.example.com/")
+        # the 5th consecutive failure opens the circuit during the retries
+        with self.assertRaises(CircuitOpenError):
+            self.client.get("https://down.example.com/")
+        self.assertEqual(self.client.session.request.call_count, 5)
+        with self.assertRaises(CircuitOpenError):
+            self.client.get("https://down.example.com/")
+        self.assertEqual(self.client.session.request.call_count, 5)
+
+        self.client.session.request.side_effect = None
+        self.client.session.request.return_value = make_response(200)
+        self.assertEqual(self.client.get("https://up.example.com/").status_code, 200)
+
+    @patch("upstream.time.monotonic")
+    def test_other_error_ends_trial(self, mock_monotonic, mock_sleep):
+        """A trial call failing with any error lets later trials through."""
+        mock_monotonic.return_value = 100.0
+        breaker = self.client.breaker("flaky.example.com")
+        for _ in range(breaker.threshold):
+            breaker.record(ok=False)
+
+        mock_monotonic.return_value = 200.0
+        self.client.session.request.side_effect = (
+            requests.exceptions.ChunkedEncodingError
+        )
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.client.get("https://flaky.example.com/")
+        self.assertFalse(breaker.trial_running)
+
+        mock_monotonic.return_value = 300.0
+        self.client.session.request.side_effect = None
+        self.client.session.request.return_value = make_response(200)
+        self.assertEqual(self.client.get("https://flaky.example.com/").status_code, 200)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests for the CircuitBreaker."""
+
+    @patch("upstream.time.monotonic")
+    def test_trial_call_after_reset_timeout(self, mock_monotonic):
+        """One trial call is let through after the reset timeout."""
+        mock_monotonic.return_value = 100.0
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30)
+        breaker.record(ok=False)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call("h")
+
+        mock_monotonic.return_value = 131.0
+        breaker.before_call("h")
+        # a second caller waits for the trial to finish
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call("h")
+        breaker.record(ok=True)
+        breaker.before_call("h")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cache import TTLCache
+from weather import UnknownCityError, WeatherService, parse_cities
+
+CITY_IDS = {"hanoi": 1581130, "ho chi minh": 1566083}
+
+
+def owm(city_id, name, temp=300.15):
+    return {
+        "id": city_id,
+        "name": name,
+        "main": {"temp": temp, "feels_like": temp, "humidity": 80},
+        "weather": [{"description": "clear sky"}],
+    }
+
+
+def fake_get(url, params):
+    resp = MagicMock(status_code=200)
+    if url.endswith("/weather"):
+        name = params["q"].lower()
+        if name not in CITY_IDS:
+            resp.status_code = 404
+        resp.json.return_value = owm(CITY_IDS.get(name), params["q"].title())
+    else:
+        ids = [int(i) for i in params["id"].split(",")]
+        resp.json.return_value = {"list": [owm(i, str(i)) for i in ids]}
+    return resp
+
+
+class TestWeatherService(unittest.TestCase):
+    """Tests for the WeatherService."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.service = WeatherService("key", os.path.join(self.test_dir, "w.db"))
+        patcher = patch("weather.cache.get_cache", return_value=TTLCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("weather.upstream.get", side_effect=fake_get)
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def endpoints(self):
+        return [c.args[0].rsplit("/", 1)[1] for c in self.get.call_args_list]
+
+    def test_city_ids_resolved_once(self):
+        """A name is looked up by the by-name endpoint once, then from the index."""
+        self.assertEqual(self.service.city_id("Hanoi"), 1581130)
+        self.assertEqual(self.service.city_id("  hanoi "), 1581130)
+        self.assertEqual(self.endpoints(), ["weather"])
+
+    def test_unknown_city(self):
+        with self.assertRaises(UnknownCityError):
+            self.service.city_id("Atlantis")
+        temps, unknown = self.service.get_weather(["Hanoi", "Atlantis"])
+        self.assertEqual([t["id"] for t in temps], [1581130])
+        self.assertEqual(unknown, ["Atlantis"])
+
+    def test_cached_cities_not_refetched(self):
+        """Resolving warms the cache, only uncached cities go to one group call."""
+        self.service.get_weather(["Hanoi", "Ho Chi Minh"])
+        self.assertEqual(self.endpoints(), ["weather", "weather"])
+
+        with patch("cache.time.time", return_value=10**10):
+            temps, _ = self.service.get_weather(["Ho Chi Minh", "Hanoi"])
+        self.assertEqual(self.endpoints()[2:], ["group"])
+        self.assertEqual(self.get.call_args.kwargs["params"]["id"], "1566083,1581130")
+        self.assertEqual([t["id"] for t in temps], [1566083, 1581130])
+
+    def test_concurrent_group_calls_coalesced(self):
+        """Chats asking for the same stale cities at once share one call."""
+        self.service.get_weather(["Hanoi", "Ho Chi Minh"])
+        release = threading.Event()
+
+        def slow_get(url, params):
+            release.wait(5)
+            return fake_get(url, params)
+
+        self.get.side_effect = slow_get
+        results = []
+        with patch("cache.time.time", return_value=10**10):
+            threads = [
+                threading.Thread(
+                    target=lambda cities=cities: results.append(
+                        self.service.get_weather(cities)
+                    )
+                )
+                for cities in (["Hanoi", "Ho Chi Minh"], ["Ho Chi Minh", "Hanoi"])
+            ]
+            for t in threads:
+                t.start()
+            threading.Event().wait(0.1)
+            release.set()
+            for t in threads:
+                t.join(5)
+
+        self.assertEqual(self.endpoints()[2:], ["group"])
+        self.assertEqual(len(results), 2)
+
+    def test_chat_cities(self):
+        self.assertEqual(self.service.chat_cities(1), ["Ho Chi Minh", "Hanoi"])
+        self.service.set_chat_cities(1, ["Da Nang"])
+        self.assertEqual(self.service.chat_cities(1), ["Da Nang"])
+        self.assertEqual(self.service.chat_cities(2), ["Ho Chi Minh", "Hanoi"])
+        self.service.set_chat_cities(1, [])
+        self.assertEqual(self.service.chat_cities(1), ["Ho Chi Minh", "Hanoi"])
+
+
+class TestParseCities(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            parse_cities("Hanoi,  da  nang , ,HANOI"), ["Hanoi", "da nang"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
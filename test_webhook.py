@@ -0,0 +1,100 @@
+import http.client
+import json
+import os
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "message.json")
+
+
+class TestWebhookServer(unittest.TestCase):
+    """Tests for the WebhookServer, POSTing message.json to a local server."""
+
+    def setUp(self):
+        self.received = []
+        self.server = WebhookServer(
+            ("127.0.0.1", 0), self.received.append, secret_token="s3cret"
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        self.url = f"http://{host}:{port}"
+        with open(FIXTURE) as f:
+            self.update = json.load(f)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_accepts_update(self):
+        """A valid update is handed to on_update."""
+        resp = requests.post(
+            self.url + "/",
+            json=self.update,
+            headers={SECRET_TOKEN_HEADER: "s3cret"},
+            timeout=5,
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.received, [self.update])
+
+    def test_rejects_wrong_secret(self):
+        """Requests without the secret token are refused."""
+        resp = requests.post(self.url + "/", json=self.update, timeout=5)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(self.received, [])
+
+    def test_rejects_bad_payload(self):
+        """Bodies that are not an update are refused."""
+        resp = requests.post(
+            self.url + "/",
+            data=b"not json",
+            headers={SECRET_TOKEN_HEADER: "s3cret"},
+            timeout=5,
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_rejects_bad_length(self):
+        """Missing, malformed and oversized bodies are refused unread."""
+        host, port = self.server.server_address[:2]
+        for length, status in [(None, 400), ("abc", 400), ("0", 400), ("2000000", 413)]:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.putrequest("POST", "/")
+            conn.putheader(SECRET_TOKEN_HEADER, "s3cret")
+            if length is not None:
+                conn.putheader("Content-Length", length)
+            conn.endheaders()
+            self.assertEqual(conn.getresponse().status, status, length)
+            conn.close()
+        self.assertEqual(self.received, [])
+
+    def test_track_reports_latency(self):
+        """The tracked handler records request-to-handled latency."""
+        handled = []
+        tracked = self.server.track(handled.append)
+
+        requests.post(
+            self.url + "/",
+            json=self.update,
+            headers={SECRET_TOKEN_HEADER: "s3cret"},
+            timeout=5,
+        )
+        tracked(self.received[0])
+
+        self.assertEqual(handled, [self.update])
+        box = MagicMock()
+        box.stats.return_value = {"sent": 1, "avg_queue_delay": 0.25}
+        with patch("webhook.outbox.get_outbox", return_value=box):
+            stats = requests.get(self.url + "/stats", timeout=5).json()
+        self.assertEqual(stats["handler_latency"]["count"], 1)
+        self.assertGreaterEqual(stats["handler_latency"]["max"], 0)
+        self.assertEqual(stats["avg_queue_delay"], 0.25)
+        self.assertEqual(self.server.received_at, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
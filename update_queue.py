@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import time
+
+
+class UpdateQueue:
+    """SQLite queue of received Telegram updates.
+
+    Updates are written in one transaction per getUpdates batch before they
+    are dispatched. Rows stay pending until the dispatch engine commits them,
+    so unfinished updates are replayed after a crash (at-least-once).
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database."""
+        with sqlite3.connect(self.db_file) as conn:
+            # WAL makes the per-batch commits cheap and readers never block
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS updates (
+                update_id INTEGER PRIMARY KEY,
+                payload TEXT,
+                done INTEGER DEFAULT 0,
+                received_at REAL
+            )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def put_batch(self, updates: list[dict]) -> list[dict]:
+        """Store a batch of updates, returns those not seen before."""
+        now = time.time()
+        new = []
+        with self._connect() as conn:
+            for update in updates:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO updates (update_id, payload, received_at) VALUES (?, ?, ?)",
+                    (update["update_id"], json.dumps(update), now),
+                )
+                if cursor.rowcount > 0:
+                    new.append(update)
+        return new
+
+    def pending(self) -> list[dict]:
+        """Updates received but not processed yet, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT payload FROM updates WHERE done = 0 ORDER BY update_id"
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def commit(self, update_id: int) -> None:
+        """Mark every update up to `update_id` as processed.
+
+        Only the committed row is kept, as a marker for `last_update_id`.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM updates WHERE update_id < ?", (update_id,))
+            conn.execute(
+                "UPDATE updates SET done = 1 WHERE update_id = ?", (update_id,)
+            )
+
+    def last_update_id(self) -> int | None:
+        """The newest update ever stored, the next poll starts after it."""
+        with self._connect() as conn:
+            return conn.execute("SELECT MAX(update_id) FROM updates").fetchone()[0]
@@ -0,0 +1,152 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger()
+
+# (connect, read) seconds, used when a caller gives no timeout
+DEFAULT_TIMEOUT = (3.05, 10)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# only these are retried unless the caller passes retries explicitly
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """The upstream failed too often recently, the call was not attempted."""
+
+
+class CircuitBreaker:
+    """Fails fast after `threshold` consecutive failures of one upstream.
+
+    After `reset_timeout` seconds one trial call is let through, its result
+    closes the circuit again or keeps it open for another period.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_running = False
+
+    def before_call(self, host: str) -> None:
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if (
+                time.monotonic() - self.opened_at < self.reset_timeout
+                or self.trial_running
+            ):
+                raise CircuitOpenError(f"Circuit open for {host}")
+            self.trial_running = True
+
+    def record(self, ok: bool) -> None:
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """One pooled HTTP client for every upstream the bot talks to.
+
+    Connections are kept alive in a pool per host, calls get a default
+    timeout, idempotent calls are retried with jittered exponential backoff,
+    and each host has its own circuit breaker.
+    """
+
+    def __init__(
+        self, pool_maxsize: int = 16, retries: int = 2, backoff: float = 0.5
+    ) -> None:
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.lock = threading.Lock()
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker()
+            return breaker
+
+    def request(
+        self, method: str, url: str, retries: int | None = None, **kwargs
+    ) -> requests.Response:
+        method = method.upper()
+        if retries is None:
+            retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        host = urlsplit(url).hostname or ""
+        breaker = self.breaker(host)
+
+        attempt = 0
+        while True:
+            breaker.before_call(host)
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ):
+                breaker.record(ok=False)
+                if attempt >= retries:
+                    raise
+                logger.warning("%s %s failed, retrying", method, host)
+            except BaseException:
+                # not retried, but must end a half-open trial
+                breaker.record(ok=False)
+                raise
+            else:
+                # 4xx means the upstream is up, the request was wrong
+                breaker.record(ok=resp.status_code < 500)
+                if resp.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return resp
+                logger.warning(
+                    "%s %s answered %s, retrying", method, host, resp.status_code
+                )
+            # full jitter, spreads out retries of concurrent callers
+            time.sleep(random.uniform(0, self.backoff * 2**attempt))
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+_client: UpstreamClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> UpstreamClient:
+    """The process wide client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = UpstreamClient()
+        return _client
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return get_client().get(url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return get_client().post(url, **kwargs)
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import cache
+import singleflight
+import upstream
+
+logger = logging.getLogger()
+
+# get temp token from https://openweathermap.org/
+API_KEY = os.environ.get("WEATHER_TOKEN", "")
+# city name to OpenWeatherMap id index and per-chat city lists
+DB_FILE = "/tmp/uds_weather.db"
+BASE_URL = "https://api.openweathermap.org/data/2.5/"
+# https://openweathermap.org/current#severalid, at most 20 ids per call
+GROUP_LIMIT = 20
+DEFAULT_CITIES = ["Ho Chi Minh", "Hanoi"]
+MAX_CHAT_CITIES = 10
+
+
+class UnknownCityError(Exception):
+    """OpenWeatherMap has no city of this name."""
+
+
+def parse_weather(data: dict) -> dict:
+    return {
+        "id": data["id"],
+        "name": data["name"],
+        "temp_now": round(data["main"]["temp"] - 273.15),
+        "feels_like": round(data["main"]["feels_like"] - 273.15),
+        "humidity": data["main"]["humidity"],
+        "weather": data["weather"][0]["description"],
+    }
+
+
+def parse_cities(text: str) -> list[str]:
+    """Comma separated city names, blanks and duplicates dropped."""
+    cities: list[str] = []
+    for name in text.split(","):
+        name = " ".join(name.split())
+        if name and cache.keyword_key(name) not in map(cache.keyword_key, cities):
+            cities.append(name)
+    return cities
+
+
+class WeatherService:
+    """Weather of many cities in one OpenWeatherMap call.
+
+    City names are resolved to OpenWeatherMap ids once, the index is kept in
+    SQLite. Weather is cached per city, cities missing from the cache are
+    fetched together with the group-by-id endpoint.
+    """
+
+    def __init__(self, api_key: str, db_file: str) -> None:
+        self.api_key = api_key
+        self.db_file = db_file
+        self.flights = singleflight.Group()
+        self.init_db()
+
+    def init_db(self):
+        """Initialize the SQLite database."""
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS city_ids (
+                name TEXT PRIMARY KEY,
+                city_id INTEGER
+            )
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_cities (
+                chat_id INTEGER PRIMARY KEY,
+                cities TEXT
+            )
+            """)
+
+    def _fetch(self, endpoint: str, **params) -> dict:
+        resp = upstream.get(
+            BASE_URL + endpoint, params=dict(params, appid=self.api_key)
+        )
+        if resp.status_code == 404:
+            raise UnknownCityError(params.get("q"))
+        resp.raise_for_status()
+        return resp.json()
+
+    def city_id(self, name: str) -> int:
+        """The OpenWeatherMap id of a city, looked up once per name."""
+        key = cache.keyword_key(name)
+        with sqlite3.connect(self.db_file) as conn:
+            row = conn.execute(
+                "SELECT city_id FROM city_ids WHERE name = ?", (key,)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+
+        # the by-name lookup returns the weather too, it warms the cache
+        temp = parse_weather(self._fetch("weather", q=name))
+        cache.get_cache().store("weather", f"city:{temp['id']}", temp)
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO city_ids (name, city_id) VALUES (?, ?)",
+                (key, temp["id"]),
+            )
+        logger.info("Weather: resolved city %s to id %s", name, temp["id"])
+        return temp["id"]
+
+    def _fetch_group(self, city_ids: list[int]) -> dict[int, dict]:
+        temps = {}
+        for i in range(0, len(city_ids), GROUP_LIMIT):
+            chunk = city_ids[i : i + GROUP_LIMIT]
+            data = self._fetch("group", id=",".join(map(str, chunk)))
+            for item in data["list"]:
+                temp = parse_weather(item)
+                temps[temp["id"]] = temp
+        return temps
+
+    def get_weather(self, cities: list[str]) -> tuple[list[dict], list[str]]:
+        """Weather of `cities` in order, and the names that are not cities."""
+        # resolved inline: callers such as /hi already run this in a fan_out,
+        # nested tasks on its executor could wait behind their own parents
+        unknown = []
+        city_ids = []
+        for name in cities:
+            try:
+                city_ids.append(self.city_id(name))
+            except UnknownCityError:
+                unknown.append(name)
+            except Exception as e:
+                logger.warning("Weather: resolving %s failed (%r)", name, e)
+
+        ttl = cache.SOURCE_TTLS["weather"]
+        store = cache.get_cache()
+        entries = {cid: store.peek("weather", f"city:{cid}") for cid in city_ids}
+        missing = [
+            cid for cid, entry in entries.items() if entry is None or entry.age() >= ttl
+        ]
+        if missing:
+            missing.sort()
+            try:
+                # /hi and /tem asking for the same cities share one call
+                fetched, _shared = self.flights.do(
+                    ",".join(map(str, missing)), lambda: self._fetch_group(missing)
+                )
+                for cid, temp in fetched.items():
+                    entries[cid] = store.store("weather", f"city:{cid}", temp)
+            except Exception:
+                # stale weather beats none, as long as there is some
+                if not any(
+                    e is not None and e.age() < cache.MAX_STALE
+                    for e in entries.values()
+                ):
+                    raise
+                logger.exception("Weather: group fetch failed, serving stale")
+
+        temps = [
+            entry.value
+            for entry in (entries[cid] for cid in dict.fromkeys(city_ids))
+            if entry is not None and entry.age() < cache.MAX_STALE
+        ]
+        return temps, unknown
+
+    def chat_cities(self, chat_id: int) -> list[str]:
+        with sqlite3.connect(self.db_file) as conn:
+            row = conn.execute(
+                "SELECT cities FROM chat_cities WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else list(DEFAULT_CITIES)
+
+    def set_chat_cities(self, chat_id: int, cities: list[str]) -> None:
+        with sqlite3.connect(self.db_file) as conn:
+            if cities:
+                conn.execute(
+                    "INSERT OR REPLACE INTO chat_cities (chat_id, cities) VALUES (?, ?)",
+                    (chat_id, json.dumps(cities[:MAX_CHAT_CITIES])),
+                )
+            else:
+                conn.execute("DELETE FROM chat_cities WHERE chat_id = ?", (chat_id,))
+
+
+_service: WeatherService | None = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> WeatherService:
+    """The process wide weather service, created on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = WeatherService(API_KEY, DB_FILE)
+        return _service
+
+
+def format_temp(temp: dict) -> str:
+    return f"Weather in {temp['name']} is {temp['weather']}, temp now: {temp['temp_now']}, feels like: {temp['feels_like']}, humidity:  {temp['humidity']}%"
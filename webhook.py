@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+import cache
+import outbox
+
+logger = logging.getLogger()
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# an update is a few KB, larger bodies are refused before reading them
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class LatencyStats:
+    """Keeps the last `size` latencies, in seconds."""
+
+    def __init__(self, size: int = 1000) -> None:
+        self.lock = threading.Lock()
+        self.samples: deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def summary(self) -> dict:
+        with self.lock:
+            samples = sorted(self.samples)
+            count = self.count
+        if not samples:
+            return {"count": count}
+        return {
+            "count": count,
+            "p50": samples[len(samples) // 2],
+            "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            "max": samples[-1],
+        }
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    server: "WebhookServer"
+
+    def do_POST(self) -> None:
+        if self.path != self.server.path:
+            self.send_error(404)
+            return
+        secret = self.server.secret_token
+        if secret and self.headers.get(SECRET_TOKEN_HEADER) != secret:
+            self.send_error(403)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.send_error(400, "Missing or malformed Content-Length")
+            return
+        if length <= 0:
+            self.send_error(400, "Empty body")
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_error(413)
+            return
+        try:
+            update = json.loads(self.rfile.read(length))
+            update_id = update["update_id"]
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+
+        self.server.received_at[update_id] = time.monotonic()
+        try:
+            self.server.on_update(update)
+        except Exception:
+            logger.exception("Failed to accept update %s", update_id)
+            self.server.received_at.pop(update_id, None)
+            # Telegram retries the delivery on a non 2xx answer
+            self.send_error(500)
+            return
+        self._reply(200, {"ok": True})
+
+    def do_GET(self) -> None:
+        if self.path != "/stats":
+            self.send_error(404)
+            return
+        stats: dict = {"handler_latency": self.server.handler_latency.summary()}
+        box = outbox.get_outbox()
+        if box is not None:
+            # replies wait in the outbox after the handler, until sent
+            box_stats = box.stats()
+            stats["avg_queue_delay"] = box_stats["avg_queue_delay"]
+            stats["outbox"] = box_stats
+        stats["cache"] = cache.get_cache().stats()
+        self._reply(200, stats)
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("webhook: " + format, *args)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """Accepts Telegram update POSTs and passes each one to `on_update`.
+
+    `on_update` should only queue the update, it is handled later by the
+    handler wrapped with `track`, which records the time from the request to
+    the end of the handler. Replies are then queued in the outbox, so GET
+    /stats returns this handler latency next to the outbox's queue delay.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        on_update: Callable[[dict], None],
+        secret_token: str | None = None,
+        path: str = "/",
+    ) -> None:
+        super().__init__(address, WebhookRequestHandler)
+        self.on_update = on_update
+        self.secret_token = secret_token
+        self.path = path
+        self.received_at: dict[int, float] = {}
+        self.handler_latency = LatencyStats()
+
+    def track(self, handler: Callable[[dict], None]) -> Callable[[dict], None]:
+        """Wraps an update handler to record the request-to-handled latency."""
+
+        def tracked(update: dict) -> None:
+            try:
+                handler(update)
+            finally:
+                started = self.received_at.pop(update["update_id"], None)
+                if started is not None:
+                    elapsed = time.monotonic() - started
+                    self.handler_latency.observe(elapsed)
+                    logger.info(
+                        "Update %s handled in %.3fs", update["update_id"], elapsed
+                    )
+
+        return tracked